@@ -0,0 +1,188 @@
+"""
+Feed de alertas de estoque baixo (GET /alerts/<id>/stream, Server-Sent Events).
+
+Os alertas são gerados no banco (migração 009): o trigger de produto avalia só as linhas
+alteradas por cada comando e cada evento novo chega por NOTIFY no canal alerta_estoque,
+já com os dados do alerta. Cada processo mantém uma única conexão em LISTEN, iniciada no
+primeiro assinante, e repassa os eventos aos assinantes da empresa do evento. O custo não
+depende do número de empresas nem de assinantes: nenhuma consulta por evento ou por cliente.
+
+Os eventos antigos são apagados por uma etapa periódica própria (AlertRetention), iniciada
+por cada processo do servidor; só um deles apaga por vez.
+"""
+import json
+import os
+import select
+import threading
+
+import psycopg2
+
+import db_config
+import db_operations
+import logs
+
+log = logs.get_logger(__name__)
+
+NOTIFY_CHANNEL = 'alerta_estoque'
+# Conexões de feed abertas ao mesmo tempo por processo (cada uma ocupa uma thread no Flask)
+ALERTS_STREAM_MAX = int(os.environ.get('ALERTS_STREAM_MAX', '100'))
+# Intervalo (s) dos comentários que mantêm a conexão aberta em proxies
+ALERTS_KEEPALIVE = float(os.environ.get('ALERTS_KEEPALIVE', '15'))
+# Eventos aguardando envio por assinante; acima disso os mais novos são descartados
+ALERTS_QUEUE_SIZE = int(os.environ.get('ALERTS_QUEUE_SIZE', '1000'))
+# Eventos (alerta_estoque) são apagados depois desse tempo (h); 0 = nunca
+ALERTS_RETENTION_HOURS = float(os.environ.get('ALERTS_RETENTION_HOURS', '168'))
+# Intervalo (s) entre as limpezas dos eventos antigos
+ALERTS_PURGE_INTERVAL = float(os.environ.get('ALERTS_PURGE_INTERVAL', '3600'))
+
+
+def company_key(company_id):
+    """Chave da empresa usada no repasse (ids do evento são inteiros, os da URL são texto)"""
+    try:
+        return str(int(company_id))
+    except (ValueError, TypeError):
+        return str(company_id)
+
+
+def format_event(event):
+    """Evento no formato text/event-stream (o id permite retomar com Last-Event-ID)"""
+    return f"id: {event['id']}\nevent: alerta\ndata: {json.dumps(event)}\n\n"
+
+
+class AlertHub:
+    """Conexão em LISTEN do processo e assinantes por empresa"""
+
+    def __init__(self, max_subscribers=ALERTS_STREAM_MAX):
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._count = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._delivered = 0
+
+    def subscribe(self, company_id, deliver):
+        """
+        Registra `deliver(evento)` para os alertas da empresa; ele é chamado na thread do
+        ouvinte e não deve bloquear. Retorna a função que cancela a assinatura, ou None se
+        o limite de assinantes do processo foi atingido.
+        """
+        key = company_key(company_id)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            self._subscribers.setdefault(key, set()).add(deliver)
+            self._count += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='alertas', daemon=True)
+                self._thread.start()
+
+        def unsubscribe():
+            with self._lock:
+                subscribers = self._subscribers.get(key)
+                if subscribers and deliver in subscribers:
+                    subscribers.discard(deliver)
+                    self._count -= 1
+                    if not subscribers:
+                        del self._subscribers[key]
+        return unsubscribe
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': self._count,
+                'companies': len(self._subscribers),
+                'delivered': self._delivered,
+                'listening': self._thread is not None and self._thread.is_alive(),
+            }
+
+    def _dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            log.warning("Alerta com conteúdo inválido ignorado", payload=payload[:200])
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(company_key(event.get('company_id')), ()))
+            self._delivered += len(subscribers)
+        for deliver in subscribers:
+            try:
+                deliver(event)
+            except Exception as e:
+                log.error("Erro ao repassar alerta", error=str(e))
+
+    def _listen(self):
+        conn = psycopg2.connect(**db_config.DB_CONFIG)
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        cur.close()
+        return conn
+
+    def _run(self):
+        """Recebe os NOTIFY até stop(); reconecta com espera crescente se a conexão cair"""
+        conn = None
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    conn = self._listen()
+                    backoff = 1.0
+                    log.info("Ouvindo alertas de estoque", channel=NOTIFY_CHANNEL)
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+            except (psycopg2.Error, OSError) as e:
+                log.error("Conexão de alertas perdida", error=str(e), retry_seconds=backoff)
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+        if conn is not None:
+            conn.close()
+
+
+class AlertRetention:
+    """Apaga periodicamente os eventos fora da retenção, em uma thread do processo"""
+
+    def __init__(self, retention_hours=ALERTS_RETENTION_HOURS, interval=ALERTS_PURGE_INTERVAL):
+        self.retention_hours = retention_hours
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.retention_hours <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='alertas-retencao', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def purge(self):
+        """Uma limpeza; retorna o número de eventos apagados (None em caso de erro)"""
+        deleted = db_operations.purge_alert_events(self.retention_hours)
+        if deleted:
+            log.info("Eventos de estoque baixo expirados apagados", count=deleted)
+        return deleted
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.purge()
+            self._stop.wait(self.interval)
+
+
+hub = AlertHub()
+retention = AlertRetention()
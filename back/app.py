@@ -1,11 +1,177 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
+import alerts
+import atexit
+import base64
+import cache
+import csv
+import datetime
+import functools
+import hashlib
+import itertools
+import jobs
+import json
+import logs
+import metrics
+import os
+import passwords
+import queue
+import rate_limit
 import re
+import tempfile
+import time
 import db_config
 import db_operations
+import product_export
+import product_import
+import schema_cache
+import session_tokens
 
 app = Flask(__name__)
-CORS(app)  
+CORS(app, expose_headers=['ETag'])
+
+log = logs.get_logger(__name__)
+
+# Listagem paginada de produtos: tamanho padrão e máximo de página
+PRODUCTS_PAGE_DEFAULT = 50
+PRODUCTS_PAGE_MAX = 500
+PAGINATION_ARGS = ('limit', 'cursor', 'after_id', 'sort', 'order')
+
+# Considerar X-Forwarded-For como IP do cliente (apenas atrás de um proxy reverso)
+TRUST_PROXY = os.environ.get('TRUST_PROXY', '0') == '1'
+
+# Ajustes de estoque em lote: máximo de itens por requisição e modo padrão
+# (atomic = tudo ou nada, best_effort = aplica os válidos)
+ADJUSTMENTS_MAX_ITEMS = int(os.environ.get('ADJUSTMENTS_MAX_ITEMS', '1000'))
+ADJUSTMENTS_MODES = ('atomic', 'best_effort')
+ADJUSTMENTS_DEFAULT_MODE = os.environ.get('ADJUSTMENTS_DEFAULT_MODE', 'atomic')
+if ADJUSTMENTS_DEFAULT_MODE not in ADJUSTMENTS_MODES:
+    # Falha na importação: um valor inválido recusaria toda requisição que não informa o modo
+    raise ValueError(
+        f"ADJUSTMENTS_DEFAULT_MODE inválido: {ADJUSTMENTS_DEFAULT_MODE!r} "
+        f"(use {' ou '.join(ADJUSTMENTS_MODES)})"
+    )
+
+# Empresas por chefe e tamanho máximo do nome (coluna empresa_chefe.nome)
+COMPANIES_MAX = int(os.environ.get('COMPANIES_MAX', '3'))
+COMPANY_NAME_MAX_LENGTH = 50
+
+# Importação em lote: máximo de erros detalhados na resposta e tamanho do buffer em memória
+BULK_IMPORT_MAX_ERRORS = 1000
+BULK_IMPORT_SPOOL_SIZE = 8 * 1024 * 1024
+# Importações maiores que isso (bytes) viram tarefa em segundo plano (202); ?async=1 força
+BULK_IMPORT_ASYNC_BYTES = int(os.environ.get('BULK_IMPORT_ASYNC_BYTES', str(5 * 1024 * 1024)))
+
+@app.before_request
+def start_request_metrics():
+    metrics.start_request()
+
+@app.after_request
+def record_request_metrics(response):
+    """Duração, tempo de banco e número de consultas de cada requisição, por rota"""
+    stats = metrics.current_request()
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats.started
+    route = request.url_rule.rule if request.url_rule else 'desconhecida'
+    status = str(response.status_code)
+    metrics.http_requests.inc(request.method, route, status)
+    metrics.http_duration.observe(elapsed, request.method, route, status)
+    metrics.http_db_time.observe(stats.db_time, route)
+    metrics.http_queries.observe(stats.queries, route)
+    log.debug(
+        "Requisição atendida",
+        method=request.method,
+        route=route,
+        status=response.status_code,
+        duration_ms=round(elapsed * 1000, 2),
+        db_ms=round(stats.db_time * 1000, 2),
+        queries=stats.queries,
+        pool_wait_ms=round(stats.pool_wait * 1000, 2)
+    )
+    if metrics.over_budget(stats):
+        log.warning(
+            "Requisição acima do orçamento de consultas",
+            method=request.method,
+            route=route,
+            queries=stats.queries,
+            budget=metrics.QUERY_BUDGET,
+            statements=stats.statements
+        )
+    return response
+
+@app.teardown_request
+def end_request_metrics(_exc):
+    metrics.end_request()
+
+def bearer_token(query_token=False):
+    """
+    Token enviado no cabeçalho Authorization: Bearer <token>. Com `query_token`, também
+    aceita ?access_token= (EventSource do navegador não envia cabeçalhos).
+    """
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):].strip()
+    if query_token:
+        return request.args.get('access_token')
+    return None
+
+def require_auth(roles=None, query_token=False):
+    """
+    Exige um token de sessão válido com acesso à empresa da URL (verificação só em memória).
+    Os dados do token ficam em g.auth.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(company_id, *args, **kwargs):
+            claims = session_tokens.verify_token(bearer_token(query_token))
+            if claims is None:
+                return jsonify({"message": "Sessão inválida ou expirada"}), 401
+            if roles and claims.get('role') not in roles:
+                return jsonify({"message": "Acesso não permitido para este usuário"}), 403
+            if not session_tokens.can_access_company(claims, company_id):
+                return jsonify({"message": "Acesso não permitido a esta empresa"}), 403
+            g.auth = claims
+            return view(company_id, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def listing_etag(namespace, company_id, query_string, version):
+    """ETag da listagem: versão dos dados da empresa no banco + parâmetros da consulta"""
+    params = hashlib.sha1(f"{company_id}?".encode() + query_string).hexdigest()[:12]
+    return f"{namespace}-{version}-{params}"
+
+def conditional_listing(namespace):
+    """
+    Respostas condicionais para listagens por empresa: a ETag vem da versão dos dados
+    da empresa mantida no banco (muda a cada escrita, de qualquer processo) e dos
+    parâmetros da consulta. Um If-None-Match igual é respondido com 304 após uma única
+    leitura por chave primária, ou nenhuma se o processo leu a versão há menos de
+    cache.CACHE_VERSION_TTL segundos.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(company_id, *args, **kwargs):
+            version = db_operations.get_current_data_version(namespace, company_id)
+            # A view exige a mesma versão das entradas do cache (sem uma segunda leitura)
+            g.data_version = version
+            if version is None:
+                # Sem versão não há como validar: responde normalmente, sem ETag
+                return view(company_id, *args, **kwargs)
+            etag = listing_etag(namespace, company_id, request.query_string, version)
+
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(view(company_id, *args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Permite guardar a resposta, mas exige revalidação a cada uso
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
 
 def validate_cpf(cpf):
     cpf_numbers = re.sub(r'\D', '', cpf)
@@ -29,6 +195,308 @@ def validate_password(password):
     
     return True, "Senha válida"
 
+def encode_cursor(data):
+    """Serializa a posição de paginação em um token opaco (base64 url-safe)"""
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def decode_cursor(token):
+    """Inverso de encode_cursor; retorna None se o token for inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else None
+    except (ValueError, TypeError):
+        return None
+
+def parse_page_args(args):
+    """
+    Lê limit, sort, order, cursor e after_id da query string da listagem de produtos.
+    Retorna (parâmetros, None) ou (None, mensagem de erro).
+    """
+    try:
+        limit = int(args.get('limit', PRODUCTS_PAGE_DEFAULT))
+    except ValueError:
+        return None, "limit deve ser um número inteiro"
+    if limit < 1 or limit > PRODUCTS_PAGE_MAX:
+        return None, f"limit deve estar entre 1 e {PRODUCTS_PAGE_MAX}"
+    
+    sort = args.get('sort', 'id')
+    order = args.get('order', 'asc').lower()
+    after = None
+    
+    if 'cursor' in args:
+        # O cursor carrega a ordenação da página em que foi gerado
+        cursor = decode_cursor(args['cursor'])
+        if not cursor or 'id' not in cursor:
+            return None, "cursor inválido"
+        sort = cursor.get('sort', 'id')
+        order = cursor.get('order', 'asc')
+        after = (cursor.get('value'), cursor['id'])
+    elif 'after_id' in args:
+        if sort != 'id':
+            return None, "after_id só pode ser usado com sort=id; use cursor para outras ordenações"
+        try:
+            after = (None, int(args['after_id']))
+        except ValueError:
+            return None, "after_id deve ser um número inteiro"
+    
+    if sort not in db_operations.PRODUCT_SORT_COLUMNS:
+        return None, f"sort deve ser um de: {', '.join(db_operations.PRODUCT_SORT_COLUMNS)}"
+    if order not in ('asc', 'desc'):
+        return None, "order deve ser asc ou desc"
+    
+    return {"limit": limit, "sort": sort, "order": order, "after": after}, None
+
+def parse_search_args(args):
+    """
+    Lê q, mode, limit e offset da query string da busca de produtos.
+    Retorna (parâmetros, None) ou (None, mensagem de erro).
+    """
+    term = args.get('q', '').strip()
+    mode = args.get('mode', 'substring')
+    
+    if not term:
+        return None, "Informe o termo de busca (q)"
+    
+    if len(term) > 100:
+        return None, "Termo de busca deve ter no máximo 100 caracteres"
+    
+    if mode not in db_operations.PRODUCT_SEARCH_MODES:
+        return None, f"mode deve ser um de: {', '.join(db_operations.PRODUCT_SEARCH_MODES)}"
+    
+    try:
+        limit = int(args.get('limit', PRODUCTS_PAGE_DEFAULT))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        return None, "limit e offset devem ser números inteiros"
+    
+    if limit < 1 or limit > PRODUCTS_PAGE_MAX:
+        return None, f"limit deve estar entre 1 e {PRODUCTS_PAGE_MAX}"
+    
+    if offset < 0:
+        return None, "offset deve ser maior ou igual a zero"
+    
+    return {"q": term, "mode": mode, "limit": limit, "offset": offset}, None
+
+def parse_movement_data(data):
+    """
+    Valida tipo, quantidade e motivo de uma movimentação de estoque.
+    Entradas e saídas levam quantidade positiva; ajustes, um valor com sinal e motivo.
+    Retorna ((tipo, quantidade, motivo), None) ou (None, mensagem de erro).
+    """
+    kind = data.get('type')
+    if kind not in db_operations.MOVEMENT_TYPES:
+        return None, f"type deve ser um de: {', '.join(db_operations.MOVEMENT_TYPES)}"
+    
+    quantity = data.get('quantity')
+    if isinstance(quantity, bool) or not isinstance(quantity, int):
+        return None, "Quantidade deve ser um número inteiro"
+    if kind == 'ajuste':
+        if quantity == 0:
+            return None, "Quantidade do ajuste deve ser diferente de zero"
+    elif quantity <= 0:
+        return None, "Quantidade deve ser maior que zero"
+    
+    reason = data.get('reason')
+    reason = reason.strip() if isinstance(reason, str) else ''
+    if kind == 'ajuste' and not reason:
+        return None, "Informe o motivo (reason) do ajuste"
+    if len(reason) > db_operations.MOVEMENT_REASON_MAX_LENGTH:
+        return None, f"Motivo deve ter no máximo {db_operations.MOVEMENT_REASON_MAX_LENGTH} caracteres"
+    
+    return (kind, quantity, reason or None), None
+
+def parse_adjustments(data):
+    """
+    Valida o corpo de POST /products/<company_id>/adjustments.
+    Cada item traz product_id e exatamente um entre delta (somado) e absolute (novo saldo).
+    Retorna ({"items": [(id, delta, absoluto)], "mode", "reason"}, None) ou (None, mensagem de erro).
+    """
+    items = data.get('adjustments')
+    if not isinstance(items, list) or not items:
+        return None, "Informe a lista de ajustes (adjustments)"
+    if len(items) > ADJUSTMENTS_MAX_ITEMS:
+        return None, f"Máximo de {ADJUSTMENTS_MAX_ITEMS} ajustes por requisição"
+    
+    mode = data.get('mode', ADJUSTMENTS_DEFAULT_MODE)
+    if mode not in ADJUSTMENTS_MODES:
+        return None, f"mode deve ser um de: {', '.join(ADJUSTMENTS_MODES)}"
+    
+    reason = data.get('reason')
+    reason = reason.strip() if isinstance(reason, str) else ''
+    if len(reason) > db_operations.MOVEMENT_REASON_MAX_LENGTH:
+        return None, f"Motivo deve ter no máximo {db_operations.MOVEMENT_REASON_MAX_LENGTH} caracteres"
+    
+    parsed = []
+    seen = set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return None, f"Ajuste {index}: formato inválido"
+        try:
+            product_id = int(item.get('product_id'))
+        except (ValueError, TypeError):
+            return None, f"Ajuste {index}: product_id inválido"
+        if product_id in seen:
+            return None, f"Ajuste {index}: produto {product_id} repetido no lote"
+        seen.add(product_id)
+        
+        delta = item.get('delta')
+        absolute = item.get('absolute')
+        if (delta is None) == (absolute is None):
+            return None, f"Ajuste {index}: informe delta ou absolute (apenas um)"
+        value = delta if absolute is None else absolute
+        if isinstance(value, bool) or not isinstance(value, int):
+            return None, f"Ajuste {index}: delta/absolute deve ser um número inteiro"
+        if absolute is not None and absolute < 0:
+            return None, f"Ajuste {index}: absolute deve ser maior ou igual a zero"
+        parsed.append((product_id, delta, absolute))
+    
+    return {"items": parsed, "mode": mode, "reason": reason or 'ajuste em lote'}, None
+
+def parse_history_args(args):
+    """
+    Lê limit, cursor e since da query string do histórico de movimentações.
+    Retorna (parâmetros, None) ou (None, mensagem de erro).
+    """
+    try:
+        limit = int(args.get('limit', PRODUCTS_PAGE_DEFAULT))
+    except ValueError:
+        return None, "limit deve ser um número inteiro"
+    if limit < 1 or limit > PRODUCTS_PAGE_MAX:
+        return None, f"limit deve estar entre 1 e {PRODUCTS_PAGE_MAX}"
+    
+    before = None
+    if 'cursor' in args:
+        cursor = decode_cursor(args['cursor'])
+        if not cursor or 'id' not in cursor or 'created_at' not in cursor:
+            return None, "cursor inválido"
+        before = (cursor['created_at'], cursor['id'])
+    
+    since = None
+    if 'since' in args:
+        try:
+            since = datetime.datetime.fromisoformat(args['since'])
+        except ValueError:
+            return None, "since deve ser uma data no formato ISO (ex.: 2024-01-31 ou 2024-01-31T08:00:00)"
+    
+    return {"limit": limit, "before": before, "since": since}, None
+
+def product_etag(product):
+    """ETag de um produto: muda a cada alteração da linha (coluna versao)"""
+    return f"v{product['version']}"
+
+def parse_expected_version(data):
+    """
+    Versão esperada do produto para a edição, vinda de If-Match ("v<versão>", como na ETag)
+    ou do campo "version" do corpo. Sem nenhum dos dois a edição é incondicional.
+    Retorna (versão ou None, None) ou (None, mensagem de erro).
+    """
+    if request.if_match:
+        if request.if_match.star_tag:
+            return None, None
+        tags = request.if_match.as_set()
+        if len(tags) != 1:
+            return None, "If-Match deve conter uma única versão do produto"
+        tag = tags.pop()
+        if not (tag.startswith('v') and tag[1:].isdigit()):
+            return None, "If-Match inválido; use a ETag devolvida pelo produto"
+        return int(tag[1:]), None
+    
+    version = data.get('version')
+    if version is None:
+        return None, None
+    if isinstance(version, bool) or not isinstance(version, int):
+        return None, "version deve ser um número inteiro"
+    return version, None
+
+def parse_minimum(data):
+    """
+    Estoque mínimo opcional do produto (campo "minimum"); abaixo dele o produto gera alerta.
+    Retorna (mínimo ou None, None) ou (None, mensagem de erro).
+    """
+    minimum = data.get('minimum')
+    if minimum is None:
+        return None, None
+    try:
+        minimum = int(minimum)
+    except (ValueError, TypeError):
+        return None, "Estoque mínimo deve ser um número válido"
+    if minimum < 0:
+        return None, "Estoque mínimo deve ser maior ou igual a zero"
+    return minimum, None
+
+def parse_company_name(data):
+    """Nome da empresa (campo "name"). Retorna (nome, None) ou (None, mensagem de erro)"""
+    name = data.get('name')
+    if not isinstance(name, str) or not name.strip():
+        return None, "Nome da empresa não pode estar vazio"
+    name = name.strip()
+    if len(name) > COMPANY_NAME_MAX_LENGTH:
+        return None, f"Nome da empresa deve ter no máximo {COMPANY_NAME_MAX_LENGTH} caracteres"
+    return name, None
+
+def parse_last_event_id(value):
+    """Id do último alerta recebido (cabeçalho Last-Event-ID) ou None"""
+    try:
+        last_event_id = int(value)
+    except (ValueError, TypeError):
+        return None
+    return last_event_id if last_event_id >= 0 else None
+
+def validate_product_data(data):
+    """
+    Valida nome, quantidade e valor de um produto novo.
+    Retorna ((nome, quantidade, valor), None) ou (None, mensagem de erro).
+    """
+    name = data.get('name', '')
+    name = name.strip() if isinstance(name, str) else ''
+    
+    if not name:
+        return None, "Nome do produto é obrigatório"
+    
+    if len(name) > 100:
+        return None, "Nome do produto deve ter no máximo 100 caracteres"
+    
+    try:
+        quantity = int(data.get('quantity', 0))
+        if quantity < 0:
+            return None, "Quantidade deve ser maior ou igual a zero"
+    except (ValueError, TypeError):
+        return None, "Quantidade deve ser um número válido"
+    
+    try:
+        value = float(data.get('value', 0.0))
+        if value < 0:
+            return None, "Valor deve ser maior ou igual a zero"
+    except (ValueError, TypeError):
+        return None, "Valor deve ser um número válido"
+    
+    return (name, quantity, value), None
+
+def client_ip():
+    """IP do cliente (o primeiro de X-Forwarded-For quando atrás de um proxy confiável)"""
+    if TRUST_PROXY:
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.remote_addr
+
+def hashing_busy_response():
+    """503 quando a fila de hash de senhas está cheia (o cliente deve tentar de novo)"""
+    response = jsonify({"message": "Servidor ocupado, tente novamente em instantes"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def rehash_password(user, password):
+    """Regrava no formato atual um hash legado (ou com custo antigo) após login correto"""
+    try:
+        new_hash = passwords.hash_password(password)
+    except passwords.HashingBusyError:
+        return  # Fica para o próximo login
+    if db_operations.update_user_password_hash(user['cpf'], user['password_hash'], new_hash):
+        log.info("Hash da senha atualizado para o formato atual", cpf=user['cpf'])
+
 @app.route('/login', methods=['POST'])
 def login():
     try:
@@ -52,43 +520,55 @@ def login():
         
         cpf_numbers = re.sub(r'\D', '', cpf)
         
-        print(f"🔍 Tentativa de login - CPF: {cpf_numbers}")
+        # Limite de tentativas antes de qualquer consulta ao banco ou cálculo de hash
+        retry_after = rate_limit.check_login(cpf_numbers, client_ip())
+        if retry_after is not None:
+            log.warning("Login bloqueado temporariamente", cpf=cpf_numbers, retry_after=retry_after)
+            response = jsonify({"message": "Muitas tentativas de login. Tente novamente mais tarde."})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+        
+        log.debug("Tentativa de login", cpf=cpf_numbers)
         
         
         user = db_operations.get_user_by_cpf(cpf_numbers)
         
         if user:
-            print(f"✅ Usuário encontrado: {user.get('nome', 'N/A')}")
-            print(f"   Tipo: {user.get('tipo_acesso', 'N/A')}, ID Empresa: {user.get('id_empresa', 'N/A')}")
-            
-            password_hash = db_operations.hash_password(password)
             hash_banco = user['password_hash']
+            password_ok, needs_rehash = passwords.verify_password(password, hash_banco)
             
-            print(f"   Hash calculado: {password_hash[:20]}...")
-            print(f"   Hash no banco: {hash_banco[:20]}...")
-            
-            if hash_banco == password_hash:
-                print("✅ Senha correta!")
+            if password_ok:
+                rate_limit.reset_login(cpf_numbers)
+                if needs_rehash:
+                    rehash_password(user, password)
                 
                 tipo_acesso = user.get('tipo_acesso', '').lower() if user.get('tipo_acesso') else ''
                 id_empresa = user.get('id_empresa')
                 
                 if tipo_acesso == 'chefe' or (not tipo_acesso and id_empresa is None):
                     
+                    companies = user.get('companies', [])
                     user_data = {
                         'cpf': user['cpf'],
                         'name': user['nome'],
-                        'user_type': 'chefe'
+                        'user_type': 'chefe',
+                        'companies': companies
                     }
-                    print("✅ Login realizado como CHEFE")
+                    log.info("Login realizado", cpf=user['cpf'], user_type='chefe')
+                    # O token só dá acesso às empresas registradas para este chefe
+                    token, expires_at = session_tokens.issue_token(
+                        user['cpf'], 'chefe', companies=[c['id'] for c in companies]
+                    )
                     return jsonify({
                         "message": "Login realizado com sucesso",
-                        "user": user_data
+                        "user": user_data,
+                        "token": token,
+                        "expires_at": expires_at
                     }), 200
                 elif tipo_acesso == 'funcionario' or id_empresa is not None:
                     
                     if id_empresa is None:
-                        print("❌ Funcionário sem empresa associada")
+                        log.warning("Funcionário sem empresa associada", cpf=user['cpf'])
                         return jsonify({"message": "Funcionário sem empresa associada"}), 401
                     
                     user_data = {
@@ -96,22 +576,37 @@ def login():
                         "company_id": str(id_empresa),
                         "user_type": "funcionario"
                     }
-                    print("✅ Login realizado como FUNCIONÁRIO")
+                    log.info("Login realizado", cpf=user['cpf'], user_type='funcionario', company_id=id_empresa)
+                    token, expires_at = session_tokens.issue_token(user['cpf'], 'funcionario', id_empresa)
                     return jsonify({
                         "message": "Login realizado com sucesso",
-                        "user": user_data
+                        "user": user_data,
+                        "token": token,
+                        "expires_at": expires_at
                     }), 200
             else:
-                print("❌ Senha incorreta!")
+                log.info("Login recusado: senha incorreta", cpf=cpf_numbers)
         else:
-            print(f"❌ Usuário não encontrado no banco para CPF: {cpf_numbers}")
+            # Mesmo custo de uma senha errada: o tempo de resposta não revela CPFs cadastrados
+            passwords.verify_dummy(password)
+            log.info("Login recusado: usuário não encontrado", cpf=cpf_numbers)
         
         
         return jsonify({"message": "CPF ou senha incorretos, tente novamente"}), 401
         
+    except passwords.HashingBusyError:
+        return hashing_busy_response()
     except Exception as e:
         return jsonify({"message": f"Erro interno do servidor: {str(e)}"}), 500
 
+@app.route('/logout', methods=['POST'])
+def logout():
+    """Revoga o token de sessão enviado (até a sua expiração)"""
+    claims = session_tokens.verify_token(bearer_token())
+    if claims is not None:
+        session_tokens.revoke(claims)
+    return jsonify({"message": "Sessão encerrada"}), 200
+
 @app.route('/register', methods=['POST'])
 def register():
     try:
@@ -152,11 +647,15 @@ def register():
         else:
             return jsonify({"message": "Erro ao cadastrar usuário. Verifique se o CPF já está cadastrado."}), 500
         
+    except passwords.HashingBusyError:
+        return hashing_busy_response()
     except Exception as e:
         return jsonify({"message": f"Erro interno do servidor: {str(e)}"}), 500
 
 
 @app.route('/employees/<company_id>', methods=['GET'])
+@require_auth(roles=('chefe',))
+@conditional_listing(db_operations.EMPLOYEE_CACHE_NAMESPACE)
 def get_employees(company_id):
     """Buscar todos os funcionários de uma empresa"""
     try:
@@ -166,6 +665,7 @@ def get_employees(company_id):
         return jsonify({"message": f"Erro interno: {str(e)}"}), 500
 
 @app.route('/employees/<company_id>', methods=['POST'])
+@require_auth(roles=('chefe',))
 def create_employee(company_id):
     """Criar novo funcionário"""
     try:
@@ -210,10 +710,13 @@ def create_employee(company_id):
         else:
             return jsonify({"message": "Erro ao cadastrar funcionário"}), 500
         
+    except passwords.HashingBusyError:
+        return hashing_busy_response()
     except Exception as e:
         return jsonify({"message": f"Erro interno: {str(e)}"}), 500
 
 @app.route('/employees/<company_id>/<employee_cpf>', methods=['DELETE'])
+@require_auth(roles=('chefe',))
 def delete_employee(company_id, employee_cpf):
     """Excluir funcionário"""
     try:
@@ -230,6 +733,57 @@ def delete_employee(company_id, employee_cpf):
     except Exception as e:
         return jsonify({"message": f"Erro interno: {str(e)}"}), 500
 
+@app.route('/companies', methods=['POST'])
+def create_company():
+    """
+    Cria uma empresa para o chefe autenticado. Retorna a empresa e um novo token com
+    todas as empresas dele (o anterior continua válido só para as que já tinha).
+    """
+    try:
+        claims = session_tokens.verify_token(bearer_token())
+        if claims is None:
+            return jsonify({"message": "Sessão inválida ou expirada"}), 401
+        if claims.get('role') != 'chefe':
+            return jsonify({"message": "Acesso não permitido para este usuário"}), 403
+
+        name, error = parse_company_name(request.get_json(silent=True) or {})
+        if error:
+            return jsonify({"message": error}), 400
+
+        # O limite é contado no banco (as empresas do token podem estar desatualizadas)
+        created, error = db_operations.create_company(claims['sub'], name, COMPANIES_MAX)
+        if error == 'limit':
+            return jsonify({"message": f"Máximo de {COMPANIES_MAX} empresas permitidas"}), 409
+        if error:
+            return jsonify({"message": "Erro ao criar empresa"}), 500
+        company, owned = created
+
+        token, expires_at = session_tokens.issue_token(claims['sub'], 'chefe', companies=owned)
+        log.info("Empresa criada", cpf=claims['sub'], company_id=company['id'])
+        return jsonify({
+            "message": "Empresa criada com sucesso",
+            "company": company,
+            "token": token,
+            "expires_at": expires_at
+        }), 201
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/companies/<company_id>', methods=['PUT'])
+@require_auth(roles=('chefe',))
+def rename_company(company_id):
+    """Renomeia uma empresa do chefe autenticado"""
+    try:
+        name, error = parse_company_name(request.get_json(silent=True) or {})
+        if error:
+            return jsonify({"message": error}), 400
+
+        if not db_operations.rename_company(g.auth['sub'], company_id, name):
+            return jsonify({"message": "Empresa não encontrada"}), 404
+        return jsonify({"id": int(company_id), "name": name}), 200
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
 @app.route('/company/<company_id>', methods=['GET'])
 def get_company_info(company_id):
     """Buscar informações de uma empresa"""
@@ -251,16 +805,208 @@ def get_company_info(company_id):
 
 
 @app.route('/products/<company_id>', methods=['GET'])
+@require_auth()
+@conditional_listing(db_operations.PRODUCT_CACHE_NAMESPACE)
 def get_products(company_id):
-    """Buscar todos os produtos de uma empresa"""
+    """
+    Buscar produtos de uma empresa.
+    Com limit/cursor/after_id/sort/order na query string a resposta é paginada por chave
+    e traz next_cursor; sem esses parâmetros retorna a lista completa.
+    """
+    try:
+        if not any(arg in request.args for arg in PAGINATION_ARGS):
+            products = db_operations.get_products_by_company(company_id, version=g.get('data_version'))
+            log.debug("Produtos listados", company_id=company_id, count=len(products))
+            return jsonify({"products": products}), 200
+        
+        page, error = parse_page_args(request.args)
+        if error:
+            return jsonify({"message": error}), 400
+        
+        products, next_after = db_operations.get_products_page(
+            company_id,
+            page['limit'],
+            sort=page['sort'],
+            descending=page['order'] == 'desc',
+            after=page['after']
+        )
+        
+        next_cursor = None
+        if next_after:
+            next_cursor = encode_cursor({
+                "sort": page['sort'],
+                "order": page['order'],
+                "value": next_after[0],
+                "id": next_after[1]
+            })
+        
+        return jsonify({
+            "products": products,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+            "limit": page['limit'],
+            "sort": page['sort'],
+            "order": page['order']
+        }), 200
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/products/<company_id>/export', methods=['GET'])
+@require_auth()
+@conditional_listing(db_operations.PRODUCT_CACHE_NAMESPACE)
+def export_products(company_id):
+    """
+    Exporta todos os produtos da empresa em fluxo (format=ndjson, json ou csv).
+    As linhas vêm de um cursor no servidor e são enviadas aos pedaços, com uso de memória
+    constante independentemente do tamanho do catálogo.
+    """
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in product_export.FORMATS:
+        return jsonify({"message": f"format deve ser um de: {', '.join(product_export.FORMATS)}"}), 400
+    encoder, mimetype, extension = product_export.FORMATS[export_format]
+    
+    try:
+        products = db_operations.iter_products_by_company(company_id)
+        # Abre o cursor antes de responder para que falhas iniciais virem 500
+        first = next(products, None)
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+    
+    rows = itertools.chain([first], products) if first is not None else iter(())
+    body = product_export.in_chunks(encoder(rows))
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=produtos-{company_id}.{extension}"}
+    )
+
+@app.route('/products/<company_id>/export', methods=['POST'])
+@require_auth()
+def export_products_job(company_id):
+    """Agenda a exportação como tarefa em segundo plano (arquivo baixado em /jobs/<id>/download)"""
     try:
-        products = db_operations.get_products_by_company(company_id)
-        print(f"📦 Buscando produtos da empresa {company_id}: {len(products)} produtos encontrados")
-        return jsonify({"products": products}), 200
+        data = request.get_json(silent=True) or {}
+        export_format = str(data.get('format', 'ndjson')).lower()
+        if export_format not in product_export.FORMATS:
+            return jsonify({"message": f"format deve ser um de: {', '.join(product_export.FORMATS)}"}), 400
+        
+        job_id = jobs.enqueue('exportacao_produtos', company_id, {"format": export_format}, user_cpf=g.auth['sub'])
+        return job_accepted(job_id)
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@jobs.task('exportacao_produtos')
+def export_products_to_file(ctx):
+    """Exportação executada por um trabalhador de tarefas, gravada em um arquivo em JOBS_DATA_DIR"""
+    export_format = ctx.params['format']
+    encoder, mimetype, extension = product_export.FORMATS[export_format]
+    stats = db_operations.get_inventory_stats(ctx.company_id) or {}
+    total = stats.get('total_products') or 0
+    
+    def counted(products):
+        for count, product in enumerate(products, start=1):
+            if total and count % 1000 == 0:
+                ctx.progress(count * 100 / total)
+            yield product
+    
+    filename = f"exportacao-{ctx.id}.{extension}"
+    with open(jobs.data_path(filename), 'wb') as f:
+        for chunk in product_export.in_chunks(encoder(counted(db_operations.iter_products_by_company(ctx.company_id)))):
+            f.write(chunk)
+    
+    return {
+        "file": filename,
+        "format": export_format,
+        "mimetype": mimetype,
+        "download_name": f"produtos-{ctx.company_id}.{extension}"
+    }
+
+def load_authorized_job(job_id):
+    """Tarefa visível para o token da requisição; retorna (tarefa, None) ou (None, resposta de erro)"""
+    claims = session_tokens.verify_token(bearer_token())
+    if claims is None:
+        return None, (jsonify({"message": "Sessão inválida ou expirada"}), 401)
+    job = jobs.get_job(job_id)
+    # Tarefas de outra empresa são tratadas como inexistentes
+    if job is None or not session_tokens.can_access_company(claims, job['company_id']):
+        return None, (jsonify({"message": "Tarefa não encontrada"}), 404)
+    return job, None
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Estado, progresso (0 a 100) e resultado de uma tarefa em segundo plano"""
+    try:
+        job, error = load_authorized_job(job_id)
+        if error:
+            return error
+        
+        result = job['result']
+        if job['status'] == 'concluida' and result and result.get('file'):
+            job['download_url'] = f"/jobs/{job['id']}/download"
+            job['result'] = {key: value for key, value in result.items() if key != 'file'}
+        
+        return jsonify({"job": job}), 200
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/jobs/<job_id>/download', methods=['GET'])
+def download_job_result(job_id):
+    """Arquivo gerado por uma tarefa concluída (ex.: exportação)"""
+    try:
+        job, error = load_authorized_job(job_id)
+        if error:
+            return error
+        
+        result = job['result'] or {}
+        if job['status'] != 'concluida' or not result.get('file'):
+            return jsonify({"message": "Tarefa sem arquivo disponível"}), 404
+        
+        path = jobs.data_path(result['file'])
+        if not os.path.exists(path):
+            return jsonify({"message": "Arquivo expirado"}), 410
+        
+        return send_file(path, mimetype=result.get('mimetype'), as_attachment=True,
+                         download_name=result.get('download_name'))
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/products/<company_id>/stats', methods=['GET'])
+@require_auth()
+def get_products_stats(company_id):
+    """Totais do estoque da empresa (produtos, quantidade, valor e estoque baixo)"""
+    try:
+        stats = db_operations.get_inventory_stats(company_id)
+        if stats is None:
+            return jsonify({"message": "Erro ao buscar estatísticas do estoque"}), 500
+        return jsonify({"stats": stats}), 200
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/products/<company_id>/search', methods=['GET'])
+@require_auth()
+def search_products(company_id):
+    """Buscar produtos pelo nome (q), com modo prefix, substring ou fuzzy"""
+    try:
+        search, error = parse_search_args(request.args)
+        if error:
+            return jsonify({"message": error}), 400
+        
+        products, has_more = db_operations.search_products(
+            company_id, search['q'], search['mode'], search['limit'], search['offset']
+        )
+        
+        return jsonify({
+            "products": products,
+            "query": search['q'],
+            "mode": search['mode'],
+            "has_more": has_more,
+            "next_offset": search['offset'] + search['limit'] if has_more else None
+        }), 200
     except Exception as e:
         return jsonify({"message": f"Erro interno: {str(e)}"}), 500
 
 @app.route('/products/<company_id>', methods=['POST'])
+@require_auth()
 def create_product(company_id):
     """Criar novo produto"""
     try:
@@ -269,75 +1015,160 @@ def create_product(company_id):
         if not data:
             return jsonify({"message": "Dados não fornecidos"}), 400
         
-        name = data.get('name', '').strip()
-        quantity = data.get('quantity', 0)
-        value = data.get('value', 0.0)
-        
+        values, error = validate_product_data(data)
+        if error:
+            return jsonify({"message": error}), 400
         
-        if not name:
-            return jsonify({"message": "Nome do produto é obrigatório"}), 400
+        name, quantity, value = values
         
-        if len(name) > 100:
-            return jsonify({"message": "Nome do produto deve ter no máximo 100 caracteres"}), 400
-        
-        
-        try:
-            quantity = int(quantity)
-            if quantity < 0:
-                return jsonify({"message": "Quantidade deve ser maior ou igual a zero"}), 400
-        except (ValueError, TypeError):
-            return jsonify({"message": "Quantidade deve ser um número válido"}), 400
+        minimum, error = parse_minimum(data)
+        if error:
+            return jsonify({"message": error}), 400
         
+        # Cria o produto ou soma a quantidade ao existente em um único comando atômico
+        product, created = db_operations.upsert_product(
+            company_id, name, quantity, value, user_cpf=g.auth['sub'], minimum=minimum
+        )
         
-        try:
-            value = float(value)
-            if value < 0:
-                return jsonify({"message": "Valor deve ser maior ou igual a zero"}), 400
-        except (ValueError, TypeError):
-            return jsonify({"message": "Valor deve ser um número válido"}), 400
+        if product is None:
+            return jsonify({"message": "Erro ao cadastrar produto"}), 500
         
+        if created:
+            log.info("Produto criado", company_id=company_id, name=name)
+            return jsonify({
+                "message": "Produto cadastrado com sucesso",
+                "product": product,
+                "updated": False
+            }), 201
         
-        existing_product = db_operations.get_product_by_name(company_id, name)
+        new_quantity = product['quantity']
+        old_quantity = new_quantity - quantity
+        log.info("Quantidade somada a produto existente", company_id=company_id, name=name, old_quantity=old_quantity, new_quantity=new_quantity)
+        return jsonify({
+            "message": f"Produto '{name}' já existe. Quantidade atualizada de {old_quantity} para {new_quantity}",
+            "product": product,
+            "updated": True
+        }), 200
         
-        if existing_product:
-            
-            old_quantity = existing_product['quantity']
-            new_quantity = old_quantity + quantity
-            
-            updated_product = db_operations.update_product_quantity(
-                company_id, 
-                existing_product['id'], 
-                new_quantity
-            )
-            
-            if updated_product:
-                print(f"🔄 Produto '{name}' já existe. Somando quantidade: {old_quantity} + {quantity} = {new_quantity}")
-                return jsonify({
-                    "message": f"Produto '{name}' já existe. Quantidade atualizada de {old_quantity} para {new_quantity}",
-                    "product": updated_product,
-                    "updated": True
-                }), 200
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+def run_bulk_import(company_id, stream, parser, user_cpf=None, progress=None):
+    """
+    Valida as linhas de `stream` e grava as válidas com COPY (db_operations.bulk_upsert_products).
+    `progress(linhas lidas)` é chamado periodicamente. Retorna (resposta, status HTTP).
+    """
+    started = time.perf_counter()
+    received = 0
+    imported = 0
+    errors = []
+    error_count = 0
+    result = {"created": 0, "updated": 0}
+    
+    # Linhas válidas vão para um CSV temporário (em disco se ficar grande) que alimenta o COPY
+    with tempfile.SpooledTemporaryFile(max_size=BULK_IMPORT_SPOOL_SIZE, mode='w+', newline='', encoding='utf-8') as buffer:
+        writer = csv.writer(buffer, lineterminator='\n')
+        for line, item in parser(stream):
+            received += 1
+            if progress and received % 1000 == 0:
+                progress(received)
+            if isinstance(item, str):
+                values, error = None, item
             else:
-                return jsonify({"message": "Erro ao atualizar produto"}), 500
-        else:
-            
-            print(f"🔧 Criando novo produto para empresa {company_id}: {name}")
+                values, error = validate_product_data(item)
             
-            new_product = db_operations.create_product(company_id, name, quantity, value)
+            if error:
+                error_count += 1
+                if len(errors) < BULK_IMPORT_MAX_ERRORS:
+                    errors.append({"line": line, "message": error})
+                continue
             
-            if new_product:
-                return jsonify({
-                    "message": "Produto cadastrado com sucesso",
-                    "product": new_product,
-                    "updated": False
-                }), 201
-            else:
-                return jsonify({"message": "Erro ao cadastrar produto"}), 500
+            writer.writerow((line,) + values)
+            imported += 1
+        
+        if imported:
+            buffer.seek(0)
+            result = db_operations.bulk_upsert_products(company_id, buffer, user_cpf=user_cpf)
+            if result is None:
+                return {"message": "Erro ao importar produtos"}, 500
+    
+    elapsed = time.perf_counter() - started
+    log.info("Importação em lote concluída", company_id=company_id, imported=imported, received=received, elapsed_seconds=round(elapsed, 3))
+    
+    return {
+        "message": f"{imported} de {received} linhas importadas",
+        "received": received,
+        "imported": imported,
+        "created": result["created"],
+        "updated": result["updated"],
+        "error_count": error_count,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(received / elapsed, 1) if elapsed > 0 else None
+    }, 200 if imported or not received else 400
+
+def job_accepted(job_id):
+    """Resposta 202 de uma operação enviada para a fila de tarefas"""
+    if job_id is None:
+        return jsonify({"message": "Erro ao agendar tarefa"}), 500
+    response = jsonify({
+        "message": "Tarefa agendada; acompanhe o andamento em status_url",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}"
+    })
+    response.headers['Location'] = f"/jobs/{job_id}"
+    return response, 202
+
+@app.route('/products/<company_id>/bulk', methods=['POST'])
+@require_auth()
+def bulk_import_products(company_id):
+    """
+    Importar produtos em lote (lista JSON, NDJSON ou CSV).
+    Corpos grandes (ou com ?async=1) são gravados em disco e importados por um trabalhador
+    de tarefas: a resposta é 202 com o endereço para acompanhar o andamento.
+    """
+    try:
+        parser = product_import.get_parser(request.mimetype)
+        if parser is None:
+            return jsonify({
+                "message": "Formato não suportado. Use application/json, application/x-ndjson ou text/csv"
+            }), 415
+        
+        if request.args.get('async') == '1' or (request.content_length or 0) > BULK_IMPORT_ASYNC_BYTES:
+            filename = jobs.save_upload(request.stream)
+            job_id = jobs.enqueue(
+                'importacao_produtos', company_id,
+                {"file": filename, "mimetype": request.mimetype}, user_cpf=g.auth['sub']
+            )
+            return job_accepted(job_id)
+        
+        body, status = run_bulk_import(company_id, request.stream, parser, user_cpf=g.auth['sub'])
+        return jsonify(body), status
         
     except Exception as e:
         return jsonify({"message": f"Erro interno: {str(e)}"}), 500
 
+@jobs.task('importacao_produtos')
+def import_products_job(ctx):
+    """Importação em lote executada por um trabalhador de tarefas"""
+    path = jobs.data_path(ctx.params['file'])
+    size = os.path.getsize(path) or 1
+    try:
+        with open(path, 'rb') as f:
+            parser = product_import.get_parser(ctx.params['mimetype'])
+            # Progresso pela posição no arquivo (o total de linhas não é conhecido de antemão)
+            body, status = run_bulk_import(
+                ctx.company_id, f, parser, user_cpf=ctx.user_cpf,
+                progress=lambda _lines: ctx.progress(f.tell() * 100 / size)
+            )
+    finally:
+        os.remove(path)
+    if status >= 500:
+        raise RuntimeError(body["message"])
+    return body
+
 @app.route('/products/<company_id>/<product_id>', methods=['PUT'])
+@require_auth()
 def update_product(company_id, product_id):
     """Atualizar produto"""
     try:
@@ -346,11 +1177,9 @@ def update_product(company_id, product_id):
         if not data:
             return jsonify({"message": "Dados não fornecidos"}), 400
         
-        
-        product = db_operations.get_product_by_id(company_id, product_id)
-        if not product:
-            return jsonify({"message": "Produto não encontrado"}), 404
-        
+        expected_version, error = parse_expected_version(data)
+        if error:
+            return jsonify({"message": error}), 400
         
         name = None
         quantity = None
@@ -379,25 +1208,47 @@ def update_product(company_id, product_id):
             except (ValueError, TypeError):
                 return jsonify({"message": "Valor deve ser um número válido"}), 400
         
+        minimum, error = parse_minimum(data)
+        if error:
+            return jsonify({"message": error}), 400
         
-        updated_product = db_operations.update_product(company_id, product_id, name, quantity, value)
+        reason = data.get('reason')
+        reason = reason.strip() if isinstance(reason, str) else None
         
-        if updated_product:
-            return jsonify({
-                "message": "Produto atualizado com sucesso",
-                "product": updated_product
-            }), 200
-        else:
+        # Existência, versão e alteração conferidas no mesmo comando
+        product, failure = db_operations.update_product(
+            company_id, product_id, name, quantity, value,
+            expected_version=expected_version, reason=reason, user_cpf=g.auth['sub'], minimum=minimum
+        )
+        
+        if failure == 'not_found':
+            return jsonify({"message": "Produto não encontrado"}), 404
+        if failure == 'conflict':
+            response = jsonify({
+                "message": "O produto foi alterado por outro usuário. Revise os dados atuais e tente novamente",
+                "product": product
+            })
+            response.headers['ETag'] = f'"{product_etag(product)}"'
+            return response, 409
+        if failure:
             return jsonify({"message": "Erro ao atualizar produto"}), 500
         
+        response = jsonify({
+            "message": "Produto atualizado com sucesso",
+            "product": product
+        })
+        response.headers['ETag'] = f'"{product_etag(product)}"'
+        return response, 200
+        
     except Exception as e:
         return jsonify({"message": f"Erro interno: {str(e)}"}), 500
 
 @app.route('/products/<company_id>/<product_id>', methods=['DELETE'])
+@require_auth()
 def delete_product(company_id, product_id):
     """Excluir produto"""
     try:
-        success = db_operations.delete_product(company_id, product_id)
+        success = db_operations.delete_product(company_id, product_id, user_cpf=g.auth['sub'])
         
         if success:
             return jsonify({"message": "Produto excluído com sucesso"}), 200
@@ -407,9 +1258,242 @@ def delete_product(company_id, product_id):
     except Exception as e:
         return jsonify({"message": f"Erro interno: {str(e)}"}), 500
 
+@app.route('/products/<company_id>/adjustments', methods=['POST'])
+@require_auth()
+def adjust_stock(company_id):
+    """Aplicar vários ajustes de estoque (contagem de inventário) em uma única transação"""
+    try:
+        data = request.get_json(silent=True)
+        
+        if not data:
+            return jsonify({"message": "Dados não fornecidos"}), 400
+        
+        batch, error = parse_adjustments(data)
+        if error:
+            return jsonify({"message": error}), 400
+        
+        atomic = batch['mode'] == 'atomic'
+        results, applied = db_operations.apply_stock_adjustments(
+            company_id, batch['items'], atomic=atomic, reason=batch['reason'], user_cpf=g.auth['sub']
+        )
+        
+        if results is None:
+            return jsonify({"message": "Erro ao aplicar ajustes"}), 500
+        
+        updated = sum(1 for result in results if result['status'] == 'updated')
+        failed = len(results) - updated
+        
+        if atomic and failed:
+            # Nada foi gravado: os itens válidos são informados como não aplicados
+            for result in results:
+                if result['status'] == 'updated':
+                    result['status'] = 'not_applied'
+                    result['product'] = None
+            return jsonify({
+                "message": f"{failed} ajuste(s) inválido(s); nenhum ajuste foi aplicado",
+                "mode": batch['mode'],
+                "applied": False,
+                "updated": 0,
+                "failed": failed,
+                "results": results
+            }), 409
+        
+        log.info("Ajustes de estoque aplicados", company_id=company_id, mode=batch['mode'], updated=updated, failed=failed)
+        return jsonify({
+            "message": f"{updated} de {len(results)} ajustes aplicados",
+            "mode": batch['mode'],
+            "applied": applied,
+            "updated": updated,
+            "failed": failed,
+            "results": results
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/products/<company_id>/<product_id>/movements', methods=['POST'])
+@require_auth()
+def create_movement(company_id, product_id):
+    """Registrar entrada, saída ou ajuste de estoque (aplicado como diferença ao saldo)"""
+    try:
+        data = request.get_json(silent=True)
+        
+        if not data:
+            return jsonify({"message": "Dados não fornecidos"}), 400
+        
+        values, error = parse_movement_data(data)
+        if error:
+            return jsonify({"message": error}), 400
+        
+        kind, quantity, reason = values
+        product, failure = db_operations.record_movement(
+            company_id, product_id, kind, quantity, reason=reason, user_cpf=g.auth['sub']
+        )
+        
+        if failure == 'not_found':
+            return jsonify({"message": "Produto não encontrado"}), 404
+        if failure == 'insufficient':
+            return jsonify({"message": "Estoque insuficiente para a movimentação"}), 409
+        if failure:
+            return jsonify({"message": "Erro ao registrar movimentação"}), 500
+        
+        return jsonify({
+            "message": "Movimentação registrada com sucesso",
+            "product": product
+        }), 201
+        
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/products/<company_id>/<product_id>/movements', methods=['GET'])
+@require_auth()
+def get_movements(company_id, product_id):
+    """Histórico de movimentações do produto, mais recentes primeiro (paginado por cursor)"""
+    try:
+        history, error = parse_history_args(request.args)
+        if error:
+            return jsonify({"message": error}), 400
+        
+        movements, next_before = db_operations.get_product_movements(
+            company_id, product_id, history['limit'], before=history['before'], since=history['since']
+        )
+        
+        if movements is None:
+            return jsonify({"message": "Erro ao buscar movimentações"}), 500
+        
+        next_cursor = None
+        if next_before:
+            next_cursor = encode_cursor({"created_at": next_before[0], "id": next_before[1]})
+        
+        return jsonify({
+            "movements": movements,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+            "limit": history['limit']
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/alerts/<company_id>', methods=['GET'])
+@require_auth()
+def get_alerts(company_id):
+    """Produtos abaixo do estoque mínimo (paginado por cursor)"""
+    try:
+        try:
+            limit = int(request.args.get('limit', PRODUCTS_PAGE_DEFAULT))
+        except ValueError:
+            return jsonify({"message": "limit deve ser um número inteiro"}), 400
+        if limit < 1 or limit > PRODUCTS_PAGE_MAX:
+            return jsonify({"message": f"limit deve estar entre 1 e {PRODUCTS_PAGE_MAX}"}), 400
+        
+        after_id = None
+        if 'cursor' in request.args:
+            cursor = decode_cursor(request.args['cursor'])
+            if not cursor or 'id' not in cursor:
+                return jsonify({"message": "cursor inválido"}), 400
+            after_id = cursor['id']
+        
+        products, next_after = db_operations.get_low_stock_products(company_id, limit, after_id)
+        if products is None:
+            return jsonify({"message": "Erro ao buscar alertas"}), 500
+        
+        next_cursor = encode_cursor({"id": next_after}) if next_after is not None else None
+        return jsonify({
+            "alerts": products,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+            "limit": limit
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/alerts/<company_id>/stream', methods=['GET'])
+@require_auth(query_token=True)
+def stream_alerts(company_id):
+    """
+    Feed (Server-Sent Events) dos produtos que ficam abaixo do mínimo ou voltam ao normal.
+    Com Last-Event-ID (ou ?last_event_id=) os eventos perdidos são reenviados antes.
+    Cada conexão ocupa uma thread; para muitos clientes sirva o feed pelo asgi.py.
+    """
+    events = queue.Queue(alerts.ALERTS_QUEUE_SIZE)
+    
+    def deliver(event):
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            pass
+    
+    # Assina antes de ler os eventos perdidos para não haver lacuna entre os dois
+    unsubscribe = alerts.hub.subscribe(company_id, deliver)
+    if unsubscribe is None:
+        response = jsonify({"message": "Limite de conexões de alertas atingido, tente novamente em instantes"})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    last_event_id = parse_last_event_id(
+        request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    )
+    missed = db_operations.get_alert_events(company_id, last_event_id) if last_event_id is not None else []
+    
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            for event in missed:
+                yield alerts.format_event(event)
+            # Eventos já reenviados acima podem chegar de novo pelo NOTIFY
+            replayed = {event['id'] for event in missed}
+            while True:
+                try:
+                    event = events.get(timeout=alerts.ALERTS_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event['id'] not in replayed:
+                    yield alerts.format_event(event)
+        finally:
+            unsubscribe()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "OK", "message": "Servidor funcionando"}), 200
+    return jsonify({
+        "status": "OK",
+        "message": "Servidor funcionando",
+        "pool": db_config.get_pool_stats(),
+        "cache": cache.get_stats(),
+        "alerts": alerts.hub.stats()
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas no formato de texto do Prometheus (deste processo)"""
+    pool = db_config.get_pool_stats() or {}
+    cache_stats = cache.get_stats()
+    alert_stats = alerts.hub.stats()
+    gauges = (
+        ('db_pool_connections_in_use', 'Conexões do pool em uso', pool.get('in_use')),
+        ('db_pool_connections_idle', 'Conexões ociosas no pool', pool.get('idle')),
+        ('db_pool_connections_max', 'Tamanho máximo do pool', pool.get('max')),
+        ('cache_items', 'Itens guardados no cache de leituras', cache_stats.get('items')),
+        ('alerts_stream_subscribers', 'Conexões abertas no feed de alertas', alert_stats['subscribers']),
+    )
+    counters = (
+        ('db_pool_checkouts_total', 'Conexões entregues pelo pool', pool.get('checkouts')),
+        ('db_pool_timeouts_total', 'Esperas por conexão que estouraram o tempo limite', pool.get('timeouts')),
+        ('db_pool_connections_recycled_total', 'Conexões descartadas e recriadas pelo pool', pool.get('recycled')),
+        ('cache_hits_total', 'Acertos no cache de leituras', cache_stats.get('hits')),
+        ('cache_misses_total', 'Faltas no cache de leituras', cache_stats.get('misses')),
+        ('cache_evictions_total', 'Entradas removidas do cache por falta de espaço', cache_stats.get('evictions')),
+        ('alerts_delivered_total', 'Alertas repassados aos assinantes do feed', alert_stats['delivered']),
+    )
+    return Response(metrics.render(gauges, counters), mimetype='text/plain; version=0.0.4')
 
 @app.route('/create-test-user', methods=['POST'])
 def create_test_user():
@@ -478,6 +1562,8 @@ def create_test_user_if_not_exists():
         )
         
         if success:
+            # Empresa inicial do chefe de teste (empresa_chefe, migração 011)
+            db_operations.create_company(cpf, "Empresa 1", COMPANIES_MAX)
             print("✅ Usuário de teste criado com sucesso!")
             print(f"   CPF: 123.456.789-01")
             print(f"   Senha: {password}")
@@ -494,9 +1580,22 @@ if __name__ == '__main__':
     
     
     print("\n🔌 Testando conexão com PostgreSQL...")
+    db_config.init_connection_pool()
+    atexit.register(db_config.close_connection_pool)
+    atexit.register(passwords.shutdown)
+    # Com o recarregamento automático do modo debug, só o processo que atende requisições
+    # (WERKZEUG_RUN_MAIN) inicia os trabalhadores de tarefas
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        jobs.start_workers()
+        atexit.register(jobs.stop_workers)
+        alerts.retention.start()
     if db_config.test_connection():
         print("✅ Conexão com banco de dados estabelecida com sucesso!\n")
         
+        # Carregar metadados das tabelas uma única vez antes de atender requisições
+        if schema_cache.warm_up():
+            print("✅ Cache de esquema carregado")
+        
         
         create_test_user_if_not_exists()
         print("\n💡 Usuário de teste: CPF: 123.456.789-01, Senha: Senha123!\n")
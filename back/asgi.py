@@ -0,0 +1,279 @@
+"""
+Servidor ASGI alternativo (Starlette + asyncpg).
+
+As leituras de estoque mais frequentes (listagem, resumo e busca de produtos) são atendidas
+por rotas assíncronas sobre db_async.py; todas as demais rotas são repassadas ao app Flask
+de app.py (executado em threads), então os contratos JSON são os mesmos nos dois servidores.
+O feed de alertas (/alerts/<id>/stream) também é nativo: cada cliente é só uma fila no laço
+de eventos, sem ocupar uma thread.
+
+Uso (instalar antes requirements-async.txt):
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+O servidor Flask tradicional continua disponível (python app.py) para comparação.
+"""
+import asyncio
+import contextlib
+import functools
+import time
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags
+
+import alerts
+import app as flask_app
+import cache
+import db_async
+import db_config
+import db_operations
+import logs
+import metrics
+import schema_cache
+import session_tokens
+
+log = logs.get_logger(__name__)
+
+
+def timed(route):
+    """Registra duração e status das rotas nativas (as rotas Flask já são medidas em app.py)"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            try:
+                response = await handler(request)
+            except db_async.DatabaseUnavailable:
+                # Pool assíncrono sem banco: o cliente deve tentar de novo
+                response = JSONResponse(
+                    {"message": "Banco de dados indisponível, tente novamente em instantes"},
+                    status_code=503, headers={"Retry-After": str(int(db_config.POOL_RETRY_INTERVAL) or 1)}
+                )
+            status = str(response.status_code)
+            metrics.http_requests.inc(request.method, route, status)
+            metrics.http_duration.observe(time.perf_counter() - started, request.method, route, status)
+            return response
+        return wrapper
+    return decorator
+
+
+def _authorize(request, company_id, query_token=False):
+    """Mesma verificação de require_auth em app.py; retorna uma resposta de erro ou None"""
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):].strip() if header.startswith('Bearer ') else None
+    if token is None and query_token:
+        token = request.query_params.get('access_token')
+    claims = session_tokens.verify_token(token)
+    if claims is None:
+        return JSONResponse({"message": "Sessão inválida ou expirada"}, status_code=401)
+    if not session_tokens.can_access_company(claims, company_id):
+        return JSONResponse({"message": "Acesso não permitido a esta empresa"}, status_code=403)
+    return None
+
+
+@timed('/products/<company_id>')
+async def get_products(request):
+    """Listagem completa ou paginada por chave (mesmo contrato de GET /products/<company_id>)"""
+    company_id = request.path_params['company_id']
+    denied = _authorize(request, company_id)
+    if denied:
+        return denied
+
+    headers = {}
+    version = await db_async.get_data_version(db_operations.PRODUCT_CACHE_NAMESPACE, company_id)
+    if version is not None:
+        etag = flask_app.listing_etag(
+            db_operations.PRODUCT_CACHE_NAMESPACE, company_id, request.url.query.encode(), version
+        )
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if parse_etags(request.headers.get('If-None-Match')).contains(etag):
+            return Response(status_code=304, headers=headers)
+
+    try:
+        if not any(arg in request.query_params for arg in flask_app.PAGINATION_ARGS):
+            products = await db_async.get_products_by_company(company_id)
+            return JSONResponse({"products": products}, headers=headers)
+
+        page, error = flask_app.parse_page_args(request.query_params)
+        if error:
+            return JSONResponse({"message": error}, status_code=400)
+
+        products, next_after = await db_async.get_products_page(
+            company_id,
+            page['limit'],
+            sort=page['sort'],
+            descending=page['order'] == 'desc',
+            after=page['after']
+        )
+
+        next_cursor = None
+        if next_after:
+            next_cursor = flask_app.encode_cursor({
+                "sort": page['sort'],
+                "order": page['order'],
+                "value": next_after[0],
+                "id": next_after[1]
+            })
+
+        return JSONResponse({
+            "products": products,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+            "limit": page['limit'],
+            "sort": page['sort'],
+            "order": page['order']
+        }, headers=headers)
+    except db_async.DatabaseUnavailable:
+        raise
+    except Exception as e:
+        return JSONResponse({"message": f"Erro interno: {str(e)}"}, status_code=500)
+
+
+@timed('/products/<company_id>/stats')
+async def get_products_stats(request):
+    """Totais do estoque da empresa (mesmo contrato de GET /products/<company_id>/stats)"""
+    company_id = request.path_params['company_id']
+    denied = _authorize(request, company_id)
+    if denied:
+        return denied
+
+    stats = await db_async.get_inventory_stats(company_id)
+    if stats is None:
+        return JSONResponse({"message": "Erro ao buscar estatísticas do estoque"}, status_code=500)
+    return JSONResponse({"stats": stats})
+
+
+@timed('/products/<company_id>/search')
+async def search_products(request):
+    """Busca por nome (mesmo contrato de GET /products/<company_id>/search)"""
+    company_id = request.path_params['company_id']
+    denied = _authorize(request, company_id)
+    if denied:
+        return denied
+
+    search, error = flask_app.parse_search_args(request.query_params)
+    if error:
+        return JSONResponse({"message": error}, status_code=400)
+
+    products, has_more = await db_async.search_products(
+        company_id, search['q'], search['mode'], search['limit'], search['offset']
+    )
+    return JSONResponse({
+        "products": products,
+        "query": search['q'],
+        "mode": search['mode'],
+        "has_more": has_more,
+        "next_offset": search['offset'] + search['limit'] if has_more else None
+    })
+
+
+async def stream_alerts(request):
+    """Feed de alertas de estoque baixo (mesmo contrato de GET /alerts/<company_id>/stream)"""
+    company_id = request.path_params['company_id']
+    denied = _authorize(request, company_id, query_token=True)
+    if denied:
+        return denied
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(alerts.ALERTS_QUEUE_SIZE)
+
+    def put(event):
+        try:
+            events.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    # Chamado na thread do ouvinte: a fila só é tocada pelo laço de eventos
+    unsubscribe = alerts.hub.subscribe(company_id, lambda event: loop.call_soon_threadsafe(put, event))
+    if unsubscribe is None:
+        return JSONResponse(
+            {"message": "Limite de conexões de alertas atingido, tente novamente em instantes"},
+            status_code=503, headers={"Retry-After": "5"}
+        )
+
+    last_event_id = flask_app.parse_last_event_id(
+        request.headers.get('Last-Event-ID', request.query_params.get('last_event_id'))
+    )
+    missed = []
+    if last_event_id is not None:
+        missed = await run_in_threadpool(db_operations.get_alert_events, company_id, last_event_id)
+
+    async def generate():
+        try:
+            yield "retry: 5000\n\n"
+            for event in missed:
+                yield alerts.format_event(event)
+            replayed = {event['id'] for event in missed}
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), alerts.ALERTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event['id'] not in replayed:
+                    yield alerts.format_event(event)
+        finally:
+            unsubscribe()
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def health_check(request):
+    return JSONResponse({
+        "status": "OK",
+        "message": "Servidor funcionando",
+        "server": "asgi",
+        "pool": db_config.get_pool_stats(),
+        "async_pool": db_async.get_pool_stats(),
+        "cache": cache.get_stats(),
+        "alerts": alerts.hub.stats()
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    started = time.monotonic()
+    await db_async.init_pool()
+    # O app Flask montado abaixo usa o pool síncrono para as demais rotas
+    await run_in_threadpool(db_config.init_connection_pool)
+    if await run_in_threadpool(schema_cache.warm_up):
+        log.info("Cache de esquema carregado")
+    alerts.retention.start()
+    log.info("Servidor ASGI pronto", startup_seconds=round(time.monotonic() - started, 3))
+    yield
+    alerts.hub.stop()
+    alerts.retention.stop()
+    await db_async.close_pool()
+    await run_in_threadpool(db_config.close_connection_pool)
+
+
+app = Starlette(
+    routes=[
+        Route('/products/{company_id}', get_products, methods=['GET']),
+        Route('/products/{company_id}/stats', get_products_stats, methods=['GET']),
+        Route('/products/{company_id}/search', search_products, methods=['GET']),
+        Route('/alerts/{company_id}/stream', stream_alerts, methods=['GET']),
+        Route('/health', health_check, methods=['GET']),
+        # Demais rotas (login, cadastro, escrita de produtos, funcionários...): app Flask
+        Mount('/', app=WSGIMiddleware(flask_app.app)),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=['*'],
+            allow_methods=['*'],
+            allow_headers=['*'],
+            expose_headers=['ETag'],
+        ),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,240 @@
+"""
+Cache de leitura (read-through) para consultas por empresa.
+
+As entradas são agrupadas por (namespace, empresa), por exemplo ('produtos', '1'), e cada
+uma guarda junto do valor a versão dos dados da empresa em que foi lida (mantida no banco,
+db_operations.get_data_version, migração 010). Qualquer escrita, feita por qualquer
+processo (inclusive os trabalhadores de tarefas), muda essa versão, e entradas de uma
+versão anterior são recarregadas no lugar.
+
+A versão lida do banco é reaproveitada pelo processo por CACHE_VERSION_TTL segundos
+(`current_version`): nesse intervalo um acerto no cache não consulta o banco. `invalidate`,
+chamado após cada escrita, descarta na hora a versão guardada e as entradas da empresa;
+escritas de outros processos aparecem em até CACHE_VERSION_TTL.
+
+Backends disponíveis (variável de ambiente CACHE_BACKEND):
+- memory (padrão): LRU em memória do processo, limitado pelo total de itens guardados
+- redis: servidor Redis local/compartilhado (requer o pacote `redis`)
+- none: desativa o cache
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import logs
+
+log = logs.get_logger(__name__)
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+# Limite de itens guardados no backend em memória (uma lista de N produtos conta N itens)
+CACHE_MAX_ITEMS = int(os.environ.get('CACHE_MAX_ITEMS', '200000'))
+# Tempo de vida das entradas em segundos (limita dados desatualizados entre processos)
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '60'))
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+# Tempo (s) em que a versão dos dados lida do banco é reaproveitada (0 = ler sempre)
+CACHE_VERSION_TTL = float(os.environ.get('CACHE_VERSION_TTL', '1'))
+
+# Indica ausência no cache (None é um valor válido, ex.: produto inexistente)
+MISSING = object()
+
+
+class MemoryBackend:
+    """LRU em memória, seguro para threads, limitado pelo peso total das entradas"""
+
+    def __init__(self, max_items, ttl):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._groups = {}
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _remove(self, key):
+        _, weight, _, group = self._data.pop(key)
+        self._weight -= weight
+        keys = self._groups.get(group)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[group]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            if entry[2] < time.monotonic():
+                self._remove(key)
+                return MISSING
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, group, weight=1):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.max_items <= 0 or weight > self.max_items:
+                return
+            self._data[key] = (value, weight, time.monotonic() + self.ttl, group)
+            self._groups.setdefault(group, set()).add(key)
+            self._weight += weight
+            while self._weight > self.max_items:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, group):
+        with self._lock:
+            for key in list(self._groups.get(group, ())):
+                self._remove(key)
+
+    def info(self):
+        with self._lock:
+            return {
+                'backend': 'memory' if self.max_items > 0 else 'none',
+                'entries': len(self._data),
+                'items': self._weight,
+                'max_items': self.max_items,
+                'evictions': self.evictions,
+            }
+
+
+class RedisBackend:
+    """
+    Cache em um servidor Redis, compartilhado entre processos e workers.
+    A política de despejo (LRU) e o limite de memória ficam a cargo do Redis
+    (ex.: maxmemory-policy allkeys-lru).
+    """
+
+    def __init__(self, url, ttl):
+        import redis
+
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        if raw is None:
+            return MISSING
+        return pickle.loads(raw)
+
+    def set(self, key, value, group, weight=1):
+        ttl = max(int(self.ttl), 1)
+        # As chaves de cada grupo ficam em um conjunto, apagado junto com elas em invalidate
+        pipe = self._client.pipeline()
+        pipe.set(key, pickle.dumps(value), ex=ttl)
+        pipe.sadd(f"{group}:chaves", key)
+        pipe.expire(f"{group}:chaves", ttl)
+        pipe.execute()
+
+    def invalidate(self, group):
+        keys = self._client.smembers(f"{group}:chaves")
+        self._client.delete(f"{group}:chaves", *keys)
+
+    def info(self):
+        return {'backend': 'redis'}
+
+
+def _create_backend():
+    if CACHE_BACKEND == 'none':
+        return MemoryBackend(0, CACHE_TTL)
+    if CACHE_BACKEND == 'redis':
+        try:
+            return RedisBackend(CACHE_REDIS_URL, CACHE_TTL)
+        except ImportError:
+            log.warning("Pacote 'redis' não instalado; usando cache em memória")
+    return MemoryBackend(CACHE_MAX_ITEMS, CACHE_TTL)
+
+
+backend = _create_backend()
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+# Versão dos dados por grupo: (versão, válida até). A geração muda a cada invalidate e
+# impede que uma versão lida antes de uma escrita seja guardada depois dela
+_versions_lock = threading.Lock()
+_versions = {}
+_generations = {}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _group(namespace, company_id):
+    # Normaliza o id ('01' e 1 são a mesma empresa, como nas consultas)
+    try:
+        company_id = int(company_id)
+    except (ValueError, TypeError):
+        pass
+    return f"{namespace}:{company_id}"
+
+
+def current_version(namespace, company_id, fetch):
+    """
+    Versão dos dados da empresa no namespace: a guardada pelo processo há menos de
+    CACHE_VERSION_TTL segundos ou o resultado de `fetch()` (None, em caso de erro, não
+    é guardado).
+    """
+    group = _group(namespace, company_id)
+    with _versions_lock:
+        memo = _versions.get(group)
+        if memo is not None and memo[1] > time.monotonic():
+            return memo[0]
+        generation = _generations.get(group, 0)
+
+    version = fetch()
+    if version is not None and CACHE_VERSION_TTL > 0:
+        with _versions_lock:
+            if _generations.get(group, 0) == generation:
+                _versions[group] = (version, time.monotonic() + CACHE_VERSION_TTL)
+    return version
+
+
+def get_or_load(namespace, company_id, key, loader, version):
+    """
+    Retorna o valor em cache para (namespace, empresa, key) se ele foi lido na versão dos
+    dados indicada (ou numa mais nova); senão chama `loader()`, guarda e devolve o
+    resultado. Sem versão (None) o cache não é usado. Exceções de `loader` não são guardadas.
+    Os valores devolvidos são compartilhados e não devem ser modificados.
+    """
+    if version is None:
+        return loader()
+
+    group = _group(namespace, company_id)
+    full_key = f"{group}:{key}"
+
+    entry = backend.get(full_key)
+    if entry is not MISSING and entry[0] >= version:
+        _count('hits')
+        return entry[1]
+
+    _count('misses')
+    value = loader()
+    backend.set(full_key, (version, value), group, weight=len(value) if isinstance(value, list) else 1)
+    return value
+
+
+def invalidate(namespace, company_id):
+    """Descarta a versão guardada e as entradas da empresa no namespace (após cada escrita)"""
+    _count('invalidations')
+    group = _group(namespace, company_id)
+    with _versions_lock:
+        _versions.pop(group, None)
+        _generations[group] = _generations.get(group, 0) + 1
+    backend.invalidate(group)
+
+
+def get_stats():
+    """Contadores de acertos/faltas e informações do backend"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    stats.update(backend.info())
+    return stats
@@ -0,0 +1,291 @@
+"""
+Camada de acesso assíncrona (asyncpg) usada pelo servidor ASGI (asgi.py).
+
+Espelha as leituras de produtos de db_operations.py com as mesmas consultas e o mesmo
+formato de retorno, mas com um pool próprio de conexões asyncpg: uma única thread atende
+muitas consultas simultâneas sem bloquear enquanto espera o banco.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+import asyncpg
+
+import logs
+from db_config import DB_CONFIG, POOL_CONFIG, POOL_RETRY_INTERVAL
+from db_operations import (
+    PRODUCT_COLUMNS,
+    PRODUCT_SORT_COLUMNS,
+    _company_key,
+    _escape_like,
+    _product_from_row,
+)
+
+log = logs.get_logger(__name__)
+
+# Conexões ociosas há mais que isso (s) são fechadas pelo asyncpg
+# (max_inactive_connection_lifetime). A idade máxima de cada conexão é outro limite:
+# POOL_CONFIG['max_lifetime'], aplicado ao devolver a conexão (ver _acquire)
+ASYNC_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+
+pool = None
+_init_lock = asyncio.Lock()
+_next_init_attempt = 0.0
+# Momento de abertura de cada conexão, pelo pid do processo no servidor
+_opened_at = {}
+
+
+class DatabaseUnavailable(Exception):
+    """O pool não pôde ser criado (banco fora do ar); asgi.py responde 503"""
+
+
+def _is_too_old(pid):
+    """Conexão aberta há mais de max_lifetime (0 = sem limite); sem registro conta como velha"""
+    max_lifetime = POOL_CONFIG['max_lifetime']
+    if not max_lifetime:
+        return False
+    opened = _opened_at.get(pid)
+    return opened is None or time.monotonic() - opened > max_lifetime
+
+
+async def _on_connect(conn):
+    # Conexões fechadas pelo asyncpg (ociosas) não avisam: entradas vencidas são descartadas
+    for pid in [pid for pid in _opened_at if _is_too_old(pid)]:
+        del _opened_at[pid]
+    _opened_at[conn.get_server_pid()] = time.monotonic()
+
+
+async def init_pool():
+    """
+    Cria o pool asyncpg (na inicialização do servidor ASGI e, se o banco estava fora,
+    de novo no primeiro uso após POOL_RETRY_INTERVAL). Retorna True se o pool existe.
+    """
+    global pool, _next_init_attempt
+    if pool is not None:
+        return True
+    async with _init_lock:
+        if pool is not None:
+            return True
+        if time.monotonic() < _next_init_attempt:
+            return False
+        try:
+            pool = await asyncpg.create_pool(
+                user=DB_CONFIG['user'],
+                password=DB_CONFIG['password'],
+                host=DB_CONFIG['host'],
+                port=int(DB_CONFIG['port']),
+                database=DB_CONFIG['database'],
+                min_size=POOL_CONFIG['minconn'],
+                max_size=POOL_CONFIG['maxconn'],
+                max_inactive_connection_lifetime=ASYNC_POOL_IDLE_TIMEOUT,
+                init=_on_connect,
+            )
+            log.info("Pool assíncrono de conexões inicializado")
+            return True
+        except (OSError, asyncpg.PostgresError) as e:
+            _next_init_attempt = time.monotonic() + POOL_RETRY_INTERVAL
+            log.error("Erro ao inicializar pool assíncrono", error=str(e),
+                      retry_seconds=POOL_RETRY_INTERVAL)
+            return False
+
+
+@contextlib.asynccontextmanager
+async def _acquire():
+    """
+    Empresta uma conexão do pool (criando-o se ainda não existir). Conexões abertas há
+    mais de POOL_CONFIG['max_lifetime'] são fechadas ao final; o asyncpg abre outra
+    no lugar no próximo uso.
+    """
+    if not await init_pool():
+        raise DatabaseUnavailable("Banco de dados indisponível")
+    async with pool.acquire() as conn:
+        try:
+            yield conn
+        finally:
+            pid = conn.get_server_pid()
+            if _is_too_old(pid):
+                _opened_at.pop(pid, None)
+                try:
+                    await conn.close()
+                except (OSError, asyncpg.PostgresError):
+                    conn.terminate()
+
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+    _opened_at.clear()
+
+
+def get_pool_stats():
+    """Estatísticas do pool assíncrono (None se não estiver ativo)"""
+    if pool is None:
+        return None
+    return {
+        'min': pool.get_min_size(),
+        'max': pool.get_max_size(),
+        'size': pool.get_size(),
+        'idle': pool.get_idle_size(),
+    }
+
+
+def _company_id(company_id):
+    # asyncpg exige o tipo exato do parâmetro (id_empresa é inteiro)
+    try:
+        return int(company_id)
+    except (ValueError, TypeError):
+        return None
+
+
+async def get_data_version(namespace, company_id):
+    """Mesma leitura de db_operations.get_data_version (versão mantida pelos triggers)"""
+    try:
+        async with _acquire() as conn:
+            version = await conn.fetchval(
+                "SELECT versao FROM versao_dados WHERE grupo = $1 AND id_empresa = $2",
+                namespace, _company_key(company_id)
+            )
+        return version or 0
+    except asyncpg.PostgresError as e:
+        log.error("Erro ao buscar versão dos dados", namespace=namespace, error=str(e))
+        return None
+
+
+async def get_products_by_company(company_id):
+    """Busca todos os produtos de uma empresa"""
+    company_id_int = _company_id(company_id)
+    if company_id_int is None:
+        return []
+    try:
+        async with _acquire() as conn:
+            results = await conn.fetch(
+                f"SELECT {PRODUCT_COLUMNS} FROM produto WHERE id_empresa = $1 ORDER BY id",
+                company_id_int
+            )
+        return [_product_from_row(result) for result in results]
+    except asyncpg.PostgresError as e:
+        log.error("Erro ao buscar produtos", error=str(e))
+        return []
+
+
+async def get_products_page(company_id, limit, sort='id', descending=False, after=None):
+    """Mesma paginação por chave de db_operations.get_products_page"""
+    company_id_int = _company_id(company_id)
+    if company_id_int is None:
+        return [], None
+    try:
+        sort_col = PRODUCT_SORT_COLUMNS[sort]
+        direction = "DESC" if descending else "ASC"
+        comparison = "<" if descending else ">"
+
+        params = [company_id_int]
+        where = "id_empresa = $1"
+        if after is not None:
+            after_value, after_id = after
+            if sort_col == 'id':
+                params.append(int(after_id))
+                where += f" AND id {comparison} ${len(params)}"
+            else:
+                if sort_col == 'preco':
+                    after_value = Decimal(str(after_value))
+                params.extend([after_value, int(after_id)])
+                where += f" AND ({sort_col}, id) {comparison} (${len(params) - 1}, ${len(params)})"
+
+        order = "id" if sort_col == 'id' else f"{sort_col} {direction}, id"
+        # Um item extra indica se existe próxima página
+        params.append(limit + 1)
+        query = (
+            f"SELECT {PRODUCT_COLUMNS} FROM produto WHERE {where} "
+            f"ORDER BY {order} {direction} LIMIT ${len(params)}"
+        )
+
+        async with _acquire() as conn:
+            results = await conn.fetch(query, *params)
+
+        has_more = len(results) > limit
+        results = results[:limit]
+        next_after = None
+        if has_more:
+            last = results[-1]
+            sort_value = {'id': last[0], 'nome': last[1], 'quantidade': last[2], 'preco': last[3]}[sort_col]
+            next_after = (str(sort_value) if sort_col == 'preco' else sort_value, last[0])
+
+        return [_product_from_row(result) for result in results], next_after
+    except (asyncpg.PostgresError, InvalidOperation, ValueError, TypeError) as e:
+        log.error("Erro ao buscar página de produtos", error=str(e))
+        return [], None
+
+
+async def get_inventory_stats(company_id):
+    """Totais do estoque a partir de produto_resumo (ver db_operations.get_inventory_stats)"""
+    company_id_int = _company_id(company_id)
+    try:
+        result = None
+        if company_id_int is not None:
+            async with _acquire() as conn:
+                result = await conn.fetchrow(
+                    """
+                    SELECT total_produtos, total_quantidade, valor_total, estoque_baixo, sem_estoque, atualizado_em
+                    FROM produto_resumo WHERE id_empresa = $1
+                    """,
+                    company_id_int
+                )
+
+        if not result:
+            # Empresa sem produtos cadastrados ainda
+            result = (0, 0, 0, 0, 0, None)
+
+        return {
+            'total_products': result[0],
+            'total_quantity': result[1],
+            'total_value': float(result[2]),
+            'low_stock': result[3],
+            'out_of_stock': result[4],
+            'updated_at': result[5].isoformat() if result[5] else None
+        }
+    except asyncpg.PostgresError as e:
+        log.error("Erro ao buscar resumo do estoque", error=str(e))
+        return None
+
+
+async def search_products(company_id, term, mode='substring', limit=50, offset=0):
+    """Busca por nome com pg_trgm (ver db_operations.search_products)"""
+    company_id_int = _company_id(company_id)
+    if company_id_int is None:
+        return [], False
+    try:
+        if mode == 'fuzzy':
+            condition = "$1 <% nome"
+            score = "word_similarity($1, nome)"
+            params = [term, company_id_int]
+        else:
+            pattern = _escape_like(term) + '%'
+            if mode == 'substring':
+                pattern = '%' + pattern
+            condition = "nome ILIKE $3"
+            score = "similarity(nome, $1)"
+            params = [term, company_id_int, pattern]
+
+        params.extend([limit + 1, offset])
+        query = (
+            f"SELECT {PRODUCT_COLUMNS}, {score} AS score FROM produto "
+            f"WHERE id_empresa = $2 AND {condition} "
+            f"ORDER BY score DESC, id LIMIT ${len(params) - 1} OFFSET ${len(params)}"
+        )
+
+        async with _acquire() as conn:
+            results = await conn.fetch(query, *params)
+
+        products = []
+        for result in results[:limit]:
+            product = _product_from_row(result)
+            product['score'] = round(float(result[-1]), 4)
+            products.append(product)
+        return products, len(results) > limit
+    except asyncpg.PostgresError as e:
+        log.error("Erro ao buscar produtos por nome", error=str(e))
+        return [], False
@@ -1,6 +1,15 @@
 import psycopg2
-from psycopg2 import pool
+from psycopg2 import extensions, pool
+from contextlib import contextmanager
+import collections
 import os
+import threading
+import time
+
+import logs
+import metrics
+
+log = logs.get_logger(__name__)
 
 # Configurações do banco de dados
 DB_CONFIG = {
@@ -11,43 +20,292 @@ DB_CONFIG = {
     'database': 'Estoque'
 }
 
+# Configurações do pool de conexões (podem ser ajustadas por variáveis de ambiente)
+POOL_CONFIG = {
+    'minconn': int(os.environ.get('DB_POOL_MIN', '1')),
+    'maxconn': int(os.environ.get('DB_POOL_MAX', '10')),
+    # Tempo máximo (s) de espera por uma conexão livre quando o pool está esgotado
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    # Conexões mais antigas que isso (s) são fechadas e recriadas
+    'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+    # Conexões ociosas há mais que isso (s) são testadas com SELECT 1 antes do uso
+    'ping_after': float(os.environ.get('DB_POOL_PING_AFTER', '30')),
+}
+
+POOL_ENABLED = os.environ.get('DB_POOL_ENABLED', '1') != '0'
+# Intervalo mínimo (s) entre tentativas de criar o pool enquanto o banco está fora do ar
+POOL_RETRY_INTERVAL = float(os.environ.get('DB_POOL_RETRY_INTERVAL', '5'))
+
 # Pool de conexões (opcional, mas recomendado para performance)
 connection_pool = None
+_pool_lock = threading.Lock()
+# Próxima tentativa de criar o pool após uma falha (time.monotonic)
+_next_init_attempt = 0.0
+
+
+class PoolTimeoutError(pool.PoolError):
+    """Nenhuma conexão ficou livre dentro do tempo limite"""
+
+
+class PoolUnavailableError(pool.PoolError):
+    """O pool não pôde ser criado (banco fora do ar); nova tentativa após POOL_RETRY_INTERVAL"""
+
+
+class ConnectionPool:
+    """
+    Pool de conexões seguro para threads.
+
+    Quando todas as conexões estão em uso, `getconn` aguarda até `timeout` segundos
+    em vez de falhar imediatamente. Conexões fechadas, velhas demais ou que não
+    respondem ao pre-ping são descartadas e recriadas.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=10.0, max_lifetime=1800.0, ping_after=30.0, **kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+        self._kwargs = kwargs
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._idle = collections.deque()
+        self._created_at = {}
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._recycled = 0
+
+        try:
+            for _ in range(minconn):
+                self._idle.append((self._connect(), time.monotonic()))
+        except Exception:
+            # Falha no meio: fecha as conexões já abertas em vez de deixá-las para o GC
+            self.closeall()
+            raise
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._kwargs)
+        with self._lock:
+            self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _close(self, conn):
+        with self._lock:
+            self._created_at.pop(id(conn), None)
+        if not conn.closed:
+            conn.close()
+
+    def _is_usable(self, conn, released_at):
+        """Verifica se a conexão ainda pode ser usada (pre-ping para conexões ociosas)"""
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        created_at = self._created_at.get(id(conn), now)
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if now - released_at > self.ping_after:
+            try:
+                # Cursor comum: o pre-ping não entra nas métricas nem na contagem de consultas
+                cur = conn.cursor(cursor_factory=extensions.cursor)
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self):
+        """Obtém uma conexão saudável, aguardando até `timeout` se o pool estiver esgotado"""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(
+                f"Nenhuma conexão disponível após {self.timeout:.1f}s (máximo de {self.maxconn})"
+            )
+        waited = time.monotonic() - start
+        metrics.record_pool_wait(waited)
+
+        try:
+            while True:
+                with self._lock:
+                    # LIFO: reaproveita a conexão usada mais recentemente
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn = self._connect()
+                    break
+                conn, released_at = item
+                if self._is_usable(conn, released_at):
+                    break
+                self._close(conn)
+                with self._lock:
+                    self._recycled += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            if waited > 0.001:
+                self._waits += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Devolve a conexão ao pool (fechando-a se estiver quebrada ou se `close` for True)"""
+        try:
+            if not close and not conn.closed:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    # Transação pendente ou com erro: desfazer antes de reaproveitar
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        close = True
+            if close or conn.closed:
+                self._close(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def owns(self, conn):
+        """Indica se a conexão foi criada por este pool"""
+        with self._lock:
+            return id(conn) in self._created_at
+
+    def closeall(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Estatísticas do pool: conexões em uso/ociosas e tempo de espera"""
+        with self._lock:
+            return {
+                'min': self.minconn,
+                'max': self.maxconn,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_total': round(self._wait_total, 6),
+                'wait_time_max': round(self._wait_max, 6),
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+            }
+
+
+def _get_pool():
+    """Retorna o pool do processo atual, criando-o na primeira chamada (ou após um fork)"""
+    if not POOL_ENABLED:
+        return None
+    if connection_pool is None or connection_pool.pid != os.getpid():
+        init_connection_pool()
+    return connection_pool
 
 
 def get_connection():
-    """Obtém uma conexão do banco de dados"""
+    """
+    Obtém uma conexão do banco de dados. Com o pool ativo (POOL_ENABLED) todas as conexões
+    vêm dele: se o pool não pôde ser criado, falha com PoolUnavailableError em vez de abrir
+    conexões avulsas, que não respeitariam DB_POOL_MAX.
+    """
     try:
-        if connection_pool:
-            return connection_pool.getconn()
-        else:
-            return psycopg2.connect(**DB_CONFIG)
+        if not POOL_ENABLED:
+            return psycopg2.connect(**DB_CONFIG, cursor_factory=metrics.TimedCursor)
+        current_pool = _get_pool()
+        if current_pool is None:
+            raise PoolUnavailableError("Pool de conexões indisponível")
+        return current_pool.getconn()
     except psycopg2.Error as e:
-        print(f"Erro ao conectar ao banco de dados: {e}")
+        log.error("Erro ao conectar ao banco de dados", error=str(e))
         raise
 
 
 def return_connection(conn):
     """Retorna uma conexão ao pool"""
-    if connection_pool:
+    if connection_pool and connection_pool.pid == os.getpid() and connection_pool.owns(conn):
         connection_pool.putconn(conn)
     else:
         conn.close()
 
 
-def init_connection_pool(minconn=1, maxconn=10):
-    """Inicializa o pool de conexões"""
-    global connection_pool
+@contextmanager
+def db_connection():
+    """
+    Empresta uma conexão para o bloco `with` e a devolve ao pool ao final.
+    Em caso de exceção a transação pendente é desfeita antes da devolução.
+    """
+    conn = get_connection()
     try:
-        connection_pool = psycopg2.pool.SimpleConnectionPool(
-            minconn, maxconn, **DB_CONFIG
-        )
-        print("✅ Pool de conexões inicializado com sucesso")
-    except psycopg2.Error as e:
-        print(f"Erro ao inicializar pool de conexões: {e}")
+        yield conn
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        return_connection(conn)
+
+
+def init_connection_pool(minconn=None, maxconn=None):
+    """
+    Inicializa o pool de conexões. Após uma falha, novas tentativas (inclusive as feitas
+    por get_connection) só acontecem depois de POOL_RETRY_INTERVAL segundos.
+    """
+    global connection_pool, _next_init_attempt
+    config = dict(POOL_CONFIG)
+    if minconn is not None:
+        config['minconn'] = minconn
+    if maxconn is not None:
+        config['maxconn'] = maxconn
+    with _pool_lock:
+        if connection_pool is not None and connection_pool.pid == os.getpid():
+            return
+        if time.monotonic() < _next_init_attempt:
+            return
+        try:
+            connection_pool = ConnectionPool(**config, **DB_CONFIG, cursor_factory=metrics.TimedCursor)
+            log.info("Pool de conexões inicializado", minconn=config['minconn'], maxconn=config['maxconn'])
+        except psycopg2.Error as e:
+            _next_init_attempt = time.monotonic() + POOL_RETRY_INTERVAL
+            log.error("Erro ao inicializar pool de conexões", error=str(e), retry_seconds=POOL_RETRY_INTERVAL)
+            connection_pool = None
+
+
+def close_connection_pool():
+    """Fecha todas as conexões do pool (usado no encerramento do processo)"""
+    global connection_pool
+    with _pool_lock:
+        if connection_pool is not None and connection_pool.pid == os.getpid():
+            connection_pool.closeall()
         connection_pool = None
 
 
+def get_pool_stats():
+    """Estatísticas do pool atual (None se o pool não estiver ativo)"""
+    if connection_pool is None or connection_pool.pid != os.getpid():
+        return None
+    return connection_pool.stats()
+
+
 def test_connection():
     """Testa a conexão com o banco de dados"""
     try:
@@ -55,12 +313,10 @@ def test_connection():
         cur = conn.cursor()
         cur.execute("SELECT version();")
         db_version = cur.fetchone()
-        print(f"✅ Conexão com PostgreSQL estabelecida: {db_version[0]}")
+        log.info("Conexão com PostgreSQL estabelecida", version=db_version[0])
         cur.close()
         return_connection(conn)
         return True
     except psycopg2.Error as e:
-        print(f"❌ Erro ao conectar ao banco de dados: {e}")
+        log.error("Erro ao conectar ao banco de dados", error=str(e))
         return False
-
-
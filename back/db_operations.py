@@ -1,138 +1,64 @@
-from db_config import get_connection, return_connection
+from db_config import db_connection
 import psycopg2
+import re
 from psycopg2 import sql
-import hashlib
+import logs
+import passwords
+import schema_cache
+import cache
 
+log = logs.get_logger(__name__)
 
-def _get_table_columns(table_name):
-    """
-    Retorna a lista de colunas de uma tabela ou lista vazia se não existir.
-    """
-    conn = None
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT column_name
-            FROM information_schema.columns
-            WHERE table_name = %s
-            ORDER BY ordinal_position;
-            """,
-            (table_name,),
-        )
-        columns = [row[0] for row in cur.fetchall()]
-        cur.close()
-        return columns
-    except psycopg2.Error as e:
-        print(f"Erro ao obter colunas da tabela '{table_name}': {e}")
-        return []
-    finally:
-        if conn:
-            return_connection(conn)
-
-
-def _ensure_funcionarios_table():
-    """
-    Garante a existência de uma tabela 'funcionarios' auxiliar para armazenar vínculos de empresa.
-    """
-    conn = None
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS funcionarios (
-                cpf VARCHAR(14) PRIMARY KEY,
-                nome VARCHAR(100),
-                senha VARCHAR(255),
-                id_empresa INTEGER,
-                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        conn.commit()
-        cur.close()
-    except psycopg2.Error as e:
-        if conn:
-            conn.rollback()
-        print(f"Erro ao garantir tabela funcionarios: {e}")
-    finally:
-        if conn:
-            return_connection(conn)
+_funcionarios_ready = False
 
 
-def _detect_column(columns, candidates):
-    """
-    Retorna o primeiro nome de coluna encontrado em `columns` que esteja na lista `candidates`.
-    """
-    for candidate in candidates:
-        if candidate in columns:
-            return candidate
-    return None
+def normalize_cpf(cpf):
+    """CPF apenas com os dígitos, formato gravado no banco (migração 005)"""
+    return re.sub(r'\D', '', cpf or '')
 
 
-def _get_company_from_funcionarios(cpf):
+def _ensure_funcionarios_table():
     """
-    Busca o id da empresa na tabela funcionarios para manter compatibilidade com estruturas antigas.
+    Garante a existência de uma tabela 'funcionarios' auxiliar para armazenar vínculos de empresa.
+    A verificação é feita apenas uma vez por processo.
     """
-    conn = None
+    global _funcionarios_ready
+    if _funcionarios_ready:
+        return
     try:
-        _ensure_funcionarios_table()
-        columns = _get_table_columns("funcionarios")
-        if not columns:
-            return None
-
-        cpf_col = _detect_column(columns, ["cpf", "cpf_funcionario", "cpf_colaborador", "cpf_colab"])
-        empresa_col = _detect_column(columns, ["id_empresa", "empresa_id", "company_id", "idempresa", "empresa"])
-
-        if not cpf_col or not empresa_col:
-            return None
-
-        conn = get_connection()
-        cur = conn.cursor()
-
-        query = (
-            sql.SQL("SELECT {empresa_col} FROM funcionarios WHERE {cpf_col} = %s OR {cpf_col} = %s LIMIT 1")
-            .format(empresa_col=sql.Identifier(empresa_col), cpf_col=sql.Identifier(cpf_col))
-        )
-
-        cpf_clean = cpf.replace(".", "").replace("-", "").strip()
-        cpf_formatted = (
-            f"{cpf_clean[:3]}.{cpf_clean[3:6]}.{cpf_clean[6:9]}-{cpf_clean[9:]}" if len(cpf_clean) == 11 else cpf_clean
-        )
-
-        cur.execute(query, (cpf_clean, cpf_formatted))
-        row = cur.fetchone()
-        cur.close()
-
-        if row and row[0] is not None:
-            return row[0]
-        return None
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS funcionarios (
+                    cpf VARCHAR(14) PRIMARY KEY,
+                    nome VARCHAR(100),
+                    senha VARCHAR(255),
+                    id_empresa INTEGER,
+                    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            conn.commit()
+            cur.close()
+            _funcionarios_ready = True
+            schema_cache.invalidate('funcionarios')
     except psycopg2.Error as e:
-        print(f"Erro ao buscar empresa em funcionarios: {e}")
-        return None
-    finally:
-        if conn:
-            return_connection(conn)
+        log.error("Erro ao garantir tabela funcionarios", error=str(e))
 
 
 def _sync_funcionarios_record(cpf, password_hash, company_id, name=None):
     """
     Garante que a tabela funcionarios (se existir) receba/atualize o vínculo do funcionário com a empresa.
     """
-    conn = None
     try:
         _ensure_funcionarios_table()
-        columns = _get_table_columns("funcionarios")
-        if not columns:
-            return
 
-        cpf_clean = cpf.replace('.', '').replace('-', '').strip()
-        cpf_col = _detect_column(columns, ["cpf", "cpf_funcionario", "cpf_colaborador", "cpf_colab"])
-        empresa_col = _detect_column(columns, ["id_empresa", "empresa_id", "company_id", "idempresa", "empresa"])
-        senha_col = _detect_column(columns, ["senha", "password_hash", "hash_senha"])
-        nome_col = _detect_column(columns, ["nome", "name"])
+        cpf_clean = normalize_cpf(cpf)
+        cpf_col = schema_cache.resolve_column("funcionarios", "cpf")
+        empresa_col = schema_cache.resolve_column("funcionarios", "empresa")
+        senha_col = schema_cache.resolve_column("funcionarios", "senha")
+        nome_col = schema_cache.resolve_column("funcionarios", "nome")
 
         if not cpf_col or not empresa_col:
             return
@@ -142,83 +68,73 @@ def _sync_funcionarios_record(cpf, password_hash, company_id, name=None):
         except (ValueError, TypeError):
             empresa_val = company_id
 
-        conn = get_connection()
-        cur = conn.cursor()
+        with db_connection() as conn:
+            cur = conn.cursor()
 
-        exists_query = (
-            sql.SQL(
-                "SELECT 1 FROM funcionarios WHERE {cpf_col} = %s AND {empresa_col} = %s LIMIT 1"
-            ).format(cpf_col=sql.Identifier(cpf_col), empresa_col=sql.Identifier(empresa_col))
-        )
-        cur.execute(exists_query, (cpf_clean, empresa_val))
-        exists = cur.fetchone()
-
-        if exists:
-            updates = []
-            params = []
-            if senha_col:
-                updates.append(sql.SQL("{col} = %s").format(col=sql.Identifier(senha_col)))
-                params.append(password_hash)
-            if nome_col and name:
-                updates.append(sql.SQL("{col} = %s").format(col=sql.Identifier(nome_col)))
-                params.append(name)
-
-            if updates:
-                params.extend([cpf_clean, empresa_val])
-                update_query = (
-                    sql.SQL("UPDATE funcionarios SET {updates} WHERE {cpf_col} = %s AND {empresa_col} = %s")
-                    .format(
-                        updates=sql.SQL(", ").join(updates),
-                        cpf_col=sql.Identifier(cpf_col),
-                        empresa_col=sql.Identifier(empresa_col),
+            exists_query = (
+                sql.SQL(
+                    "SELECT 1 FROM funcionarios WHERE {cpf_col} = %s AND {empresa_col} = %s LIMIT 1"
+                ).format(cpf_col=sql.Identifier(cpf_col), empresa_col=sql.Identifier(empresa_col))
+            )
+            cur.execute(exists_query, (cpf_clean, empresa_val))
+            exists = cur.fetchone()
+
+            if exists:
+                updates = []
+                params = []
+                if senha_col:
+                    updates.append(sql.SQL("{col} = %s").format(col=sql.Identifier(senha_col)))
+                    params.append(password_hash)
+                if nome_col and name:
+                    updates.append(sql.SQL("{col} = %s").format(col=sql.Identifier(nome_col)))
+                    params.append(name)
+
+                if updates:
+                    params.extend([cpf_clean, empresa_val])
+                    update_query = (
+                        sql.SQL("UPDATE funcionarios SET {updates} WHERE {cpf_col} = %s AND {empresa_col} = %s")
+                        .format(
+                            updates=sql.SQL(", ").join(updates),
+                            cpf_col=sql.Identifier(cpf_col),
+                            empresa_col=sql.Identifier(empresa_col),
+                        )
                     )
+                    cur.execute(update_query, params)
+            else:
+                insert_cols = [sql.Identifier(cpf_col), sql.Identifier(empresa_col)]
+                values = [cpf_clean, empresa_val]
+                placeholders = [sql.Placeholder(), sql.Placeholder()]
+
+                if senha_col:
+                    insert_cols.append(sql.Identifier(senha_col))
+                    values.append(password_hash)
+                    placeholders.append(sql.Placeholder())
+
+                if nome_col and name:
+                    insert_cols.append(sql.Identifier(nome_col))
+                    values.append(name)
+                    placeholders.append(sql.Placeholder())
+
+                insert_query = (
+                    sql.SQL("INSERT INTO funcionarios ({cols}) VALUES ({placeholders})")
+                    .format(cols=sql.SQL(", ").join(insert_cols), placeholders=sql.SQL(", ").join(placeholders))
                 )
-                cur.execute(update_query, params)
-        else:
-            insert_cols = [sql.Identifier(cpf_col), sql.Identifier(empresa_col)]
-            values = [cpf_clean, empresa_val]
-            placeholders = [sql.Placeholder(), sql.Placeholder()]
-
-            if senha_col:
-                insert_cols.append(sql.Identifier(senha_col))
-                values.append(password_hash)
-                placeholders.append(sql.Placeholder())
-
-            if nome_col and name:
-                insert_cols.append(sql.Identifier(nome_col))
-                values.append(name)
-                placeholders.append(sql.Placeholder())
-
-            insert_query = (
-                sql.SQL("INSERT INTO funcionarios ({cols}) VALUES ({placeholders})")
-                .format(cols=sql.SQL(", ").join(insert_cols), placeholders=sql.SQL(", ").join(placeholders))
-            )
-            cur.execute(insert_query, values)
+                cur.execute(insert_query, values)
 
-        conn.commit()
-        cur.close()
+            conn.commit()
+            cur.close()
     except psycopg2.Error as e:
-        if conn:
-            conn.rollback()
-        print(f"Erro ao sincronizar funcionarios: {e}")
-    finally:
-        if conn:
-            return_connection(conn)
+        log.error("Erro ao sincronizar funcionarios", error=str(e))
 
 
 def _delete_funcionarios_record(cpf, company_id):
     """
     Remove o vínculo do funcionário na tabela funcionarios (se existir).
     """
-    conn = None
     try:
         _ensure_funcionarios_table()
-        columns = _get_table_columns("funcionarios")
-        if not columns:
-            return
-
-        cpf_col = _detect_column(columns, ["cpf", "cpf_funcionario", "cpf_colaborador", "cpf_colab"])
-        empresa_col = _detect_column(columns, ["id_empresa", "empresa_id", "company_id", "idempresa", "empresa"])
+        cpf_col = schema_cache.resolve_column("funcionarios", "cpf")
+        empresa_col = schema_cache.resolve_column("funcionarios", "empresa")
 
         if not cpf_col or not empresa_col:
             return
@@ -228,39 +144,29 @@ def _delete_funcionarios_record(cpf, company_id):
         except (ValueError, TypeError):
             empresa_val = company_id
 
-        conn = get_connection()
-        cur = conn.cursor()
-        delete_query = (
-            sql.SQL("DELETE FROM funcionarios WHERE {cpf_col} = %s AND {empresa_col} = %s")
-            .format(cpf_col=sql.Identifier(cpf_col), empresa_col=sql.Identifier(empresa_col))
-        )
-        cur.execute(delete_query, (cpf, empresa_val))
-        conn.commit()
-        cur.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            delete_query = (
+                sql.SQL("DELETE FROM funcionarios WHERE {cpf_col} = %s AND {empresa_col} = %s")
+                .format(cpf_col=sql.Identifier(cpf_col), empresa_col=sql.Identifier(empresa_col))
+            )
+            cur.execute(delete_query, (cpf, empresa_val))
+            conn.commit()
+            cur.close()
     except psycopg2.Error as e:
-        if conn:
-            conn.rollback()
-        print(f"Erro ao remover funcionário da tabela funcionarios: {e}")
-    finally:
-        if conn:
-            return_connection(conn)
+        log.error("Erro ao remover funcionário da tabela funcionarios", error=str(e))
 
 
 def _get_employees_from_funcionarios(company_id):
     """
     Retorna funcionários a partir da tabela funcionarios para cenários legados.
     """
-    conn = None
     try:
         _ensure_funcionarios_table()
-        columns = _get_table_columns("funcionarios")
-        if not columns:
-            return []
-
-        id_col = _detect_column(columns, ["id", "id_funcionario", "funcionario_id"])
-        cpf_col = _detect_column(columns, ["cpf", "cpf_funcionario", "cpf_colaborador", "cpf_colab"])
-        empresa_col = _detect_column(columns, ["id_empresa", "empresa_id", "company_id", "idempresa", "empresa"])
-        nome_col = _detect_column(columns, ["nome", "name"])
+        id_col = schema_cache.resolve_column("funcionarios", "id")
+        cpf_col = schema_cache.resolve_column("funcionarios", "cpf")
+        empresa_col = schema_cache.resolve_column("funcionarios", "empresa")
+        nome_col = schema_cache.resolve_column("funcionarios", "nome")
 
         if not cpf_col or not empresa_col:
             return []
@@ -287,157 +193,153 @@ def _get_employees_from_funcionarios(company_id):
             select_parts.append(sql.Identifier(nome_col))
             order.append("nome")
 
-        conn = get_connection()
-        cur = conn.cursor()
-        query = (
-            sql.SQL("SELECT {cols} FROM funcionarios WHERE {empresa_col} = %s")
-            .format(cols=sql.SQL(", ").join(select_parts), empresa_col=sql.Identifier(empresa_col))
-        )
-        cur.execute(query, (empresa_val,))
-        rows = cur.fetchall()
-        cur.close()
-
-        employees = []
-        for row in rows:
-            data = {key: row[idx] for idx, key in enumerate(order)}
-            employees.append(
-                {
-                    "id": data.get("id"),
-                    "nome": data.get("nome", f"Funcionário {str(data.get('cpf', ''))[:3]}"),
-                    "cpf": str(data.get("cpf", "")),
-                    "id_empresa": str(data.get("empresa")) if data.get("empresa") is not None else None,
-                }
+        with db_connection() as conn:
+            cur = conn.cursor()
+            query = (
+                sql.SQL("SELECT {cols} FROM funcionarios WHERE {empresa_col} = %s")
+                .format(cols=sql.SQL(", ").join(select_parts), empresa_col=sql.Identifier(empresa_col))
             )
-        return employees
+            cur.execute(query, (empresa_val,))
+            rows = cur.fetchall()
+            cur.close()
+
+            employees = []
+            for row in rows:
+                data = {key: row[idx] for idx, key in enumerate(order)}
+                employees.append(
+                    {
+                        "id": data.get("id"),
+                        "nome": data.get("nome", f"Funcionário {str(data.get('cpf', ''))[:3]}"),
+                        "cpf": str(data.get("cpf", "")),
+                        "id_empresa": str(data.get("empresa")) if data.get("empresa") is not None else None,
+                    }
+                )
+            return employees
     except psycopg2.Error as e:
-        print(f"Erro ao buscar funcionários na tabela funcionarios: {e}")
+        log.error("Erro ao buscar funcionários na tabela funcionarios", error=str(e))
         return []
-    finally:
-        if conn:
-            return_connection(conn)
 
 def hash_password(password):
-    """Gera hash da senha"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Gera hash da senha (scrypt com salt, ver passwords.py)"""
+    return passwords.hash_password(password)
 
 # ==================== OPERAÇÕES DE USUÁRIOS (CHEFES E FUNCIONÁRIOS) ====================
 
+# Colunas lidas da tabela usuario e a chave correspondente no dicionário retornado
+_USER_FIELDS = [
+    ('id', 'id'),
+    ('nome', 'nome'),
+    ('cpf', 'cpf'),
+    ('senha', 'password_hash'),
+    ('tipo_acesso', 'tipo_acesso'),
+]
+
+
+def _build_user_lookup():
+    """
+    Monta a busca de usuário por CPF a partir das colunas existentes.
+
+    Usuário e empresa saem de uma única consulta: quando usuario não tem a empresa, uma
+    subconsulta na tabela funcionarios (se existir) traz o vínculo na mesma ida ao banco,
+    assim como as empresas do chefe (empresa_chefe).
+    """
+    columns = schema_cache.get_table_columns('usuario')
+
+    select_cols = []
+    keys = []
+    for col_name, key in _USER_FIELDS:
+        if col_name in columns:
+            select_cols.append(sql.SQL("u.{}").format(sql.Identifier(col_name)))
+            keys.append(key)
+
+    # Tentar variações do nome da coluna de empresa
+    id_empresa_col = schema_cache.resolve_column('usuario', 'empresa')
+    if id_empresa_col:
+        select_cols.append(sql.SQL("u.{}").format(sql.Identifier(id_empresa_col)))
+        keys.append('id_empresa')
+
+    if not select_cols:
+        return None
+
+    # Empresa pela tabela funcionarios (estruturas antigas), avaliada só se usuario não tiver uma
+    funcionarios_cpf_col = schema_cache.resolve_column('funcionarios', 'cpf')
+    funcionarios_empresa_col = schema_cache.resolve_column('funcionarios', 'empresa')
+    if funcionarios_cpf_col and funcionarios_empresa_col:
+        fallback = sql.SQL("(SELECT f.{empresa} FROM funcionarios f WHERE f.{cpf} = %(cpf)s LIMIT 1)").format(
+            empresa=sql.Identifier(funcionarios_empresa_col),
+            cpf=sql.Identifier(funcionarios_cpf_col),
+        )
+        if id_empresa_col:
+            fallback = sql.SQL("CASE WHEN u.{col} IS NULL THEN {fallback} END").format(
+                col=sql.Identifier(id_empresa_col),
+                fallback=fallback,
+            )
+        select_cols.append(fallback)
+        keys.append('empresa_funcionarios')
+
+    # Empresas do chefe (migração 011), também na mesma consulta
+    if schema_cache.get_table_columns('empresa_chefe'):
+        select_cols.append(sql.SQL(
+            "(SELECT json_agg(json_build_object('id', c.id_empresa, 'name', c.nome) ORDER BY c.id_empresa)"
+            " FROM empresa_chefe c WHERE c.chefe_cpf = %(cpf)s)"
+        ))
+        keys.append('empresas_chefe')
+
+    # Durante a transição dos CPFs a coluna gerada cpf_normalizado (se existir) é a indexada
+    cpf_col = 'cpf_normalizado' if 'cpf_normalizado' in columns else 'cpf'
+    return {
+        'keys': keys,
+        'query': sql.SQL("SELECT {cols} FROM usuario u WHERE u.{cpf_col} = %(cpf)s").format(
+            cols=sql.SQL(', ').join(select_cols),
+            cpf_col=sql.Identifier(cpf_col),
+        ),
+    }
+
+
 def get_user_by_cpf(cpf):
     """Busca usuário por CPF (pode ser chefe ou funcionário)"""
-    conn = None
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        # Remover formatação do CPF se houver
-        cpf_clean = cpf.replace('.', '').replace('-', '').strip()
-        
-        # Primeiro, descobrir quais colunas existem na tabela
-        cur.execute("""
-            SELECT column_name 
-            FROM information_schema.columns
-            WHERE table_name = 'usuario'
-            ORDER BY ordinal_position;
-        """)
-        columns = [row[0] for row in cur.fetchall()]
-        
-        # Construir SELECT dinamicamente baseado nas colunas que existem
-        select_cols = []
-        if 'id' in columns:
-            select_cols.append('id')
-        if 'nome' in columns:
-            select_cols.append('nome')
-        if 'cpf' in columns:
-            select_cols.append('cpf')
-        if 'senha' in columns:
-            select_cols.append('senha')
-        if 'tipo_acesso' in columns:
-            select_cols.append('tipo_acesso')
-        # Tentar variações do nome da coluna de empresa
-        id_empresa_col = None
-        for col_name in ['id_empresa', 'empresa_id', 'empresa', 'company_id']:
-            if col_name in columns:
-                id_empresa_col = col_name
-                select_cols.append(col_name)
-                break
-        
-        if not select_cols:
-            print("❌ Nenhuma coluna encontrada na tabela usuario")
-            cur.close()
-            return None
+    try:
+        cpf_clean = normalize_cpf(cpf)
         
-        # Construir query
-        query = f"SELECT {', '.join(select_cols)} FROM usuario WHERE cpf = %s"
-        cur.execute(query, (cpf_clean,))
-        result = cur.fetchone()
+        # Consulta montada uma única vez a partir das colunas existentes na tabela
+        lookup = schema_cache.get_statement('usuario.busca_por_cpf', _build_user_lookup)
+        if lookup is None:
+            log.error("Nenhuma coluna encontrada na tabela usuario")
+            return None
         
-        # Se não encontrou, tentar buscar com LIKE (caso o CPF no banco tenha formatação)
-        if not result:
-            cpf_formatado = f"{cpf_clean[:3]}.{cpf_clean[3:6]}.{cpf_clean[6:9]}-{cpf_clean[9:]}"
-            query_like = f"SELECT {', '.join(select_cols)} FROM usuario WHERE cpf LIKE %s OR cpf = %s"
-            cur.execute(query_like, (f"%{cpf_clean}%", cpf_formatado))
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(lookup['query'], {'cpf': cpf_clean})
             result = cur.fetchone()
-        
-        cur.close()
+            cur.close()
         
         if result:
             # Mapear resultados para dicionário
-            user_dict = {}
-            idx = 0
-            if 'id' in select_cols:
-                user_dict['id'] = result[idx]
-                idx += 1
-            if 'nome' in select_cols:
-                user_dict['nome'] = result[idx]
-                idx += 1
-            if 'cpf' in select_cols:
-                user_dict['cpf'] = result[idx]
-                idx += 1
-            if 'senha' in select_cols:
-                user_dict['password_hash'] = result[idx]
-                idx += 1
-            if 'tipo_acesso' in select_cols:
-                user_dict['tipo_acesso'] = result[idx] if result[idx] else None
-                idx += 1
-            if id_empresa_col and id_empresa_col in select_cols:
-                user_dict['id_empresa'] = result[idx] if result[idx] else None
-            else:
-                user_dict['id_empresa'] = None
+            user_dict = dict(zip(lookup['keys'], result))
+            if 'tipo_acesso' in user_dict:
+                user_dict['tipo_acesso'] = user_dict['tipo_acesso'] if user_dict['tipo_acesso'] else None
+            user_dict['id_empresa'] = user_dict.get('id_empresa') if user_dict.get('id_empresa') else None
+
+            # Vínculo encontrado em funcionarios na mesma consulta
+            fallback_empresa = user_dict.pop('empresa_funcionarios', None)
+            if user_dict['id_empresa'] is None and fallback_empresa is not None:
+                user_dict['id_empresa'] = fallback_empresa
 
-            if user_dict.get('id_empresa') is None:
-                fallback_empresa = _get_company_from_funcionarios(cpf_clean)
-                if fallback_empresa is not None:
-                    user_dict['id_empresa'] = fallback_empresa
+            user_dict['companies'] = user_dict.pop('empresas_chefe', None) or []
             
             return user_dict
         return None
     except psycopg2.Error as e:
-        print(f"Erro ao buscar usuário: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Erro ao buscar usuário", error=str(e))
         return None
-    finally:
-        if conn:
-            return_connection(conn)
 
 def create_user(cpf, password_hash, name, email=None, tipo_acesso='chefe', id_empresa=None):
     """Cria um novo usuário"""
-    conn = None
     try:
-        conn = get_connection()
-        cur = conn.cursor()
+        cpf_clean = normalize_cpf(cpf)
         
-        # Remover formatação do CPF
-        cpf_clean = cpf.replace('.', '').replace('-', '').strip()
-        
-        # Descobrir quais colunas existem na tabela
-        cur.execute("""
-            SELECT column_name 
-            FROM information_schema.columns
-            WHERE table_name = 'usuario'
-            ORDER BY ordinal_position;
-        """)
-        columns = [row[0] for row in cur.fetchall()]
+        # Colunas existentes vêm do cache de esquema
+        columns = schema_cache.get_table_columns('usuario')
         
         # Construir INSERT dinamicamente
         insert_cols = []
@@ -461,15 +363,10 @@ def create_user(cpf, password_hash, name, email=None, tipo_acesso='chefe', id_em
             insert_values.append(tipo_acesso)
         
         # Adicionar id_empresa se a coluna existir E id_empresa foi fornecido
-        id_empresa_col = None
-        for col_name in ['id_empresa', 'empresa_id', 'empresa', 'company_id']:
-            if col_name in columns:
-                id_empresa_col = col_name
-                # Só adicionar se id_empresa foi fornecido (não None)
-                if id_empresa is not None:
-                    insert_cols.append(col_name)
-                    insert_values.append(id_empresa)
-                break
+        id_empresa_col = schema_cache.resolve_column('usuario', 'empresa')
+        if id_empresa_col and id_empresa is not None:
+            insert_cols.append(id_empresa_col)
+            insert_values.append(id_empresa)
         
         # Adicionar email se a coluna existir e email foi fornecido
         if email and 'email' in columns:
@@ -477,92 +374,133 @@ def create_user(cpf, password_hash, name, email=None, tipo_acesso='chefe', id_em
             insert_values.append(email)
         
         if not insert_cols:
-            print("❌ Nenhuma coluna válida para inserção")
-            cur.close()
+            log.error("Nenhuma coluna válida para inserção")
             return False
         
         # Construir query INSERT
-        placeholders = ', '.join(['%s'] * len(insert_values))
-        query = f"INSERT INTO usuario ({', '.join(insert_cols)}) VALUES ({placeholders}) RETURNING id"
+        query = sql.SQL("INSERT INTO usuario ({cols}) VALUES ({placeholders}) RETURNING id").format(
+            cols=sql.SQL(', ').join(sql.Identifier(col) for col in insert_cols),
+            placeholders=sql.SQL(', ').join(sql.Placeholder() * len(insert_values)),
+        )
         
-        cur.execute(query, insert_values)
-        user_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        return True
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, insert_values)
+            user_id = cur.fetchone()[0]
+            conn.commit()
+            cur.close()
+            return True
     except psycopg2.IntegrityError as e:
-        print(f"Erro de integridade: {e}")
-        if conn:
-            conn.rollback()
+        log.warning("Erro de integridade", error=str(e))
         return False  # Usuário já existe
     except psycopg2.Error as e:
-        print(f"Erro ao criar usuário: {e}")
-        if conn:
-            conn.rollback()
+        log.error("Erro ao criar usuário", error=str(e))
         return False
-    finally:
-        if conn:
-            return_connection(conn)
+
+def update_user_password_hash(cpf, old_hash, new_hash):
+    """
+    Regrava o hash da senha do usuário (ex.: migração de SHA-256 para scrypt).
+    `cpf` deve ser o valor gravado no banco (como retornado por get_user_by_cpf).
+    Só altera se o hash ainda for `old_hash`, para não sobrescrever uma troca de senha concorrente.
+    """
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE usuario SET senha = %s WHERE cpf = %s AND senha = %s",
+                (new_hash, cpf, old_hash)
+            )
+            updated = cur.rowcount > 0
+            conn.commit()
+            cur.close()
+            return updated
+    except psycopg2.Error as e:
+        log.error("Erro ao atualizar hash da senha", error=str(e))
+        return False
+
+# ==================== VERSÃO DOS DADOS ====================
+
+def _company_key(company_id):
+    # Mesmo texto gravado pelos triggers ('01' e 1 são a mesma empresa)
+    try:
+        return str(int(company_id))
+    except (ValueError, TypeError):
+        return str(company_id)
+
+def get_data_version(namespace, company_id):
+    """
+    Versão dos dados da empresa no grupo (ex.: 'produtos'), mantida pelos triggers da
+    migração 010: muda a cada escrita, feita por qualquer processo. Retorna 0 para empresas
+    ainda sem escritas e None em caso de erro.
+    """
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT versao FROM versao_dados WHERE grupo = %s AND id_empresa = %s",
+                (namespace, _company_key(company_id))
+            )
+            result = cur.fetchone()
+            cur.close()
+        return result[0] if result else 0
+    except psycopg2.Error as e:
+        log.error("Erro ao buscar versão dos dados", namespace=namespace, error=str(e))
+        return None
+
+def get_current_data_version(namespace, company_id):
+    """
+    get_data_version sem ir ao banco se o processo leu a versão há menos de
+    cache.CACHE_VERSION_TTL segundos; escritas deste processo a descartam na hora.
+    """
+    return cache.current_version(namespace, company_id, lambda: get_data_version(namespace, company_id))
 
 # ==================== OPERAÇÕES DE FUNCIONÁRIOS ====================
 
+# Namespace de versão da listagem de funcionários (usado nas ETags); escritas invalidam a empresa
+EMPLOYEE_CACHE_NAMESPACE = 'funcionarios'
+
+def _build_employees_query():
+    """Monta a consulta de funcionários por empresa a partir das colunas existentes"""
+    columns = schema_cache.get_table_columns('usuario')
+    id_empresa_col = schema_cache.resolve_column('usuario', 'empresa')
+
+    conditions = []
+    if id_empresa_col:
+        conditions.append(sql.SQL("{col} = %s").format(col=sql.Identifier(id_empresa_col)))
+    if 'tipo_acesso' in columns:
+        conditions.append(sql.SQL("tipo_acesso = 'funcionario'"))
+
+    # Sem coluna de empresa nem tipo_acesso não há como filtrar funcionários
+    if not conditions:
+        return None
+
+    query = sql.SQL("SELECT id, nome, cpf FROM usuario WHERE {where}").format(
+        where=sql.SQL(' AND ').join(conditions)
+    )
+    return {'query': query, 'by_company': id_empresa_col is not None}
+
+
 def get_employees_by_company(company_id):
     """Busca todos os funcionários de uma empresa"""
-    conn = None
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        # Descobrir quais colunas existem
-        cur.execute("""
-            SELECT column_name 
-            FROM information_schema.columns
-            WHERE table_name = 'usuario'
-            ORDER BY ordinal_position;
-        """)
-        columns = [row[0] for row in cur.fetchall()]
-        
-        # Verificar se id_empresa existe
-        id_empresa_col = None
-        for col_name in ['id_empresa', 'empresa_id', 'empresa', 'company_id']:
-            if col_name in columns:
-                id_empresa_col = col_name
-                break
-        
-        # Se não tem coluna de empresa, retornar vazio ou todos os funcionários
-        if not id_empresa_col:
-            # Se não tem coluna de empresa, buscar apenas por tipo_acesso
-            if 'tipo_acesso' in columns:
-                cur.execute(
-                    "SELECT id, nome, cpf FROM usuario WHERE tipo_acesso = 'funcionario'"
-                )
-            else:
-                # Se não tem tipo_acesso, retornar vazio
-                cur.close()
-                return []
-        else:
-            # Converter company_id para int se possível
-            try:
-                company_id_int = int(company_id)
-            except (ValueError, TypeError):
-                company_id_int = company_id
-            
-            if 'tipo_acesso' in columns:
-                cur.execute(
-                    f"SELECT id, nome, cpf FROM usuario WHERE {id_empresa_col} = %s AND tipo_acesso = 'funcionario'",
-                    (company_id_int,)
-                )
-            else:
-                cur.execute(
-                    f"SELECT id, nome, cpf FROM usuario WHERE {id_empresa_col} = %s",
-                    (company_id_int,)
-                )
-        
-        results = cur.fetchall()
-        cur.close()
+    try:
+        plan = schema_cache.get_statement('usuario.funcionarios_por_empresa', _build_employees_query)
+        if plan is None:
+            return []
+
+        # Converter company_id para int se possível
+        try:
+            company_id_int = int(company_id)
+        except (ValueError, TypeError):
+            company_id_int = company_id
+
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(plan['query'], (company_id_int,) if plan['by_company'] else None)
+            results = cur.fetchall()
+            cur.close()
         
         employees = []
-        if id_empresa_col:
+        if plan['by_company']:
             for result in results:
                 employees.append({
                     'id': result[0],
@@ -583,11 +521,8 @@ def get_employees_by_company(company_id):
                 })
         return employees
     except psycopg2.Error as e:
-        print(f"Erro ao buscar funcionários: {e}")
+        log.error("Erro ao buscar funcionários", error=str(e))
         return []
-    finally:
-        if conn:
-            return_connection(conn)
 
 def get_employee_by_cpf(cpf, company_id=None):
     """Busca funcionário por CPF"""
@@ -625,302 +560,678 @@ def create_employee(cpf, password_hash, company_id, name=None):
 
     if success:
         _sync_funcionarios_record(cpf, password_hash, company_id_int, display_name)
+        cache.invalidate(EMPLOYEE_CACHE_NAMESPACE, company_id)
 
     return success
 
+def _build_delete_employee_query():
+    """Monta o DELETE de funcionário a partir das colunas existentes"""
+    columns = schema_cache.get_table_columns('usuario')
+
+    # Construir WHERE dinamicamente
+    where_conditions = [sql.SQL("cpf = %s")]
+
+    # Adicionar tipo_acesso se existir
+    if 'tipo_acesso' in columns:
+        where_conditions.append(sql.SQL("tipo_acesso = 'funcionario'"))
+
+    # Adicionar id_empresa se existir
+    id_empresa_col = schema_cache.resolve_column('usuario', 'empresa')
+    if id_empresa_col:
+        where_conditions.append(sql.SQL("{col} = %s").format(col=sql.Identifier(id_empresa_col)))
+
+    query = sql.SQL("DELETE FROM usuario WHERE {where}").format(where=sql.SQL(' AND ').join(where_conditions))
+    return {'query': query, 'by_company': id_empresa_col is not None}
+
+
 def delete_employee(cpf, company_id):
     """Exclui um funcionário"""
-    conn = None
     try:
-        conn = get_connection()
-        cur = conn.cursor()
+        cpf_clean = normalize_cpf(cpf)
         
-        # Remover formatação do CPF
-        cpf_clean = cpf.replace('.', '').replace('-', '').strip()
+        plan = schema_cache.get_statement('usuario.exclui_funcionario', _build_delete_employee_query)
+        where_params = [cpf_clean]
+        if plan['by_company']:
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
+            where_params.append(company_id_int)
         
-        # Descobrir quais colunas existem
-        cur.execute("""
-            SELECT column_name 
-            FROM information_schema.columns
-            WHERE table_name = 'usuario'
-            ORDER BY ordinal_position;
-        """)
-        columns = [row[0] for row in cur.fetchall()]
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(plan['query'], where_params)
         
-        # Construir WHERE dinamicamente
-        where_conditions = ["cpf = %s"]
-        where_params = [cpf_clean]
+            if cur.rowcount == 0:
+                cur.close()
+                return False  # Funcionário não encontrado
         
-        # Adicionar tipo_acesso se existir
-        if 'tipo_acesso' in columns:
-            where_conditions.append("tipo_acesso = 'funcionario'")
-        
-        # Adicionar id_empresa se existir
-        id_empresa_col = None
-        for col_name in ['id_empresa', 'empresa_id', 'empresa', 'company_id']:
-            if col_name in columns:
-                id_empresa_col = col_name
-                try:
-                    company_id_int = int(company_id)
-                except (ValueError, TypeError):
-                    company_id_int = company_id
-                where_conditions.append(f"{col_name} = %s")
-                where_params.append(company_id_int)
-                break
-        
-        query = f"DELETE FROM usuario WHERE {' AND '.join(where_conditions)}"
-        cur.execute(query, where_params)
-        
-        if cur.rowcount == 0:
+            conn.commit()
+            cache.invalidate(EMPLOYEE_CACHE_NAMESPACE, company_id)
             cur.close()
-            return False  # Funcionário não encontrado
-        
-        conn.commit()
-        cur.close()
-        return True
+            return True
     except psycopg2.Error as e:
-        print(f"Erro ao excluir funcionário: {e}")
-        if conn:
-            conn.rollback()
+        log.error("Erro ao excluir funcionário", error=str(e))
         return False
-    finally:
-        if conn:
-            return_connection(conn)
 
 # ==================== OPERAÇÕES DE EMPRESAS ====================
 
 def get_company(company_id):
     """Busca informações de uma empresa"""
-    conn = None
     try:
-        conn = get_connection()
-        cur = conn.cursor()
+        with db_connection() as conn:
+            cur = conn.cursor()
         
-        # Tentar buscar em uma tabela empresa, se existir
-        # Se não existir, retornar None (a empresa será identificada pelo id_empresa)
-        try:
-            cur.execute(
-                "SELECT id, nome FROM empresa WHERE id = %s",
-                (company_id,)
-            )
-            result = cur.fetchone()
-            if result:
-                return {
-                    'id': result[0],
-                    'name': result[1]
-                }
-        except psycopg2.Error:
-            # Tabela empresa pode não existir, isso é ok
-            pass
+            # Empresas dos chefes (migração 011) ou, em estruturas antigas, uma tabela empresa
+            # Se nenhuma existir, retornar None (a empresa será identificada pelo id_empresa)
+            if schema_cache.get_table_columns('empresa_chefe'):
+                query = "SELECT id_empresa, nome FROM empresa_chefe WHERE id_empresa = %s"
+            else:
+                query = "SELECT id, nome FROM empresa WHERE id = %s"
+            try:
+                cur.execute(query, (company_id,))
+                result = cur.fetchone()
+                if result:
+                    return {
+                        'id': result[0],
+                        'name': result[1]
+                    }
+            except psycopg2.Error:
+                # Tabela empresa pode não existir, isso é ok
+                pass
         
-        cur.close()
-        return None
+            cur.close()
+            return None
     except psycopg2.Error as e:
-        print(f"Erro ao buscar empresa: {e}")
+        log.error("Erro ao buscar empresa", error=str(e))
         return None
-    finally:
-        if conn:
-            return_connection(conn)
 
-# ==================== OPERAÇÕES DE PRODUTOS ====================
+def create_company(chefe_cpf, name, max_companies):
+    """
+    Registra uma nova empresa do chefe (migração 011) se ele tiver menos de `max_companies`.
+    A contagem é feita no banco, na transação do INSERT e sob um bloqueio por chefe, para
+    que criações simultâneas (ou com tokens antigos) não passem do limite.
+    Retorna ((empresa, ids de todas as empresas do chefe), None) ou (None, 'limit' | 'error').
+    """
+    cpf_clean = normalize_cpf(chefe_cpf)
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"empresa_chefe:{cpf_clean}",))
+            cur.execute(
+                """
+                INSERT INTO empresa_chefe (chefe_cpf, nome)
+                SELECT %s, %s
+                WHERE (SELECT COUNT(*) FROM empresa_chefe WHERE chefe_cpf = %s) < %s
+                RETURNING id_empresa, nome
+                """,
+                (cpf_clean, name, cpf_clean, max_companies)
+            )
+            row = cur.fetchone()
+            if row is None:
+                conn.rollback()
+                cur.close()
+                return None, 'limit'
+            cur.execute(
+                "SELECT id_empresa FROM empresa_chefe WHERE chefe_cpf = %s ORDER BY id_empresa",
+                (cpf_clean,)
+            )
+            owned = [result[0] for result in cur.fetchall()]
+            conn.commit()
+            cur.close()
+        return ({'id': row[0], 'name': row[1]}, owned), None
+    except psycopg2.Error as e:
+        log.error("Erro ao criar empresa", error=str(e))
+        return None, 'error'
 
-def get_products_by_company(company_id):
-    """Busca todos os produtos de uma empresa"""
-    conn = None
+def rename_company(chefe_cpf, company_id, name):
+    """Renomeia uma empresa do chefe. Retorna True se ela existia e pertence a ele"""
     try:
-        conn = get_connection()
-        cur = conn.cursor()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE empresa_chefe SET nome = %s WHERE id_empresa = %s AND chefe_cpf = %s",
+                (name, company_id, normalize_cpf(chefe_cpf))
+            )
+            updated = cur.rowcount == 1
+            conn.commit()
+            cur.close()
+        return updated
+    except psycopg2.Error as e:
+        log.error("Erro ao renomear empresa", error=str(e))
+        return False
+
+# ==================== OPERAÇÕES DE PRODUTOS ====================
+
+# Colunas lidas (e devolvidas via RETURNING) em todas as operações de produto
+PRODUCT_COLUMNS = "id, nome, quantidade, preco, id_empresa, versao, minimo"
+
+# Namespace do cache de leitura; toda escrita em produto invalida a empresa afetada
+PRODUCT_CACHE_NAMESPACE = 'produtos'
+
+# Tipos de movimentação de estoque (migrations/006_movimentacao.sql)
+MOVEMENT_TYPES = ('entrada', 'saida', 'ajuste')
+MOVEMENT_REASON_MAX_LENGTH = 255
+
+# Tipo, motivo e CPF de quem alterou o estoque, lidos pelo trigger que registra as
+# movimentações; valem até o fim da transação e seguem no mesmo envio do comando de escrita
+_MOVEMENT_CONTEXT = (
+    "SELECT set_config('estoque.movimento', %s, true), "
+    "set_config('estoque.motivo', %s, true), "
+    "set_config('estoque.usuario', %s, true);\n"
+)
+
+
+def _with_movement_context(query, params, kind=None, reason=None, user_cpf=None):
+    """Antepõe ao comando de escrita em produto o contexto das movimentações que ele gera"""
+    context = (kind or '', (reason or '')[:MOVEMENT_REASON_MAX_LENGTH], user_cpf or '')
+    return _MOVEMENT_CONTEXT + query, context + tuple(params)
+
+
+def _product_from_row(row):
+    """Converte uma linha com PRODUCT_COLUMNS no dicionário usado pela API"""
+    return {
+        'id': str(row[0]),
+        'name': row[1],
+        'quantity': row[2],
+        'value': float(row[3]),
+        'company_id': str(row[4]),
+        'version': row[5],
+        'minimum': row[6],
+        'low_stock': row[2] < row[6],
+        'created_at': None  # Se não houver created_at na tabela
+    }
+
+
+def _product_cache_version(company_id, version):
+    """Versão dos produtos da empresa exigida das entradas do cache (a do processo se não informada)"""
+    if version is not None:
+        return version
+    return get_current_data_version(PRODUCT_CACHE_NAMESPACE, company_id)
+
+
+def get_products_by_company(company_id, version=None):
+    """
+    Busca todos os produtos de uma empresa (lidos do cache quando possível).
+    `version` é a versão dos dados já lida pelo chamador (ex.: para a ETag), evitando relê-la.
+    """
+    def load():
+        with db_connection() as conn:
+            cur = conn.cursor()
+        
+            # Converter company_id para int se possível
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
         
+            cur.execute(
+                f"SELECT {PRODUCT_COLUMNS} FROM produto WHERE id_empresa = %s ORDER BY id",
+                (company_id_int,)
+            )
+            results = cur.fetchall()
+            cur.close()
+        
+            return [_product_from_row(result) for result in results]
+
+    try:
+        return cache.get_or_load(PRODUCT_CACHE_NAMESPACE, company_id, 'lista', load,
+                                 _product_cache_version(company_id, version))
+    except psycopg2.Error as e:
+        log.error("Erro ao buscar produtos", error=str(e))
+        return []
+
+# Linhas trazidas do cursor no servidor a cada ida ao banco durante a exportação
+EXPORT_BATCH_SIZE = 2000
+
+
+def iter_products_by_company(company_id, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Percorre os produtos da empresa com um cursor nomeado (no servidor), trazendo
+    `batch_size` linhas por vez: a memória usada não depende do tamanho do catálogo.
+    A conexão fica emprestada enquanto o gerador é consumido. Erros do banco são
+    propagados, pois parte da resposta pode já ter sido enviada.
+    """
+    # Converter company_id para int se possível
+    try:
+        company_id_int = int(company_id)
+    except (ValueError, TypeError):
+        company_id_int = company_id
+
+    with db_connection() as conn:
+        with conn.cursor(name='exportacao_produtos') as cur:
+            cur.itersize = batch_size
+            cur.execute(
+                f"SELECT {PRODUCT_COLUMNS} FROM produto WHERE id_empresa = %s ORDER BY id",
+                (company_id_int,)
+            )
+            for row in cur:
+                yield _product_from_row(row)
+        conn.commit()
+
+# Chaves de ordenação aceitas na listagem paginada -> coluna correspondente
+PRODUCT_SORT_COLUMNS = {
+    'id': 'id',
+    'name': 'nome',
+    'quantity': 'quantidade',
+    'value': 'preco',
+}
+
+
+def get_products_page(company_id, limit, sort='id', descending=False, after=None):
+    """
+    Busca uma página de produtos da empresa usando paginação por chave (keyset).
+
+    `after` é a posição do último item da página anterior: (valor_ordenacao, id).
+    Retorna (produtos, proxima_posicao) — proxima_posicao é None na última página.
+    """
+    try:
         # Converter company_id para int se possível
         try:
             company_id_int = int(company_id)
         except (ValueError, TypeError):
             company_id_int = company_id
         
-        cur.execute(
-            "SELECT id, nome, quantidade, preco, id_empresa FROM produto WHERE id_empresa = %s ORDER BY id",
-            (company_id_int,)
+        sort_col = PRODUCT_SORT_COLUMNS[sort]
+        direction = "DESC" if descending else "ASC"
+        comparison = "<" if descending else ">"
+        
+        where = "id_empresa = %s"
+        params = [company_id_int]
+        if after is not None:
+            after_value, after_id = after
+            if sort_col == 'id':
+                where += f" AND id {comparison} %s"
+                params.append(after_id)
+            else:
+                # Comparação de tupla segue exatamente a ordem (coluna, id) do ORDER BY
+                where += f" AND ({sort_col}, id) {comparison} (%s, %s)"
+                params.extend([after_value, after_id])
+        
+        order = "id" if sort_col == 'id' else f"{sort_col} {direction}, id"
+        query = (
+            f"SELECT {PRODUCT_COLUMNS} FROM produto WHERE {where} "
+            f"ORDER BY {order} {direction} LIMIT %s"
         )
-        results = cur.fetchall()
-        cur.close()
+        # Um item extra indica se existe próxima página
+        params.append(limit + 1)
         
-        products = []
-        for result in results:
-            products.append({
-                'id': str(result[0]),
-                'name': result[1],
-                'quantity': result[2],
-                'value': float(result[3]),
-                'company_id': str(result[4]),
-                'created_at': None  # Se não houver created_at na tabela
-            })
-        return products
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            results = cur.fetchall()
+            cur.close()
+        
+        has_more = len(results) > limit
+        results = results[:limit]
+        next_after = None
+        if has_more:
+            last = results[-1]
+            sort_value = {'id': last[0], 'nome': last[1], 'quantidade': last[2], 'preco': last[3]}[sort_col]
+            next_after = (str(sort_value) if sort_col == 'preco' else sort_value, last[0])
+        
+        return [_product_from_row(result) for result in results], next_after
     except psycopg2.Error as e:
-        print(f"Erro ao buscar produtos: {e}")
-        return []
-    finally:
-        if conn:
-            return_connection(conn)
+        log.error("Erro ao buscar página de produtos", error=str(e))
+        return [], None
 
-def get_product_by_name(company_id, name):
-    """Busca produto por nome na empresa"""
-    conn = None
+def get_inventory_stats(company_id):
+    """
+    Retorna os totais de estoque da empresa a partir do resumo mantido pelos triggers
+    de produto (uma leitura por chave primária, sem percorrer os produtos).
+    """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
         # Converter company_id para int se possível
         try:
             company_id_int = int(company_id)
         except (ValueError, TypeError):
             company_id_int = company_id
         
-        cur.execute(
-            "SELECT id, nome, quantidade, preco, id_empresa FROM produto WHERE id_empresa = %s AND nome = %s",
-            (company_id_int, name)
-        )
-        result = cur.fetchone()
-        cur.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT total_produtos, total_quantidade, valor_total, estoque_baixo, sem_estoque, atualizado_em
+                FROM produto_resumo WHERE id_empresa = %s
+                """,
+                (company_id_int,)
+            )
+            result = cur.fetchone()
+            cur.close()
         
-        if result:
-            return {
-                'id': str(result[0]),
-                'name': result[1],
-                'quantity': result[2],
-                'value': float(result[3]),
-                'company_id': str(result[4]),
-                'created_at': None
-            }
-        return None
+        if not result:
+            # Empresa sem produtos cadastrados ainda
+            result = (0, 0, 0, 0, 0, None)
+        
+        return {
+            'total_products': result[0],
+            'total_quantity': result[1],
+            'total_value': float(result[2]),
+            'low_stock': result[3],
+            'out_of_stock': result[4],
+            'updated_at': result[5].isoformat() if result[5] else None
+        }
     except psycopg2.Error as e:
-        print(f"Erro ao buscar produto: {e}")
+        log.error("Erro ao buscar resumo do estoque", error=str(e))
         return None
-    finally:
-        if conn:
-            return_connection(conn)
 
-def get_product_by_id(company_id, product_id):
-    """Busca produto por ID"""
-    conn = None
+
+# Modos de busca por nome aceitos em search_products
+PRODUCT_SEARCH_MODES = ('prefix', 'substring', 'fuzzy')
+
+
+def _escape_like(text):
+    """Escapa os curingas do LIKE para que o termo seja tratado literalmente"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_products(company_id, term, mode='substring', limit=50, offset=0):
+    """
+    Busca produtos da empresa pelo nome usando o índice de trigramas (pg_trgm).
+
+    - prefix: nomes que começam com o termo
+    - substring: nomes que contêm o termo
+    - fuzzy: nomes parecidos com o termo (tolera erros de digitação)
+
+    Os resultados vêm ordenados por relevância (similaridade) e paginados por limit/offset.
+    Retorna (produtos, tem_mais); cada produto inclui 'score'.
+    """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
         # Converter company_id para int se possível
         try:
             company_id_int = int(company_id)
         except (ValueError, TypeError):
             company_id_int = company_id
         
-        # Converter product_id para int se possível
-        try:
-            product_id_int = int(product_id)
-        except (ValueError, TypeError):
-            product_id_int = product_id
+        if mode == 'fuzzy':
+            condition = "%s <%% nome"
+            score = "word_similarity(%s, nome)"
+            params = [term, company_id_int, term]
+        else:
+            pattern = _escape_like(term) + '%'
+            if mode == 'substring':
+                pattern = '%' + pattern
+            condition = "nome ILIKE %s"
+            score = "similarity(nome, %s)"
+            params = [term, company_id_int, pattern]
         
-        cur.execute(
-            "SELECT id, nome, quantidade, preco, id_empresa FROM produto WHERE id = %s AND id_empresa = %s",
-            (product_id_int, company_id_int)
+        query = (
+            f"SELECT {PRODUCT_COLUMNS}, {score} AS score FROM produto "
+            f"WHERE id_empresa = %s AND {condition} "
+            f"ORDER BY score DESC, id LIMIT %s OFFSET %s"
         )
-        result = cur.fetchone()
-        cur.close()
+        # Um item extra indica se existe próxima página
+        params.extend([limit + 1, offset])
         
-        if result:
-            return {
-                'id': str(result[0]),
-                'name': result[1],
-                'quantity': result[2],
-                'value': float(result[3]),
-                'company_id': str(result[4]),
-                'created_at': None
-            }
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            results = cur.fetchall()
+            cur.close()
+        
+        products = []
+        for result in results[:limit]:
+            product = _product_from_row(result)
+            product['score'] = round(float(result[-1]), 4)
+            products.append(product)
+        return products, len(results) > limit
+    except psycopg2.Error as e:
+        log.error("Erro ao buscar produtos por nome", error=str(e))
+        return [], False
+
+def get_product_by_name(company_id, name, version=None):
+    """Busca produto por nome na empresa (lido do cache quando possível)"""
+    def load():
+        with db_connection() as conn:
+            cur = conn.cursor()
+        
+            # Converter company_id para int se possível
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
+        
+            cur.execute(
+                f"SELECT {PRODUCT_COLUMNS} FROM produto WHERE id_empresa = %s AND nome = %s",
+                (company_id_int, name)
+            )
+            result = cur.fetchone()
+            cur.close()
+        
+            if result:
+                return _product_from_row(result)
+            return None
+
+    try:
+        return cache.get_or_load(PRODUCT_CACHE_NAMESPACE, company_id, f"nome:{name}", load,
+                                 _product_cache_version(company_id, version))
+    except psycopg2.Error as e:
+        log.error("Erro ao buscar produto", error=str(e))
         return None
+
+def get_product_by_id(company_id, product_id, version=None):
+    """Busca produto por ID (lido do cache quando possível)"""
+    def load():
+        with db_connection() as conn:
+            cur = conn.cursor()
+        
+            # Converter company_id para int se possível
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
+        
+            # Converter product_id para int se possível
+            try:
+                product_id_int = int(product_id)
+            except (ValueError, TypeError):
+                product_id_int = product_id
+        
+            cur.execute(
+                f"SELECT {PRODUCT_COLUMNS} FROM produto WHERE id = %s AND id_empresa = %s",
+                (product_id_int, company_id_int)
+            )
+            result = cur.fetchone()
+            cur.close()
+        
+            if result:
+                return _product_from_row(result)
+            return None
+
+    try:
+        return cache.get_or_load(PRODUCT_CACHE_NAMESPACE, company_id, f"id:{product_id}", load,
+                                 _product_cache_version(company_id, version))
     except psycopg2.Error as e:
-        print(f"Erro ao buscar produto: {e}")
+        log.error("Erro ao buscar produto", error=str(e))
         return None
-    finally:
-        if conn:
-            return_connection(conn)
 
-def create_product(company_id, name, quantity, value):
-    """Cria um novo produto"""
-    conn = None
+def create_product(company_id, name, quantity, value, user_cpf=None):
+    """Cria um novo produto e devolve a linha gravada (mesma ida ao banco)"""
     try:
-        conn = get_connection()
-        cur = conn.cursor()
+        with db_connection() as conn:
+            cur = conn.cursor()
         
-        # Converter company_id para int se possível
-        try:
-            company_id_int = int(company_id)
-        except (ValueError, TypeError):
-            company_id_int = company_id
+            # Converter company_id para int se possível
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
         
-        cur.execute(
-            "INSERT INTO produto (nome, quantidade, preco, id_empresa) VALUES (%s, %s, %s, %s) RETURNING id",
-            (name, quantity, value, company_id_int)
-        )
-        product_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
+            cur.execute(*_with_movement_context(
+                f"INSERT INTO produto (nome, quantidade, preco, id_empresa) VALUES (%s, %s, %s, %s) RETURNING {PRODUCT_COLUMNS}",
+                (name, quantity, value, company_id_int),
+                user_cpf=user_cpf
+            ))
+            result = cur.fetchone()
+            conn.commit()
+            cache.invalidate(PRODUCT_CACHE_NAMESPACE, company_id)
+            cur.close()
         
-        # Buscar o produto criado para retornar
-        return get_product_by_id(company_id, product_id)
+            return _product_from_row(result)
     except psycopg2.Error as e:
-        print(f"Erro ao criar produto: {e}")
-        if conn:
-            conn.rollback()
+        log.error("Erro ao criar produto", error=str(e))
         return None
-    finally:
-        if conn:
-            return_connection(conn)
 
-def update_product_quantity(company_id, product_id, new_quantity):
-    """Atualiza a quantidade de um produto"""
-    conn = None
+def upsert_product(company_id, name, quantity, value, user_cpf=None, minimum=None):
+    """
+    Cria o produto ou, se já existir um com o mesmo nome na empresa, soma `quantity`
+    ao estoque atual (registrado como entrada), tudo em um único comando atômico.
+    `minimum` define o estoque mínimo (sem ele, o padrão da tabela ou o mínimo atual).
+    Requer a restrição UNIQUE (id_empresa, nome) (migrations/001_produto_nome_unico.sql).
+    Retorna (produto, criado) ou (None, None) em caso de erro.
+    """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
+        with db_connection() as conn:
+            cur = conn.cursor()
         
-        # Converter IDs para int se possível
-        try:
-            company_id_int = int(company_id)
-        except (ValueError, TypeError):
-            company_id_int = company_id
+            # Converter company_id para int se possível
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
         
-        try:
-            product_id_int = int(product_id)
-        except (ValueError, TypeError):
-            product_id_int = product_id
+            # Sem mínimo informado: o DEFAULT da coluna ao criar e o mínimo atual ao somar
+            params = [name, quantity, value, company_id_int]
+            if minimum is None:
+                minimum_value, minimum_update = "DEFAULT", ""
+            else:
+                minimum_value, minimum_update = "%s", ", minimo = EXCLUDED.minimo"
+                params.append(minimum)
+        
+            # xmax = 0 identifica linhas recém-inseridas (não atualizadas pelo ON CONFLICT)
+            cur.execute(*_with_movement_context(
+                f"""
+                INSERT INTO produto (nome, quantidade, preco, id_empresa, minimo)
+                VALUES (%s, %s, %s, %s, {minimum_value})
+                ON CONFLICT (id_empresa, nome)
+                DO UPDATE SET quantidade = produto.quantidade + EXCLUDED.quantidade{minimum_update}
+                RETURNING {PRODUCT_COLUMNS}, (xmax = 0) AS inserido
+                """,
+                params,
+                kind='entrada',
+                user_cpf=user_cpf
+            ))
+            result = cur.fetchone()
+            conn.commit()
+            cache.invalidate(PRODUCT_CACHE_NAMESPACE, company_id)
+            cur.close()
         
-        cur.execute(
-            "UPDATE produto SET quantidade = %s WHERE id = %s AND id_empresa = %s",
-            (new_quantity, product_id_int, company_id_int)
-        )
+            return _product_from_row(result), result[-1]
+    except psycopg2.Error as e:
+        log.error("Erro ao cadastrar/somar produto", error=str(e))
+        return None, None
+
+def bulk_upsert_products(company_id, csv_file, user_cpf=None):
+    """
+    Importa produtos em lote: carrega `csv_file` via COPY em uma tabela temporária e
+    consolida em produto com um único upsert (quantidades somadas, inclusive entre
+    linhas repetidas do próprio arquivo; o valor da primeira ocorrência vale para produtos novos).
+    `csv_file` deve conter linhas CSV sem cabeçalho: linha, nome, quantidade, preco.
+    As entradas de todo o lote são registradas em movimentacao por uma única inserção.
+    Retorna {'created': n, 'updated': m} ou None em caso de erro.
+    """
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
         
-        if cur.rowcount == 0:
-            cur.close()
-            return None
+            # Converter company_id para int se possível
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
         
-        conn.commit()
-        cur.close()
+            cur.execute(
+                """
+                CREATE TEMP TABLE produto_importacao (
+                    linha INTEGER,
+                    nome VARCHAR(100),
+                    quantidade INTEGER,
+                    preco NUMERIC(10, 2)
+                ) ON COMMIT DROP
+                """
+            )
+            cur.copy_expert(
+                "COPY produto_importacao (linha, nome, quantidade, preco) FROM STDIN WITH (FORMAT csv)",
+                csv_file
+            )
+            cur.execute(*_with_movement_context(
+                """
+                WITH gravados AS (
+                    INSERT INTO produto (nome, quantidade, preco, id_empresa)
+                    SELECT nome, SUM(quantidade), (ARRAY_AGG(preco ORDER BY linha))[1], %s
+                    FROM produto_importacao
+                    GROUP BY nome
+                    ON CONFLICT (id_empresa, nome)
+                    DO UPDATE SET quantidade = produto.quantidade + EXCLUDED.quantidade
+                    RETURNING (xmax = 0) AS inserido
+                )
+                SELECT COUNT(*) FILTER (WHERE inserido), COUNT(*) FILTER (WHERE NOT inserido)
+                FROM gravados
+                """,
+                (company_id_int,),
+                kind='entrada',
+                reason='importação em lote',
+                user_cpf=user_cpf
+            ))
+            created, updated = cur.fetchone()
+            conn.commit()
+            cache.invalidate(PRODUCT_CACHE_NAMESPACE, company_id)
+            cur.close()
         
-        return get_product_by_id(company_id, product_id)
+            return {'created': created, 'updated': updated}
     except psycopg2.Error as e:
-        print(f"Erro ao atualizar produto: {e}")
-        if conn:
-            conn.rollback()
+        log.error("Erro ao importar produtos em lote", error=str(e))
         return None
-    finally:
-        if conn:
-            return_connection(conn)
 
-def update_product(company_id, product_id, name=None, quantity=None, value=None):
-    """Atualiza um produto"""
-    conn = None
+def update_product_quantity(company_id, product_id, new_quantity, reason=None, user_cpf=None):
+    """Define a quantidade de um produto (registrada como ajuste) e devolve a linha atualizada"""
     try:
-        conn = get_connection()
-        cur = conn.cursor()
+        with db_connection() as conn:
+            cur = conn.cursor()
+        
+            # Converter IDs para int se possível
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
+        
+            try:
+                product_id_int = int(product_id)
+            except (ValueError, TypeError):
+                product_id_int = product_id
+        
+            cur.execute(*_with_movement_context(
+                f"UPDATE produto SET quantidade = %s WHERE id = %s AND id_empresa = %s RETURNING {PRODUCT_COLUMNS}",
+                (new_quantity, product_id_int, company_id_int),
+                kind='ajuste',
+                reason=reason,
+                user_cpf=user_cpf
+            ))
+            result = cur.fetchone()
+        
+            if result is None:
+                cur.close()
+                return None
+        
+            conn.commit()
+            cache.invalidate(PRODUCT_CACHE_NAMESPACE, company_id)
+            cur.close()
         
+            return _product_from_row(result)
+    except psycopg2.Error as e:
+        log.error("Erro ao atualizar produto", error=str(e))
+        return None
+
+def update_product(company_id, product_id, name=None, quantity=None, value=None,
+                   expected_version=None, reason=None, user_cpf=None, minimum=None):
+    """
+    Atualiza um produto (mudança de quantidade vira ajuste; cruzar o estoque mínimo gera
+    um alerta, avaliado pelo trigger só para esta linha). Com `expected_version` a
+    alteração só é aplicada se a versão gravada for a mesma; caso contrário a linha atual
+    (relida após o UPDATE) volta para o cliente refazer a edição.
+    Retorna (produto, None), (produto atual, 'conflict') ou (None, 'not_found' | 'error').
+    """
+    try:
         # Converter IDs para int se possível
         try:
             company_id_int = int(company_id)
@@ -944,40 +1255,203 @@ def update_product(company_id, product_id, name=None, quantity=None, value=None)
         if value is not None:
             updates.append("preco = %s")
             params.append(value)
+        if minimum is not None:
+            updates.append("minimo = %s")
+            params.append(minimum)
         
         if not updates:
-            cur.close()
-            return get_product_by_id(company_id, product_id)
-        
+            product = get_product_by_id(company_id, product_id)
+            if product is None:
+                return None, 'not_found'
+            if expected_version is not None and product['version'] != expected_version:
+                return product, 'conflict'
+            return product, None
+        
+        conditions = "id = %s AND id_empresa = %s"
         params.extend([product_id_int, company_id_int])
-        query = f"UPDATE produto SET {', '.join(updates)} WHERE id = %s AND id_empresa = %s"
+        if expected_version is not None:
+            conditions += " AND versao = %s"
+            params.append(expected_version)
+        
+        query = f"""
+            UPDATE produto SET {', '.join(updates)}
+            WHERE {conditions}
+            RETURNING {PRODUCT_COLUMNS}
+        """
+        
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(*_with_movement_context(query, params, kind='ajuste', reason=reason, user_cpf=user_cpf))
+            result = cur.fetchone()
         
-        cur.execute(query, params)
+            if result is None:
+                # Nada atualizado: a linha atual é lida em um comando separado, que (em READ
+                # COMMITTED) enxerga a versão gravada por quem venceu a disputa, e não a
+                # do instante em que o UPDATE começou
+                conn.rollback()
+                cur.execute(
+                    f"SELECT {PRODUCT_COLUMNS} FROM produto WHERE id = %s AND id_empresa = %s",
+                    (product_id_int, company_id_int)
+                )
+                current = cur.fetchone()
+                conn.rollback()
+                cur.close()
+                if current is None:
+                    return None, 'not_found'
+                return _product_from_row(current), 'conflict'
         
-        if cur.rowcount == 0:
+            conn.commit()
+            cache.invalidate(PRODUCT_CACHE_NAMESPACE, company_id)
             cur.close()
-            return None
         
-        conn.commit()
-        cur.close()
+            return _product_from_row(result), None
+    except psycopg2.Error as e:
+        log.error("Erro ao atualizar produto", error=str(e))
+        return None, 'error'
+
+def record_movement(company_id, product_id, kind, quantity, reason=None, user_cpf=None):
+    """
+    Registra uma movimentação de estoque aplicando a diferença ao saldo em um único comando:
+    entrada soma `quantity`, saída subtrai (sem deixar o saldo negativo) e ajuste soma o
+    valor com sinal. Escritas simultâneas no mesmo produto se somam, nenhuma se perde.
+    Retorna (produto, None) ou (None, 'not_found' | 'insufficient' | 'error').
+    """
+    delta = -quantity if kind == 'saida' else quantity
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+        
+            # Converter IDs para int se possível
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
+        
+            try:
+                product_id_int = int(product_id)
+            except (ValueError, TypeError):
+                product_id_int = product_id
+        
+            cur.execute(*_with_movement_context(
+                f"""
+                UPDATE produto SET quantidade = quantidade + %s
+                WHERE id = %s AND id_empresa = %s AND quantidade + %s >= 0
+                RETURNING {PRODUCT_COLUMNS}
+                """,
+                (delta, product_id_int, company_id_int, delta),
+                kind=kind,
+                reason=reason,
+                user_cpf=user_cpf
+            ))
+            result = cur.fetchone()
+        
+            if result is None:
+                # Nenhuma linha: produto inexistente ou saldo insuficiente para a saída
+                cur.execute(
+                    "SELECT 1 FROM produto WHERE id = %s AND id_empresa = %s",
+                    (product_id_int, company_id_int)
+                )
+                exists = cur.fetchone() is not None
+                cur.close()
+                return None, 'insufficient' if exists else 'not_found'
+        
+            conn.commit()
+            cache.invalidate(PRODUCT_CACHE_NAMESPACE, company_id)
+            cur.close()
         
-        return get_product_by_id(company_id, product_id)
+            return _product_from_row(result), None
     except psycopg2.Error as e:
-        print(f"Erro ao atualizar produto: {e}")
-        if conn:
-            conn.rollback()
-        return None
-    finally:
-        if conn:
-            return_connection(conn)
+        log.error("Erro ao registrar movimentação", error=str(e))
+        return None, 'error'
 
-def delete_product(company_id, product_id):
-    """Exclui um produto"""
-    conn = None
+def apply_stock_adjustments(company_id, adjustments, atomic=True, reason=None, user_cpf=None):
+    """
+    Aplica vários ajustes de estoque em um único comando UPDATE ... FROM (VALUES ...).
+    `adjustments` é uma lista de (product_id, delta, absoluto): com `absoluto` a quantidade
+    passa a ser esse valor, senão `delta` é somado. Ajustes que deixariam o saldo negativo
+    não são aplicados. As linhas são bloqueadas em ordem de id antes da atualização, então
+    lotes simultâneos com produtos em comum não entram em deadlock.
+
+    Com `atomic`, qualquer falha desfaz o lote inteiro; senão os ajustes válidos são gravados.
+    Retorna (resultados na ordem recebida, aplicado) ou (None, False) em caso de erro. Cada
+    resultado traz product_id, status ('updated', 'not_found' ou 'insufficient') e product.
+    """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
+        # Converter company_id para int se possível
+        try:
+            company_id_int = int(company_id)
+        except (ValueError, TypeError):
+            company_id_int = company_id
+        
+        values = []
+        params = []
+        for position, (product_id, delta, absolute) in enumerate(adjustments):
+            values.append("(%s, %s::integer, %s::integer, %s::integer)")
+            params.extend([position, product_id, delta, absolute])
+        params.append(company_id_int)
+        
+        returning = ', '.join(f"p.{col}" for col in PRODUCT_COLUMNS.split(', '))
+        query = f"""
+            WITH v (ordem, id, delta, absoluto) AS (
+                VALUES {', '.join(values)}
+            ),
+            alvo AS (
+                SELECT p.id FROM produto p
+                WHERE p.id_empresa = %s AND p.id IN (SELECT id FROM v)
+                ORDER BY p.id
+                FOR UPDATE
+            ),
+            atualizados AS (
+                UPDATE produto p
+                SET quantidade = COALESCE(v.absoluto, p.quantidade + v.delta)
+                FROM v
+                JOIN alvo a ON a.id = v.id
+                WHERE p.id = v.id AND COALESCE(v.absoluto, p.quantidade + v.delta) >= 0
+                RETURNING {returning}
+            )
+            SELECT v.id, a.id IS NOT NULL, u.*
+            FROM v
+            LEFT JOIN alvo a ON a.id = v.id
+            LEFT JOIN atualizados u ON u.id = v.id
+            ORDER BY v.ordem
+        """
+        
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(*_with_movement_context(query, params, kind='ajuste', reason=reason, user_cpf=user_cpf))
+            rows = cur.fetchall()
+        
+            results = []
+            for row in rows:
+                if row[2] is not None:
+                    results.append({'product_id': str(row[0]), 'status': 'updated', 'product': _product_from_row(row[2:])})
+                else:
+                    status = 'insufficient' if row[1] else 'not_found'
+                    results.append({'product_id': str(row[0]), 'status': status, 'product': None})
+        
+            updated = sum(1 for result in results if result['status'] == 'updated')
+            if atomic and updated < len(results):
+                conn.rollback()
+                cur.close()
+                return results, False
         
+            if updated:
+                conn.commit()
+                cache.invalidate(PRODUCT_CACHE_NAMESPACE, company_id)
+            cur.close()
+            return results, updated > 0
+    except psycopg2.Error as e:
+        log.error("Erro ao aplicar ajustes de estoque", error=str(e))
+        return None, False
+
+def get_product_movements(company_id, product_id, limit, before=None, since=None):
+    """
+    Histórico de movimentações de um produto, mais recentes primeiro, paginado por chave
+    (`before` = (criado_em, id) do último item da página anterior) sobre o índice
+    (id_produto, criado_em, id). `since` limita o histórico a partir de uma data.
+    Retorna (movimentações, chave da próxima página ou None).
+    """
+    try:
         # Converter IDs para int se possível
         try:
             company_id_int = int(company_id)
@@ -989,23 +1463,193 @@ def delete_product(company_id, product_id):
         except (ValueError, TypeError):
             product_id_int = product_id
         
-        cur.execute(
-            "DELETE FROM produto WHERE id = %s AND id_empresa = %s",
-            (product_id_int, company_id_int)
-        )
+        conditions = ["id_produto = %s", "id_empresa = %s"]
+        params = [product_id_int, company_id_int]
+        if before is not None:
+            conditions.append("(criado_em, id) < (%s::timestamp, %s)")
+            params.extend(before)
+        if since is not None:
+            conditions.append("criado_em >= %s")
+            params.append(since)
+        params.append(limit + 1)
+        
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT id, tipo, quantidade, saldo, motivo, usuario_cpf, criado_em
+                FROM movimentacao
+                WHERE {' AND '.join(conditions)}
+                ORDER BY criado_em DESC, id DESC
+                LIMIT %s
+                """,
+                params
+            )
+            rows = cur.fetchall()
+            cur.close()
+        
+        next_before = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_before = (rows[-1][6].isoformat(), rows[-1][0])
+        
+        movements = [
+            {
+                'id': str(row[0]),
+                'type': row[1],
+                'quantity': row[2],
+                'balance': row[3],
+                'reason': row[4],
+                'user_cpf': row[5],
+                'created_at': row[6].isoformat(),
+            }
+            for row in rows
+        ]
+        return movements, next_before
+    except psycopg2.Error as e:
+        log.error("Erro ao buscar movimentações", error=str(e))
+        return None, None
+
+# Eventos de estoque baixo devolvidos de uma vez na retomada do feed (Last-Event-ID)
+ALERT_EVENTS_MAX = 500
+
+def get_low_stock_products(company_id, limit, after_id=None):
+    """
+    Produtos da empresa abaixo do estoque mínimo, em ordem de id, paginados por chave.
+    Lidos pelo índice parcial de produtos abaixo do mínimo (migração 009): o custo acompanha
+    o número de alertas, não o tamanho do estoque.
+    Retorna (produtos, id para a próxima página ou None).
+    """
+    try:
+        # Converter company_id para int se possível
+        try:
+            company_id_int = int(company_id)
+        except (ValueError, TypeError):
+            company_id_int = company_id
         
-        if cur.rowcount == 0:
+        conditions = "id_empresa = %s AND quantidade < minimo"
+        params = [company_id_int]
+        if after_id is not None:
+            conditions += " AND id > %s"
+            params.append(after_id)
+        params.append(limit + 1)
+        
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT {PRODUCT_COLUMNS} FROM produto WHERE {conditions} ORDER BY id LIMIT %s",
+                params
+            )
+            rows = cur.fetchall()
             cur.close()
-            return False
         
-        conn.commit()
-        cur.close()
-        return True
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = rows[-1][0]
+        return [_product_from_row(row) for row in rows], next_after
+    except psycopg2.Error as e:
+        log.error("Erro ao buscar alertas de estoque", error=str(e))
+        return None, None
+
+def _alert_event_from_row(row):
+    """Evento de alerta no mesmo formato do NOTIFY enviado pelo trigger (migração 009)"""
+    return {
+        'id': row[0],
+        'company_id': row[1],
+        'product_id': row[2],
+        'name': row[3],
+        'type': row[4],
+        'quantity': row[5],
+        'minimum': row[6],
+        'created_at': row[7].isoformat(),
+    }
+
+def get_alert_events(company_id, after_id, limit=ALERT_EVENTS_MAX):
+    """Eventos de alerta da empresa posteriores a `after_id` (mais antigos primeiro)"""
+    try:
+        # Converter company_id para int se possível
+        try:
+            company_id_int = int(company_id)
+        except (ValueError, TypeError):
+            company_id_int = company_id
+        
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT id, id_empresa, id_produto, nome, tipo, quantidade, minimo, criado_em
+                FROM alerta_estoque
+                WHERE id_empresa = %s AND id > %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (company_id_int, after_id, limit)
+            )
+            rows = cur.fetchall()
+            cur.close()
+        return [_alert_event_from_row(row) for row in rows]
+    except psycopg2.Error as e:
+        log.error("Erro ao buscar eventos de alerta", error=str(e))
+        return []
+
+def purge_alert_events(retention_hours):
+    """
+    Apaga, em transação própria, os eventos de alerta mais antigos que `retention_hours`.
+    Só um processo apaga por vez: se outro já estiver apagando, retorna 0 sem esperar.
+    Retorna o número de eventos apagados ou None em caso de erro.
+    """
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('alerta_estoque:retencao'))")
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                cur.close()
+                return 0
+            cur.execute(
+                "DELETE FROM alerta_estoque WHERE criado_em < CURRENT_TIMESTAMP - make_interval(secs => %s)",
+                (retention_hours * 3600,)
+            )
+            deleted = cur.rowcount
+            conn.commit()
+            cur.close()
+        return deleted
+    except psycopg2.Error as e:
+        log.error("Erro ao apagar eventos de alerta antigos", error=str(e))
+        return None
+
+def delete_product(company_id, product_id, user_cpf=None):
+    """Exclui um produto (o estoque restante é baixado em movimentacao)"""
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+        
+            # Converter IDs para int se possível
+            try:
+                company_id_int = int(company_id)
+            except (ValueError, TypeError):
+                company_id_int = company_id
+        
+            try:
+                product_id_int = int(product_id)
+            except (ValueError, TypeError):
+                product_id_int = product_id
+        
+            cur.execute(*_with_movement_context(
+                "DELETE FROM produto WHERE id = %s AND id_empresa = %s",
+                (product_id_int, company_id_int),
+                user_cpf=user_cpf
+            ))
+        
+            if cur.rowcount == 0:
+                cur.close()
+                return False
+        
+            conn.commit()
+            cache.invalidate(PRODUCT_CACHE_NAMESPACE, company_id)
+            cur.close()
+            return True
     except psycopg2.Error as e:
-        print(f"Erro ao excluir produto: {e}")
-        if conn:
-            conn.rollback()
+        log.error("Erro ao excluir produto", error=str(e))
         return False
-    finally:
-        if conn:
-            return_connection(conn)
@@ -10,6 +10,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import db_config
 import db_operations
+import passwords
 import re
 
 def main():
@@ -42,14 +43,13 @@ def main():
         
         # Testar hash da senha
         print(f"\n2️⃣ Testando hash da senha...")
-        hash_calculado = db_operations.hash_password(senha_teste)
         hash_banco = user['password_hash']
+        senha_ok, formato_antigo = passwords.verify_password(senha_teste, hash_banco)
         
-        print(f"   Hash calculado (primeiros 20 chars): {hash_calculado[:20]}...")
-        print(f"   Hash no banco (primeiros 20 chars): {hash_banco[:20]}...")
-        
-        if hash_calculado == hash_banco:
+        if senha_ok:
             print(f"   ✅ Senhas coincidem!")
+            if formato_antigo:
+                print(f"   💡 Hash em formato antigo: será atualizado no próximo login")
         else:
             print(f"   ❌ Senhas NÃO coincidem!")
             print(f"   💡 A senha no banco pode estar diferente ou em texto plano")
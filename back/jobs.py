@@ -0,0 +1,417 @@
+"""
+Fila de tarefas em segundo plano guardada no PostgreSQL (tabela tarefa, migração 008).
+
+Operações longas (importação e exportação grandes) não rodam na thread da requisição:
+a API grava a tarefa, responde 202 e o cliente acompanha em GET /jobs/<id>. Processos
+trabalhadores locais pegam a próxima tarefa pendente com SELECT ... FOR UPDATE SKIP LOCKED
+(dois trabalhadores nunca pegam a mesma), informam o progresso e gravam o resultado.
+
+Um NOTIFY acorda os trabalhadores assim que a tarefa é criada; sem ele, a fila é
+consultada a cada JOBS_POLL_INTERVAL segundos. Durante a execução um sinal de vida é
+gravado periodicamente; tarefas sem sinal há JOBS_STALE_AFTER segundos (trabalhador
+encerrado no meio) voltam para a fila, até JOBS_MAX_ATTEMPTS tentativas.
+
+As tarefas são registradas com @jobs.task('nome') nos módulos de JOBS_TASK_MODULES,
+importados por cada trabalhador. Arquivos enviados e gerados ficam em JOBS_DATA_DIR,
+então os trabalhadores rodam na mesma máquina da API.
+
+Uso:
+    python jobs.py      # só os trabalhadores (ex.: ao lado do servidor ASGI)
+"""
+import importlib
+import json
+import multiprocessing
+import os
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+import psycopg2
+
+import db_config
+import logs
+from db_config import db_connection
+
+log = logs.get_logger(__name__)
+
+# Processos trabalhadores iniciados junto com o servidor (0 = nenhum)
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', '2'))
+# Intervalo (s) entre consultas à fila quando nenhum NOTIFY chega
+JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', '5'))
+# Tarefa em execução sem sinal de vida há mais que isso (s) volta para a fila
+JOBS_STALE_AFTER = float(os.environ.get('JOBS_STALE_AFTER', '300'))
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', '3'))
+# Tarefas concluídas (e seus arquivos) são apagadas depois desse tempo (h)
+JOBS_RETENTION_HOURS = float(os.environ.get('JOBS_RETENTION_HOURS', '24'))
+JOBS_DATA_DIR = os.environ.get('JOBS_DATA_DIR', os.path.join(tempfile.gettempdir(), 'techtitans-jobs'))
+JOBS_TASK_MODULES = tuple(
+    name.strip() for name in os.environ.get('JOBS_TASK_MODULES', 'app').split(',') if name.strip()
+)
+
+NOTIFY_CHANNEL = 'tarefa_nova'
+JOB_COLUMNS = (
+    "id, tipo, id_empresa, usuario_cpf, status, progresso, resultado, erro, "
+    "tentativas, criado_em, iniciado_em, concluido_em"
+)
+
+_tasks = {}
+
+
+def task(name):
+    """Registra a função que executa as tarefas do tipo `name`; ela recebe um JobContext"""
+    def decorator(func):
+        _tasks[name] = func
+        return func
+    return decorator
+
+
+def data_path(filename):
+    """Caminho de um arquivo de tarefa (enviado ou gerado) em JOBS_DATA_DIR"""
+    return os.path.join(JOBS_DATA_DIR, os.path.basename(filename))
+
+
+def save_upload(stream, suffix=''):
+    """Copia o corpo da requisição em blocos para um arquivo e devolve o nome dele"""
+    os.makedirs(JOBS_DATA_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile('wb', dir=JOBS_DATA_DIR, prefix='envio-', suffix=suffix, delete=False) as f:
+        shutil.copyfileobj(stream, f, 1024 * 1024)
+        return os.path.basename(f.name)
+
+
+def _job_from_row(row):
+    return {
+        'id': str(row[0]),
+        'type': row[1],
+        'company_id': str(row[2]) if row[2] is not None else None,
+        'user_cpf': row[3],
+        'status': row[4],
+        'progress': row[5],
+        'result': row[6],
+        'error': row[7],
+        'attempts': row[8],
+        'created_at': row[9].isoformat() if row[9] else None,
+        'started_at': row[10].isoformat() if row[10] else None,
+        'finished_at': row[11].isoformat() if row[11] else None,
+    }
+
+
+def enqueue(kind, company_id, params, user_cpf=None):
+    """Cria uma tarefa pendente e acorda os trabalhadores (mesma ida ao banco). Retorna o id"""
+    try:
+        company_id_int = int(company_id)
+    except (ValueError, TypeError):
+        company_id_int = company_id
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                WITH nova AS (
+                    INSERT INTO tarefa (tipo, id_empresa, usuario_cpf, parametros)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id
+                )
+                SELECT id, pg_notify(%s, id::text) FROM nova
+                """,
+                (kind, company_id_int, user_cpf, json.dumps(params), NOTIFY_CHANNEL)
+            )
+            job_id = cur.fetchone()[0]
+            conn.commit()
+            cur.close()
+            return str(job_id)
+    except psycopg2.Error as e:
+        log.error("Erro ao criar tarefa", kind=kind, error=str(e))
+        return None
+
+
+def get_job(job_id):
+    """Estado de uma tarefa (None se não existir ou em caso de erro)"""
+    try:
+        job_id_int = int(job_id)
+    except (ValueError, TypeError):
+        return None
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT {JOB_COLUMNS} FROM tarefa WHERE id = %s", (job_id_int,))
+            row = cur.fetchone()
+            cur.close()
+        return _job_from_row(row) if row else None
+    except psycopg2.Error as e:
+        log.error("Erro ao buscar tarefa", job_id=job_id, error=str(e))
+        return None
+
+
+class JobContext:
+    """Dados da tarefa em execução, entregues à função registrada com @task"""
+
+    # Intervalo mínimo (s) entre gravações de progresso
+    PROGRESS_INTERVAL = 1.0
+
+    def __init__(self, job_id, kind, company_id, user_cpf, params, attempt):
+        self.id = job_id
+        self.kind = kind
+        self.company_id = company_id
+        self.user_cpf = user_cpf
+        self.params = params
+        self.attempt = attempt
+        self._progress = 0
+        self._progress_at = 0.0
+
+    def progress(self, percent):
+        """Informa o andamento (0 a 100); gravado no máximo uma vez por segundo"""
+        percent = max(0, min(int(percent), 99))
+        now = time.monotonic()
+        if percent == self._progress or now - self._progress_at < self.PROGRESS_INTERVAL:
+            return
+        self._progress, self._progress_at = percent, now
+        _update_running(self, "progresso = %s, heartbeat_em = CURRENT_TIMESTAMP", (percent,))
+
+
+def _update_running(ctx, assignments, params):
+    """Atualiza a tarefa só se ela ainda estiver com esta tentativa (não foi devolvida à fila)"""
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"UPDATE tarefa SET {assignments} WHERE id = %s AND status = 'executando' AND tentativas = %s",
+                tuple(params) + (ctx.id, ctx.attempt)
+            )
+            updated = cur.rowcount
+            conn.commit()
+            cur.close()
+            return updated > 0
+    except psycopg2.Error as e:
+        log.error("Erro ao atualizar tarefa", job_id=ctx.id, error=str(e))
+        return False
+
+
+class _Heartbeat(threading.Thread):
+    """Grava o sinal de vida da tarefa enquanto ela executa, inclusive em etapas longas sem progresso"""
+
+    def __init__(self, ctx):
+        super().__init__(daemon=True)
+        self.ctx = ctx
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = max(JOBS_STALE_AFTER / 3, 1)
+        while not self.stopped.wait(interval):
+            _update_running(self.ctx, "heartbeat_em = CURRENT_TIMESTAMP", ())
+
+
+def _claim_next():
+    """Reserva a tarefa pendente mais antiga sem esperar por tarefas já reservadas"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE tarefa SET
+                status = 'executando',
+                tentativas = tentativas + 1,
+                iniciado_em = CURRENT_TIMESTAMP,
+                heartbeat_em = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM tarefa
+                WHERE status = 'pendente'
+                ORDER BY criado_em, id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, tipo, id_empresa, usuario_cpf, parametros, tentativas
+            """
+        )
+        row = cur.fetchone()
+        conn.commit()
+        cur.close()
+    if row is None:
+        return None
+    return JobContext(row[0], row[1], row[2], row[3], row[4], row[5])
+
+
+def _maintenance():
+    """Devolve à fila tarefas sem sinal de vida e apaga tarefas antigas e seus arquivos"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE tarefa SET
+                status = CASE WHEN tentativas >= %s THEN 'falhou' ELSE 'pendente' END,
+                erro = CASE WHEN tentativas >= %s THEN 'Trabalhador interrompido durante a execução' END,
+                concluido_em = CASE WHEN tentativas >= %s THEN CURRENT_TIMESTAMP END
+            WHERE status = 'executando'
+              AND heartbeat_em < CURRENT_TIMESTAMP - make_interval(secs => %s)
+            RETURNING id, status
+            """,
+            (JOBS_MAX_ATTEMPTS, JOBS_MAX_ATTEMPTS, JOBS_MAX_ATTEMPTS, JOBS_STALE_AFTER)
+        )
+        for job_id, status in cur.fetchall():
+            log.warning("Tarefa sem sinal de vida", job_id=job_id, status=status)
+        cur.execute(
+            """
+            DELETE FROM tarefa
+            WHERE concluido_em < CURRENT_TIMESTAMP - make_interval(secs => %s)
+            RETURNING parametros, resultado
+            """,
+            (JOBS_RETENTION_HOURS * 3600,)
+        )
+        expired = cur.fetchall()
+        conn.commit()
+        cur.close()
+    for params, result in expired:
+        for data in (params or {}, result or {}):
+            if data.get('file'):
+                try:
+                    os.remove(data_path(data['file']))
+                except OSError:
+                    pass
+
+
+def run_next():
+    """Executa a próxima tarefa pendente, se houver. Retorna True se alguma foi executada"""
+    ctx = _claim_next()
+    if ctx is None:
+        return False
+
+    handler = _tasks.get(ctx.kind)
+    log.info("Tarefa iniciada", job_id=ctx.id, kind=ctx.kind, attempt=ctx.attempt)
+    started = time.perf_counter()
+    heartbeat = _Heartbeat(ctx)
+    heartbeat.start()
+    try:
+        if handler is None:
+            raise LookupError(f"Tipo de tarefa desconhecido: {ctx.kind}")
+        result = handler(ctx)
+    except Exception as e:
+        log.exception("Tarefa falhou", job_id=ctx.id, kind=ctx.kind, error=str(e))
+        _update_running(
+            ctx,
+            "status = 'falhou', erro = %s, concluido_em = CURRENT_TIMESTAMP",
+            (str(e)[:1000],)
+        )
+    else:
+        _update_running(
+            ctx,
+            "status = 'concluida', progresso = 100, resultado = %s, concluido_em = CURRENT_TIMESTAMP",
+            (json.dumps(result),)
+        )
+        log.info("Tarefa concluída", job_id=ctx.id, kind=ctx.kind,
+                 elapsed_seconds=round(time.perf_counter() - started, 3))
+    finally:
+        heartbeat.stopped.set()
+    return True
+
+
+def _listen_connection():
+    """Conexão dedicada (fora do pool) que recebe os NOTIFY de tarefas novas"""
+    conn = psycopg2.connect(**db_config.DB_CONFIG)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+    cur.close()
+    return conn
+
+
+def worker_main(stop_event, task_modules=JOBS_TASK_MODULES):
+    """Laço de um processo trabalhador: executa tarefas até `stop_event` ser sinalizado"""
+    # O encerramento é coordenado pelo processo principal via stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module in task_modules:
+        importlib.import_module(module)
+    # Tarefa em execução, progresso e sinal de vida podem usar conexões ao mesmo tempo
+    db_config.init_connection_pool(minconn=1, maxconn=3)
+    os.makedirs(JOBS_DATA_DIR, exist_ok=True)
+    log.info("Trabalhador de tarefas iniciado", pid=os.getpid(), tasks=sorted(_tasks))
+
+    listener = None
+    next_maintenance = 0.0
+    try:
+        while not stop_event.is_set():
+            try:
+                if time.monotonic() >= next_maintenance:
+                    _maintenance()
+                    next_maintenance = time.monotonic() + JOBS_POLL_INTERVAL * 12
+                # Esvazia a fila antes de voltar a esperar
+                while not stop_event.is_set() and run_next():
+                    pass
+                if listener is None:
+                    listener = _listen_connection()
+                # Espera um NOTIFY (ou o intervalo de consulta), acordando a cada segundo para
+                # perceber o pedido de encerramento
+                deadline = time.monotonic() + JOBS_POLL_INTERVAL
+                while not stop_event.is_set() and time.monotonic() < deadline:
+                    if select.select([listener], [], [], 1.0)[0]:
+                        listener.poll()
+                        if listener.notifies:
+                            listener.notifies.clear()
+                            break
+            except psycopg2.Error as e:
+                log.error("Erro no trabalhador de tarefas", error=str(e))
+                if listener is not None:
+                    listener.close()
+                    listener = None
+                stop_event.wait(JOBS_POLL_INTERVAL)
+    finally:
+        if listener is not None:
+            listener.close()
+        db_config.close_connection_pool()
+
+
+_workers = []
+_stop_event = None
+
+
+def start_workers(count=JOBS_WORKERS):
+    """Inicia os processos trabalhadores (spawn: não herdam threads nem conexões do servidor)"""
+    global _stop_event
+    if count <= 0 or _workers:
+        return
+    context = multiprocessing.get_context('spawn')
+    _stop_event = context.Event()
+    for index in range(count):
+        process = context.Process(
+            target=worker_main,
+            args=(_stop_event,),
+            name=f"tarefas-{index + 1}",
+            daemon=True,
+        )
+        process.start()
+        _workers.append(process)
+
+
+def stop_workers(timeout=None):
+    """Pede o encerramento; cada trabalhador termina a tarefa em andamento antes de sair"""
+    if not _workers:
+        return
+    _stop_event.set()
+    for process in _workers:
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+    _workers.clear()
+
+
+def main():
+    """Executa apenas os trabalhadores, em primeiro plano, até SIGTERM ou Ctrl+C"""
+    count = max(JOBS_WORKERS, 1)
+    print(f"🔧 Iniciando {count} trabalhador(es) de tarefas...")
+    start_workers(count)
+    signal.signal(signal.SIGTERM, lambda *_: _stop_event.set())
+    try:
+        for worker in list(_workers):
+            worker.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers()
+    return 0
+
+
+if __name__ == '__main__':
+    # Usa o módulo importado (e não __main__), onde as tarefas dos trabalhadores são registradas
+    import jobs
+    sys.exit(jobs.main())
@@ -0,0 +1,95 @@
+"""
+Logs estruturados com nível e amostragem.
+
+    log = logs.get_logger(__name__)
+    log.info("Produto criado", company_id=company_id, name=name)
+
+Cada chamada vira uma linha JSON (ou texto, com LOG_FORMAT=text) contendo horário, nível,
+módulo, mensagem e os campos informados. Chamadas abaixo do nível configurado retornam
+antes de montar qualquer registro. Mensagens DEBUG/INFO podem ser amostradas com
+LOG_SAMPLE_RATE (ex.: 0.1 mantém ~10%); avisos e erros são sempre registrados.
+
+Variáveis de ambiente: LOG_LEVEL (padrão INFO), LOG_FORMAT (json ou text), LOG_SAMPLE_RATE.
+"""
+import json
+import logging
+import os
+import random
+import sys
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1'))
+
+ROOT_LOGGER = 'techtitans'
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        data.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = ' '.join(f"{key}={value}" for key, value in getattr(record, 'fields', {}).items())
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        if fields:
+            line += f" | {fields}"
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def _setup():
+    logger = logging.getLogger(ROOT_LOGGER)
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+class StructuredLogger:
+    def __init__(self, name):
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+    def _log(self, level, msg, fields, exc_info=False):
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING and LOG_SAMPLE_RATE < 1 and random.random() >= LOG_SAMPLE_RATE:
+            return
+        self._logger.log(level, msg, extra={'fields': fields}, exc_info=exc_info)
+
+    def is_enabled(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+
+def get_logger(name):
+    _setup()
+    return StructuredLogger(name)
@@ -0,0 +1,273 @@
+"""
+Métricas da aplicação (formato de texto do Prometheus) e medição por requisição.
+
+Todo cursor aberto pelas conexões de db_config é um TimedCursor: cada execute é cronometrado
+e somado à requisição em andamento (tempo de banco e número de consultas), além do
+histograma global de duração das consultas. O tempo de espera por uma conexão do pool
+também é registrado aqui.
+
+Com QUERY_BUDGET > 0, o texto de cada consulta também é guardado na requisição para que
+app.py registre as que passarem desse número de consultas. Em testes, assert_max_queries
+verifica o número de consultas de um trecho (ex.: uma chamada ao cliente de teste do Flask).
+
+As métricas ficam na memória de cada processo; com vários workers, cada um expõe as suas.
+"""
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+import psycopg2.extensions
+from psycopg2 import sql
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# Máximo de consultas por requisição antes de registrar um aviso com o SQL (0 = desativado)
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', '0'))
+# Tamanho máximo de cada comando guardado para o aviso
+STATEMENT_MAX_LENGTH = 500
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [contagem por bucket..., soma, total]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _labels(self.labels + ('le',), label_values + (_format(bound),))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.labels + ('le',), label_values + ('+Inf',))
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {_format(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {series[-1]}")
+        return lines
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+http_requests = Counter(
+    'http_requests_total', 'Requisições atendidas', ('method', 'route', 'status'))
+http_duration = Histogram(
+    'http_request_duration_seconds', 'Duração das requisições', ('method', 'route', 'status'))
+http_db_time = Histogram(
+    'http_request_db_seconds', 'Tempo de banco de dados por requisição', ('route',))
+http_queries = Histogram(
+    'http_request_queries', 'Consultas ao banco por requisição', ('route',), QUERY_COUNT_BUCKETS)
+db_query_duration = Histogram(
+    'db_query_duration_seconds', 'Duração de cada consulta ao banco')
+db_pool_wait = Histogram(
+    'db_pool_wait_seconds', 'Espera por uma conexão livre do pool')
+
+REGISTRY = (http_requests, http_duration, http_db_time, http_queries, db_query_duration, db_pool_wait)
+
+
+class RequestStats:
+    """Totais de banco de dados da requisição em andamento"""
+    __slots__ = ('started', 'db_time', 'queries', 'pool_wait', 'statements')
+
+    def __init__(self, capture_statements=False):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.pool_wait = 0.0
+        # Texto das consultas, só quando há orçamento configurado
+        self.statements = [] if capture_statements else None
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+# Contagens abertas por count_queries (independentes da requisição em andamento)
+_captures = contextvars.ContextVar('query_captures', default=())
+
+
+def start_request():
+    stats = RequestStats(capture_statements=QUERY_BUDGET > 0)
+    _current.set(stats)
+    return stats
+
+
+def end_request():
+    _current.set(None)
+
+
+def current_request():
+    return _current.get()
+
+
+def over_budget(stats):
+    """True se a requisição passou do orçamento de consultas (QUERY_BUDGET)"""
+    return QUERY_BUDGET > 0 and stats.queries > QUERY_BUDGET
+
+
+def capturing_statements():
+    """True se alguém (orçamento ou count_queries) vai guardar o texto das consultas"""
+    stats = _current.get()
+    return bool(_captures.get()) or (stats is not None and stats.statements is not None)
+
+
+def record_query(duration, statement=None):
+    db_query_duration.observe(duration)
+    stats = _current.get()
+    if stats is not None:
+        stats.db_time += duration
+        stats.queries += 1
+        if stats.statements is not None and statement is not None:
+            stats.statements.append(statement)
+    for captured in _captures.get():
+        captured.append(statement)
+
+
+@contextlib.contextmanager
+def count_queries():
+    """
+    Conta as consultas feitas dentro do bloco:
+
+        with metrics.count_queries() as statements:
+            client.post('/login', json=...)
+        len(statements)  # número de consultas, com o SQL de cada uma
+    """
+    statements = []
+    token = _captures.set(_captures.get() + (statements,))
+    try:
+        yield statements
+    finally:
+        _captures.reset(token)
+
+
+@contextlib.contextmanager
+def assert_max_queries(max_queries):
+    """
+    Falha (AssertionError com o SQL executado) se o bloco fizer mais de `max_queries` consultas:
+
+        with metrics.assert_max_queries(2):
+            client.post('/login', json=...)
+    """
+    with count_queries() as statements:
+        yield statements
+    if len(statements) > max_queries:
+        listed = '\n'.join(f"  {i}. {text}" for i, text in enumerate(statements, 1))
+        raise AssertionError(
+            f"{len(statements)} consultas executadas (máximo {max_queries}):\n{listed}"
+        )
+
+
+def record_pool_wait(waited):
+    db_pool_wait.observe(waited)
+    stats = _current.get()
+    if stats is not None:
+        stats.pool_wait += waited
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor que cronometra e conta cada comando enviado ao banco"""
+
+    def _statement(self, query):
+        # Texto do comando sem os parâmetros (que podem conter CPF ou hash de senha)
+        if not capturing_statements():
+            return None
+        if isinstance(query, sql.Composable):
+            query = query.as_string(self)
+        elif isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        return ' '.join(query.split())[:STATEMENT_MAX_LENGTH]
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(time.perf_counter() - start, self._statement(query))
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(time.perf_counter() - start, self._statement(query))
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_query(time.perf_counter() - start, self._statement(sql))
+
+
+def _render_values(lines, kind, values):
+    for name, description, value in values:
+        if value is None:
+            continue
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {_format(value)}")
+
+
+def render(extra_gauges=(), extra_counters=()):
+    """
+    Texto no formato do Prometheus com todas as métricas registradas.
+    `extra_gauges` e `extra_counters` são sequências de (nome, descrição, valor) calculados
+    na hora; os contadores são totais que só crescem (nome terminado em _total).
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    _render_values(lines, 'gauge', extra_gauges)
+    _render_values(lines, 'counter', extra_counters)
+    return '\n'.join(lines) + '\n'
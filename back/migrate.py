@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Aplica as migrações SQL da pasta migrations/ no banco de dados.
+
+Cada arquivo é executado uma única vez, em ordem de nome, dentro de sua própria
+transação. As migrações já aplicadas ficam registradas na tabela schema_migrations.
+
+Uso:
+    python migrate.py            # aplica as migrações pendentes
+    python migrate.py --status   # apenas lista o que está aplicado/pendente
+"""
+
+import sys
+import os
+
+# Adiciona o diretório atual ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import db_config
+import psycopg2
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def list_migrations():
+    """Lista os arquivos de migração em ordem de aplicação"""
+    return sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith('.sql'))
+
+
+def get_applied(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            versao VARCHAR(255) PRIMARY KEY,
+            aplicado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cur.execute("SELECT versao FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def main():
+    only_status = '--status' in sys.argv[1:]
+
+    conn = db_config.get_connection()
+    try:
+        cur = conn.cursor()
+        applied = get_applied(cur)
+        conn.commit()
+
+        pending = [name for name in list_migrations() if name not in applied]
+        for name in list_migrations():
+            print(f"   {'✅' if name in applied else '⏳'} {name}")
+
+        if only_status or not pending:
+            if not pending:
+                print("\n✅ Nenhuma migração pendente")
+            return 0
+
+        for name in pending:
+            print(f"\n🔧 Aplicando {name}...")
+            with open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8') as f:
+                script = f.read()
+            try:
+                cur.execute(script)
+                cur.execute("INSERT INTO schema_migrations (versao) VALUES (%s)", (name,))
+                conn.commit()
+                print(f"   ✅ {name} aplicada")
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"   ❌ Erro ao aplicar {name}: {e}")
+                return 1
+
+        cur.close()
+        return 0
+    finally:
+        db_config.return_connection(conn)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
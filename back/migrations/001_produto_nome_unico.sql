@@ -0,0 +1,33 @@
+-- Restrição de unicidade (id_empresa, nome) em produto.
+-- Necessária para o cadastro com INSERT ... ON CONFLICT (id_empresa, nome) DO UPDATE.
+-- Produtos duplicados existentes são consolidados no de menor id (quantidades somadas).
+
+WITH grupos AS (
+    SELECT id, quantidade,
+           FIRST_VALUE(id) OVER (PARTITION BY id_empresa, nome ORDER BY id) AS manter
+    FROM produto
+),
+somas AS (
+    SELECT manter, SUM(quantidade) AS total
+    FROM grupos
+    GROUP BY manter
+    HAVING COUNT(*) > 1
+)
+UPDATE produto p
+SET quantidade = s.total
+FROM somas s
+WHERE p.id = s.manter;
+
+DELETE FROM produto p
+USING (
+    SELECT id, FIRST_VALUE(id) OVER (PARTITION BY id_empresa, nome ORDER BY id) AS manter
+    FROM produto
+) g
+WHERE p.id = g.id AND g.id <> g.manter;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'produto_empresa_nome_key') THEN
+        ALTER TABLE produto ADD CONSTRAINT produto_empresa_nome_key UNIQUE (id_empresa, nome);
+    END IF;
+END $$;
@@ -0,0 +1,7 @@
+-- Índices para a listagem paginada por chave (keyset) de produtos.
+-- Cada índice cobre a ordenação (coluna, id) dentro de uma empresa; a ordenação por
+-- nome já é atendida pela restrição UNIQUE (id_empresa, nome) da migração 001.
+
+CREATE INDEX IF NOT EXISTS idx_produto_empresa_id ON produto (id_empresa, id);
+CREATE INDEX IF NOT EXISTS idx_produto_empresa_quantidade ON produto (id_empresa, quantidade, id);
+CREATE INDEX IF NOT EXISTS idx_produto_empresa_preco ON produto (id_empresa, preco, id);
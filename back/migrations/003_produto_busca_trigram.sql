@@ -0,0 +1,9 @@
+-- Índice de trigramas para a busca de produtos por nome (GET /products/<id>/search).
+-- btree_gin permite incluir id_empresa no mesmo índice GIN, então a busca só
+-- percorre os produtos da empresa consultada, independentemente do total de empresas.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE INDEX IF NOT EXISTS idx_produto_nome_trgm
+    ON produto USING gin (id_empresa, nome gin_trgm_ops);
@@ -0,0 +1,108 @@
+-- Resumo do estoque por empresa (GET /products/<id>/stats).
+-- Mantido incrementalmente por triggers de instrução em produto: cada INSERT/UPDATE/DELETE
+-- aplica apenas a diferença das linhas afetadas, agregada por empresa (uma atualização do
+-- resumo por instrução, inclusive na importação em lote), sem recalcular o estoque inteiro.
+-- Estoque baixo: quantidade < 10. Sem estoque: quantidade = 0.
+
+CREATE TABLE IF NOT EXISTS produto_resumo (
+    id_empresa INTEGER PRIMARY KEY,
+    total_produtos BIGINT NOT NULL DEFAULT 0,
+    total_quantidade BIGINT NOT NULL DEFAULT 0,
+    valor_total NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    estoque_baixo BIGINT NOT NULL DEFAULT 0,
+    sem_estoque BIGINT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION produto_resumo_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO produto_resumo AS r
+            (id_empresa, total_produtos, total_quantidade, valor_total, estoque_baixo, sem_estoque)
+        SELECT id_empresa, COUNT(*), SUM(quantidade), SUM(quantidade * preco),
+               COUNT(*) FILTER (WHERE quantidade < 10), COUNT(*) FILTER (WHERE quantidade = 0)
+        FROM novos
+        GROUP BY id_empresa
+        ON CONFLICT (id_empresa) DO UPDATE SET
+            total_produtos = r.total_produtos + EXCLUDED.total_produtos,
+            total_quantidade = r.total_quantidade + EXCLUDED.total_quantidade,
+            valor_total = r.valor_total + EXCLUDED.valor_total,
+            estoque_baixo = r.estoque_baixo + EXCLUDED.estoque_baixo,
+            sem_estoque = r.sem_estoque + EXCLUDED.sem_estoque,
+            atualizado_em = CURRENT_TIMESTAMP;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE produto_resumo r SET
+            total_produtos = r.total_produtos - d.produtos,
+            total_quantidade = r.total_quantidade - d.quantidade,
+            valor_total = r.valor_total - d.valor,
+            estoque_baixo = r.estoque_baixo - d.baixo,
+            sem_estoque = r.sem_estoque - d.sem,
+            atualizado_em = CURRENT_TIMESTAMP
+        FROM (
+            SELECT id_empresa, COUNT(*) AS produtos, SUM(quantidade) AS quantidade,
+                   SUM(quantidade * preco) AS valor,
+                   COUNT(*) FILTER (WHERE quantidade < 10) AS baixo,
+                   COUNT(*) FILTER (WHERE quantidade = 0) AS sem
+            FROM antigos
+            GROUP BY id_empresa
+        ) d
+        WHERE r.id_empresa = d.id_empresa;
+    ELSE
+        -- UPDATE: diferença entre as versões nova e antiga das linhas alteradas.
+        -- Empresas sem diferença (ex.: só o nome mudou) não tocam no resumo.
+        INSERT INTO produto_resumo AS r
+            (id_empresa, total_produtos, total_quantidade, valor_total, estoque_baixo, sem_estoque)
+        SELECT id_empresa, SUM(produtos), SUM(quantidade), SUM(valor), SUM(baixo), SUM(sem)
+        FROM (
+            SELECT id_empresa, 1 AS produtos, quantidade, quantidade * preco AS valor,
+                   (quantidade < 10)::int AS baixo, (quantidade = 0)::int AS sem
+            FROM novos
+            UNION ALL
+            SELECT id_empresa, -1, -quantidade, -(quantidade * preco),
+                   -((quantidade < 10)::int), -((quantidade = 0)::int)
+            FROM antigos
+        ) d
+        GROUP BY id_empresa
+        HAVING SUM(produtos) <> 0 OR SUM(quantidade) <> 0 OR SUM(valor) <> 0
+            OR SUM(baixo) <> 0 OR SUM(sem) <> 0
+        ON CONFLICT (id_empresa) DO UPDATE SET
+            total_produtos = r.total_produtos + EXCLUDED.total_produtos,
+            total_quantidade = r.total_quantidade + EXCLUDED.total_quantidade,
+            valor_total = r.valor_total + EXCLUDED.valor_total,
+            estoque_baixo = r.estoque_baixo + EXCLUDED.estoque_baixo,
+            sem_estoque = r.sem_estoque + EXCLUDED.sem_estoque,
+            atualizado_em = CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Bloqueia escritas em produto até o fim da migração para que o recálculo inicial
+-- e a criação dos triggers enxerguem o mesmo estado
+LOCK TABLE produto IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS produto_resumo_insert ON produto;
+DROP TRIGGER IF EXISTS produto_resumo_update ON produto;
+DROP TRIGGER IF EXISTS produto_resumo_delete ON produto;
+
+CREATE TRIGGER produto_resumo_insert AFTER INSERT ON produto
+    REFERENCING NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION produto_resumo_trigger();
+
+CREATE TRIGGER produto_resumo_update AFTER UPDATE ON produto
+    REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION produto_resumo_trigger();
+
+CREATE TRIGGER produto_resumo_delete AFTER DELETE ON produto
+    REFERENCING OLD TABLE AS antigos
+    FOR EACH STATEMENT EXECUTE FUNCTION produto_resumo_trigger();
+
+-- Recálculo inicial a partir do estoque atual
+DELETE FROM produto_resumo;
+INSERT INTO produto_resumo
+    (id_empresa, total_produtos, total_quantidade, valor_total, estoque_baixo, sem_estoque)
+SELECT id_empresa, COUNT(*), COALESCE(SUM(quantidade), 0), COALESCE(SUM(quantidade * preco), 0),
+       COUNT(*) FILTER (WHERE quantidade < 10), COUNT(*) FILTER (WHERE quantidade = 0)
+FROM produto
+WHERE id_empresa IS NOT NULL
+GROUP BY id_empresa;
@@ -0,0 +1,88 @@
+-- CPFs de usuario (e da tabela auxiliar funcionarios) guardados apenas com os 11 dígitos,
+-- com índice único em usuario.cpf. O login passa a buscar o CPF por igualdade, usando o
+-- índice, em vez do LIKE '%cpf%' que lia a tabela inteira a cada CPF não encontrado.
+-- Se dois usuários (ou dois vínculos de funcionarios com empresas diferentes) ficarem com o
+-- mesmo CPF após a normalização a migração é interrompida (nada é alterado) e lista os CPFs
+-- para correção manual.
+
+DO $$
+DECLARE
+    duplicados TEXT;
+BEGIN
+    SELECT string_agg(cpf_limpo, ', ') INTO duplicados
+    FROM (
+        SELECT regexp_replace(cpf, '\D', '', 'g') AS cpf_limpo
+        FROM usuario
+        GROUP BY 1
+        HAVING COUNT(*) > 1
+    ) d;
+    IF duplicados IS NOT NULL THEN
+        RAISE EXCEPTION 'CPFs repetidos em usuario após remover a formatação: %', duplicados;
+    END IF;
+END $$;
+
+UPDATE usuario SET cpf = regexp_replace(cpf, '\D', '', 'g') WHERE cpf ~ '\D';
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = 'usuario'::regclass
+          AND i.indisunique
+          AND i.indnatts = 1
+          AND a.attname = 'cpf'
+    ) THEN
+        CREATE UNIQUE INDEX usuario_cpf_key ON usuario (cpf);
+    END IF;
+END $$;
+
+-- Em funcionarios, vínculos cujo CPF fica igual após a normalização (ex.: gravado com e sem
+-- formatação, ou com formatações diferentes) são redundantes quando apontam para a mesma
+-- empresa: fica um só (o gravado só com dígitos, formato da aplicação, se houver). Se
+-- apontarem para empresas diferentes a migração é interrompida e lista os CPFs, como em usuario.
+DO $$
+DECLARE
+    coluna TEXT;
+    conflitos TEXT;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'funcionarios' AND column_name = 'cpf'
+    ) THEN
+        RETURN;
+    END IF;
+
+    -- Coluna de empresa: mesma ordem de schema_cache.COLUMN_CANDIDATES
+    SELECT c.candidata INTO coluna
+    FROM unnest(ARRAY['id_empresa', 'empresa_id', 'company_id', 'idempresa', 'empresa']) WITH ORDINALITY AS c(candidata, posicao)
+    JOIN information_schema.columns ic
+      ON ic.table_name = 'funcionarios' AND ic.column_name = c.candidata
+    ORDER BY c.posicao
+    LIMIT 1;
+
+    IF coluna IS NOT NULL THEN
+        EXECUTE format(
+            'SELECT string_agg(cpf_limpo, '', '')
+             FROM (
+                 SELECT regexp_replace(cpf, ''\D'', '''', ''g'') AS cpf_limpo
+                 FROM funcionarios
+                 GROUP BY 1
+                 HAVING COUNT(DISTINCT coalesce(%I::text, '''')) > 1
+             ) d',
+            coluna) INTO conflitos;
+        IF conflitos IS NOT NULL THEN
+            RAISE EXCEPTION 'CPFs repetidos em funcionarios, com empresas diferentes, após remover a formatação: %', conflitos;
+        END IF;
+    END IF;
+
+    -- Um vínculo por CPF normalizado: o só com dígitos ou, entre formatados, o mais antigo
+    DELETE FROM funcionarios f
+    USING funcionarios o
+    WHERE regexp_replace(o.cpf, '\D', '', 'g') = regexp_replace(f.cpf, '\D', '', 'g')
+      AND o.ctid <> f.ctid
+      AND (o.cpf !~ '\D' OR (f.cpf ~ '\D' AND o.ctid < f.ctid));
+
+    UPDATE funcionarios SET cpf = regexp_replace(cpf, '\D', '', 'g') WHERE cpf ~ '\D';
+END $$;
@@ -0,0 +1,91 @@
+-- Livro de movimentações de estoque (entradas, saídas e ajustes), somente inserção.
+-- produto.quantidade continua sendo o saldo, atualizado pela própria escrita; triggers de
+-- instrução em produto registram a diferença de cada linha alterada com uma única inserção
+-- em lote por comando (inclusive na importação em lote), sem ida extra ao banco.
+-- Tipo, motivo e CPF do usuário vêm de configurações locais da transação definidas pela
+-- aplicação (estoque.movimento, estoque.motivo, estoque.usuario); sem elas, inserções
+-- contam como entrada e alterações/exclusões como ajuste.
+-- O histórico por produto é lido pelo índice (id_produto, criado_em).
+
+CREATE TABLE IF NOT EXISTS movimentacao (
+    id BIGSERIAL PRIMARY KEY,
+    id_produto INTEGER NOT NULL,
+    id_empresa INTEGER NOT NULL,
+    tipo VARCHAR(10) NOT NULL CHECK (tipo IN ('entrada', 'saida', 'ajuste')),
+    quantidade INTEGER NOT NULL,
+    saldo INTEGER NOT NULL,
+    motivo VARCHAR(255),
+    usuario_cpf VARCHAR(14),
+    criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_movimentacao_produto_data
+    ON movimentacao (id_produto, criado_em DESC, id DESC);
+
+-- Movimentações não podem ser alteradas nem excluídas
+CREATE OR REPLACE FUNCTION movimentacao_somente_insercao() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'movimentacao aceita apenas inserções';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS movimentacao_imutavel ON movimentacao;
+CREATE TRIGGER movimentacao_imutavel BEFORE UPDATE OR DELETE ON movimentacao
+    FOR EACH STATEMENT EXECUTE FUNCTION movimentacao_somente_insercao();
+
+CREATE OR REPLACE FUNCTION movimentacao_trigger() RETURNS trigger AS $$
+DECLARE
+    tipo_informado TEXT := NULLIF(current_setting('estoque.movimento', true), '');
+    motivo_informado TEXT := NULLIF(current_setting('estoque.motivo', true), '');
+    usuario_informado TEXT := NULLIF(current_setting('estoque.usuario', true), '');
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO movimentacao (id_produto, id_empresa, tipo, quantidade, saldo, motivo, usuario_cpf)
+        SELECT id, id_empresa, COALESCE(tipo_informado, 'entrada'), quantidade, quantidade,
+               COALESCE(motivo_informado, 'cadastro'), usuario_informado
+        FROM novos
+        WHERE quantidade <> 0 AND id_empresa IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO movimentacao (id_produto, id_empresa, tipo, quantidade, saldo, motivo, usuario_cpf)
+        SELECT id, id_empresa, 'ajuste', -quantidade, 0,
+               COALESCE(motivo_informado, 'produto excluído'), usuario_informado
+        FROM antigos
+        WHERE quantidade <> 0 AND id_empresa IS NOT NULL;
+    ELSE
+        -- UPDATE: apenas linhas cuja quantidade mudou (ex.: renomear não gera movimento)
+        INSERT INTO movimentacao (id_produto, id_empresa, tipo, quantidade, saldo, motivo, usuario_cpf)
+        SELECT n.id, n.id_empresa, COALESCE(tipo_informado, 'ajuste'), n.quantidade - a.quantidade,
+               n.quantidade, motivo_informado, usuario_informado
+        FROM novos n
+        JOIN antigos a ON a.id = n.id
+        WHERE n.quantidade <> a.quantidade AND n.id_empresa IS NOT NULL;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Bloqueia escritas em produto até o fim da migração para que o saldo inicial
+-- e a criação dos triggers enxerguem o mesmo estado
+LOCK TABLE produto IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS movimentacao_insert ON produto;
+DROP TRIGGER IF EXISTS movimentacao_update ON produto;
+DROP TRIGGER IF EXISTS movimentacao_delete ON produto;
+
+CREATE TRIGGER movimentacao_insert AFTER INSERT ON produto
+    REFERENCING NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION movimentacao_trigger();
+
+CREATE TRIGGER movimentacao_update AFTER UPDATE ON produto
+    REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION movimentacao_trigger();
+
+CREATE TRIGGER movimentacao_delete AFTER DELETE ON produto
+    REFERENCING OLD TABLE AS antigos
+    FOR EACH STATEMENT EXECUTE FUNCTION movimentacao_trigger();
+
+-- Saldo inicial: o estoque atual vira o primeiro movimento de cada produto
+INSERT INTO movimentacao (id_produto, id_empresa, tipo, quantidade, saldo, motivo)
+SELECT id, id_empresa, 'ajuste', quantidade, quantidade, 'saldo inicial'
+FROM produto
+WHERE quantidade <> 0 AND id_empresa IS NOT NULL;
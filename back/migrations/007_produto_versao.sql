@@ -0,0 +1,18 @@
+-- Versão de cada produto, para controle de concorrência otimista na edição
+-- (PUT /products/<empresa>/<produto> com If-Match ou "version").
+-- O trigger incrementa a versão em toda alteração da linha, por qualquer caminho
+-- (edição, movimentação, soma no cadastro, importação em lote), então uma edição baseada
+-- em uma leitura antiga sempre é recusada.
+
+ALTER TABLE produto ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION produto_versao_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.versao := OLD.versao + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS produto_versao ON produto;
+CREATE TRIGGER produto_versao BEFORE UPDATE ON produto
+    FOR EACH ROW EXECUTE FUNCTION produto_versao_trigger();
@@ -0,0 +1,25 @@
+-- Fila de tarefas em segundo plano (importações e exportações grandes), ver jobs.py.
+-- Trabalhadores pegam a próxima tarefa pendente com FOR UPDATE SKIP LOCKED pelo índice
+-- parcial de pendentes; tarefas em execução registram sinal de vida em heartbeat_em.
+
+CREATE TABLE IF NOT EXISTS tarefa (
+    id BIGSERIAL PRIMARY KEY,
+    tipo VARCHAR(50) NOT NULL,
+    id_empresa INTEGER,
+    usuario_cpf VARCHAR(14),
+    status VARCHAR(20) NOT NULL DEFAULT 'pendente'
+        CHECK (status IN ('pendente', 'executando', 'concluida', 'falhou')),
+    parametros JSONB NOT NULL DEFAULT '{}',
+    progresso SMALLINT NOT NULL DEFAULT 0,
+    resultado JSONB,
+    erro TEXT,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    iniciado_em TIMESTAMP,
+    concluido_em TIMESTAMP,
+    heartbeat_em TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_tarefa_pendente ON tarefa (criado_em, id) WHERE status = 'pendente';
+CREATE INDEX IF NOT EXISTS idx_tarefa_executando ON tarefa (heartbeat_em) WHERE status = 'executando';
+CREATE INDEX IF NOT EXISTS idx_tarefa_concluido ON tarefa (concluido_em) WHERE concluido_em IS NOT NULL;
@@ -0,0 +1,158 @@
+-- Estoque mínimo por produto e alertas de estoque baixo (GET /alerts/<id>, alerts.py).
+-- produto.minimo substitui o limite fixo de 10 da migração 004 (e é o valor padrão).
+-- Estoque baixo: quantidade < minimo, coberto por um índice parcial que contém apenas os
+-- produtos abaixo do mínimo, então a lista de alertas não percorre o estoque inteiro.
+-- Um trigger de instrução avalia só as linhas alteradas por cada comando: produtos que
+-- passam a ficar abaixo do mínimo (ou voltam a ficar acima dele) geram um evento em
+-- alerta_estoque, que é enviado por NOTIFY no canal alerta_estoque ao fim da transação.
+
+ALTER TABLE produto ADD COLUMN IF NOT EXISTS minimo INTEGER NOT NULL DEFAULT 10;
+
+ALTER TABLE produto DROP CONSTRAINT IF EXISTS produto_minimo_positivo;
+ALTER TABLE produto ADD CONSTRAINT produto_minimo_positivo CHECK (minimo >= 0);
+
+CREATE INDEX IF NOT EXISTS idx_produto_abaixo_minimo
+    ON produto (id_empresa, id) WHERE quantidade < minimo;
+
+CREATE TABLE IF NOT EXISTS alerta_estoque (
+    id BIGSERIAL PRIMARY KEY,
+    id_empresa INTEGER NOT NULL,
+    id_produto INTEGER NOT NULL,
+    nome VARCHAR(100),
+    tipo VARCHAR(12) NOT NULL CHECK (tipo IN ('baixo', 'normalizado')),
+    quantidade INTEGER NOT NULL,
+    minimo INTEGER NOT NULL,
+    criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Eventos de uma empresa a partir de um id (retomada do feed com Last-Event-ID)
+CREATE INDEX IF NOT EXISTS idx_alerta_estoque_empresa ON alerta_estoque (id_empresa, id);
+
+CREATE OR REPLACE FUNCTION alerta_estoque_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO alerta_estoque (id_empresa, id_produto, nome, tipo, quantidade, minimo)
+        SELECT id_empresa, id, nome, 'baixo', quantidade, minimo
+        FROM novos
+        WHERE quantidade < minimo AND id_empresa IS NOT NULL;
+    ELSE
+        -- UPDATE: apenas linhas que cruzaram o mínimo (em qualquer sentido)
+        INSERT INTO alerta_estoque (id_empresa, id_produto, nome, tipo, quantidade, minimo)
+        SELECT n.id_empresa, n.id, n.nome,
+               CASE WHEN n.quantidade < n.minimo THEN 'baixo' ELSE 'normalizado' END,
+               n.quantidade, n.minimo
+        FROM novos n
+        JOIN antigos a ON a.id = n.id
+        WHERE (n.quantidade < n.minimo) <> (a.quantidade < a.minimo) AND n.id_empresa IS NOT NULL;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cada evento segue por NOTIFY (entregue aos ouvintes só após o COMMIT)
+CREATE OR REPLACE FUNCTION alerta_estoque_notificar() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('alerta_estoque', json_build_object(
+        'id', NEW.id,
+        'company_id', NEW.id_empresa,
+        'product_id', NEW.id_produto,
+        'name', NEW.nome,
+        'type', NEW.tipo,
+        'quantity', NEW.quantidade,
+        'minimum', NEW.minimo,
+        'created_at', NEW.criado_em
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Estoque baixo do resumo (migração 004) passa a usar o mínimo de cada produto
+CREATE OR REPLACE FUNCTION produto_resumo_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO produto_resumo AS r
+            (id_empresa, total_produtos, total_quantidade, valor_total, estoque_baixo, sem_estoque)
+        SELECT id_empresa, COUNT(*), SUM(quantidade), SUM(quantidade * preco),
+               COUNT(*) FILTER (WHERE quantidade < minimo), COUNT(*) FILTER (WHERE quantidade = 0)
+        FROM novos
+        GROUP BY id_empresa
+        ON CONFLICT (id_empresa) DO UPDATE SET
+            total_produtos = r.total_produtos + EXCLUDED.total_produtos,
+            total_quantidade = r.total_quantidade + EXCLUDED.total_quantidade,
+            valor_total = r.valor_total + EXCLUDED.valor_total,
+            estoque_baixo = r.estoque_baixo + EXCLUDED.estoque_baixo,
+            sem_estoque = r.sem_estoque + EXCLUDED.sem_estoque,
+            atualizado_em = CURRENT_TIMESTAMP;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE produto_resumo r SET
+            total_produtos = r.total_produtos - d.produtos,
+            total_quantidade = r.total_quantidade - d.quantidade,
+            valor_total = r.valor_total - d.valor,
+            estoque_baixo = r.estoque_baixo - d.baixo,
+            sem_estoque = r.sem_estoque - d.sem,
+            atualizado_em = CURRENT_TIMESTAMP
+        FROM (
+            SELECT id_empresa, COUNT(*) AS produtos, SUM(quantidade) AS quantidade,
+                   SUM(quantidade * preco) AS valor,
+                   COUNT(*) FILTER (WHERE quantidade < minimo) AS baixo,
+                   COUNT(*) FILTER (WHERE quantidade = 0) AS sem
+            FROM antigos
+            GROUP BY id_empresa
+        ) d
+        WHERE r.id_empresa = d.id_empresa;
+    ELSE
+        -- UPDATE: diferença entre as versões nova e antiga das linhas alteradas
+        -- (inclusive mudanças só do mínimo)
+        INSERT INTO produto_resumo AS r
+            (id_empresa, total_produtos, total_quantidade, valor_total, estoque_baixo, sem_estoque)
+        SELECT id_empresa, SUM(produtos), SUM(quantidade), SUM(valor), SUM(baixo), SUM(sem)
+        FROM (
+            SELECT id_empresa, 1 AS produtos, quantidade, quantidade * preco AS valor,
+                   (quantidade < minimo)::int AS baixo, (quantidade = 0)::int AS sem
+            FROM novos
+            UNION ALL
+            SELECT id_empresa, -1, -quantidade, -(quantidade * preco),
+                   -((quantidade < minimo)::int), -((quantidade = 0)::int)
+            FROM antigos
+        ) d
+        GROUP BY id_empresa
+        HAVING SUM(produtos) <> 0 OR SUM(quantidade) <> 0 OR SUM(valor) <> 0
+            OR SUM(baixo) <> 0 OR SUM(sem) <> 0
+        ON CONFLICT (id_empresa) DO UPDATE SET
+            total_produtos = r.total_produtos + EXCLUDED.total_produtos,
+            total_quantidade = r.total_quantidade + EXCLUDED.total_quantidade,
+            valor_total = r.valor_total + EXCLUDED.valor_total,
+            estoque_baixo = r.estoque_baixo + EXCLUDED.estoque_baixo,
+            sem_estoque = r.sem_estoque + EXCLUDED.sem_estoque,
+            atualizado_em = CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Bloqueia escritas em produto até o fim da migração para que o recálculo do resumo
+-- e a criação dos triggers enxerguem o mesmo estado
+LOCK TABLE produto IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS alerta_estoque_insert ON produto;
+DROP TRIGGER IF EXISTS alerta_estoque_update ON produto;
+DROP TRIGGER IF EXISTS alerta_estoque_notificar ON alerta_estoque;
+
+CREATE TRIGGER alerta_estoque_insert AFTER INSERT ON produto
+    REFERENCING NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION alerta_estoque_trigger();
+
+CREATE TRIGGER alerta_estoque_update AFTER UPDATE ON produto
+    REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION alerta_estoque_trigger();
+
+CREATE TRIGGER alerta_estoque_notificar AFTER INSERT ON alerta_estoque
+    FOR EACH ROW EXECUTE FUNCTION alerta_estoque_notificar();
+
+-- Recálculo do estoque baixo com o mínimo (igual ao anterior enquanto minimo = 10)
+UPDATE produto_resumo r SET
+    estoque_baixo = (
+        SELECT COUNT(*) FROM produto p
+        WHERE p.id_empresa = r.id_empresa AND p.quantidade < p.minimo
+    ),
+    atualizado_em = CURRENT_TIMESTAMP;
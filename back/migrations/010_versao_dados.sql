@@ -0,0 +1,94 @@
+-- Versão dos dados de cada empresa, usada nas ETags das listagens e nas chaves do cache.
+-- Fica no banco (e não em cada processo): qualquer processo ou trabalhador que altere os
+-- dados muda a versão vista por todos, e ela sobrevive a reinícios.
+-- Triggers de instrução incrementam a versão uma vez por comando para cada empresa
+-- afetada (inclusive na importação em lote e em tarefas em segundo plano).
+-- Grupos: 'produtos' (tabela produto) e 'funcionarios' (tabelas usuario e funcionarios,
+-- cuja coluna de empresa varia entre instalações e é detectada abaixo).
+
+CREATE TABLE IF NOT EXISTS versao_dados (
+    grupo VARCHAR(30) NOT NULL,
+    id_empresa TEXT NOT NULL,
+    versao BIGINT NOT NULL DEFAULT 1,
+    PRIMARY KEY (grupo, id_empresa)
+);
+
+-- Argumentos: grupo e nome da coluna de empresa da tabela
+CREATE OR REPLACE FUNCTION versao_dados_trigger() RETURNS trigger AS $$
+DECLARE
+    grupo_alterado TEXT := TG_ARGV[0];
+    coluna TEXT := TG_ARGV[1];
+    empresas TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        empresas := format('SELECT %I::text AS id_empresa FROM novos', coluna);
+    ELSIF TG_OP = 'DELETE' THEN
+        empresas := format('SELECT %I::text AS id_empresa FROM antigos', coluna);
+    ELSE
+        -- Linhas que mudaram de empresa alteram as duas
+        empresas := format('SELECT %I::text AS id_empresa FROM novos UNION SELECT %I::text FROM antigos', coluna, coluna);
+    END IF;
+    -- Ordem fixa de empresas para que comandos simultâneos travem as linhas na mesma ordem
+    EXECUTE format(
+        'INSERT INTO versao_dados AS v (grupo, id_empresa)
+         SELECT DISTINCT $1, e.id_empresa FROM (%s) e
+         WHERE e.id_empresa IS NOT NULL
+         ORDER BY 2
+         ON CONFLICT (grupo, id_empresa) DO UPDATE SET versao = v.versao + 1',
+        empresas
+    ) USING grupo_alterado;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cria os três triggers de instrução (INSERT/UPDATE/DELETE) de uma tabela
+CREATE OR REPLACE FUNCTION versao_dados_instalar(tabela TEXT, grupo_alterado TEXT, coluna TEXT) RETURNS void AS $$
+BEGIN
+    EXECUTE format('DROP TRIGGER IF EXISTS versao_dados_insert ON %I', tabela);
+    EXECUTE format('DROP TRIGGER IF EXISTS versao_dados_update ON %I', tabela);
+    EXECUTE format('DROP TRIGGER IF EXISTS versao_dados_delete ON %I', tabela);
+    EXECUTE format(
+        'CREATE TRIGGER versao_dados_insert AFTER INSERT ON %I REFERENCING NEW TABLE AS novos
+         FOR EACH STATEMENT EXECUTE FUNCTION versao_dados_trigger(%L, %L)',
+        tabela, grupo_alterado, coluna);
+    EXECUTE format(
+        'CREATE TRIGGER versao_dados_update AFTER UPDATE ON %I REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+         FOR EACH STATEMENT EXECUTE FUNCTION versao_dados_trigger(%L, %L)',
+        tabela, grupo_alterado, coluna);
+    EXECUTE format(
+        'CREATE TRIGGER versao_dados_delete AFTER DELETE ON %I REFERENCING OLD TABLE AS antigos
+         FOR EACH STATEMENT EXECUTE FUNCTION versao_dados_trigger(%L, %L)',
+        tabela, grupo_alterado, coluna);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT versao_dados_instalar('produto', 'produtos', 'id_empresa');
+
+-- Funcionários: mesma ordem de preferência de schema_cache.COLUMN_CANDIDATES
+DO $$
+DECLARE
+    alvo RECORD;
+    coluna TEXT;
+BEGIN
+    FOR alvo IN
+        SELECT * FROM (VALUES
+            (1, 'usuario', ARRAY['id_empresa', 'empresa_id', 'empresa', 'company_id']),
+            (2, 'funcionarios', ARRAY['id_empresa', 'empresa_id', 'company_id', 'idempresa', 'empresa'])
+        ) AS t(ordem, tabela, candidatas)
+        ORDER BY ordem
+    LOOP
+        SELECT c.candidata INTO coluna
+        FROM unnest(alvo.candidatas) WITH ORDINALITY AS c(candidata, posicao)
+        JOIN information_schema.columns ic
+          ON ic.table_name = alvo.tabela AND ic.column_name = c.candidata
+        ORDER BY c.posicao
+        LIMIT 1;
+
+        IF coluna IS NULL THEN
+            RAISE NOTICE 'Tabela % sem coluna de empresa: versão de funcionários não mantida por ela', alvo.tabela;
+        ELSE
+            PERFORM versao_dados_instalar(alvo.tabela, 'funcionarios', coluna);
+        END IF;
+    END LOOP;
+END;
+$$;
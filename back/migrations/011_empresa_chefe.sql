@@ -0,0 +1,75 @@
+-- Empresas de cada chefe. Até aqui as empresas existiam só no navegador e o token de um
+-- chefe dava acesso a qualquer id de empresa; agora o login coloca no token apenas as
+-- empresas registradas aqui para o CPF do chefe (session_tokens.can_access_company).
+
+CREATE TABLE IF NOT EXISTS empresa_chefe (
+    id_empresa SERIAL PRIMARY KEY,
+    chefe_cpf VARCHAR(14) NOT NULL,
+    nome VARCHAR(50) NOT NULL,
+    criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Empresas do chefe no login (na mesma consulta do usuário)
+CREATE INDEX IF NOT EXISTS idx_empresa_chefe_cpf ON empresa_chefe (chefe_cpf, id_empresa);
+
+-- Ids já usados por produtos e funcionários existentes e a atribuição deles:
+-- com um único chefe cadastrado as empresas existentes passam a ser dele. Com vários não
+-- há no banco registro de qual chefe criou cada uma, e uma empresa sem dono deixaria de
+-- ser acessível por todos eles: a migração é interrompida (nada é alterado) e lista as
+-- empresas. Para atribuí-las, crie antes a tabela (o CREATE TABLE acima), grave os donos
+-- (INSERT INTO empresa_chefe (id_empresa, chefe_cpf, nome) ...) e rode a migração de novo.
+DO $$
+DECLARE
+    coluna TEXT;
+    chefes TEXT[];
+    sem_dono TEXT;
+    maior_id INTEGER;
+BEGIN
+    CREATE TEMP TABLE empresas_existentes (id_empresa INTEGER PRIMARY KEY) ON COMMIT DROP;
+
+    INSERT INTO empresas_existentes
+    SELECT DISTINCT id_empresa FROM produto WHERE id_empresa IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    -- Coluna de empresa de usuario: mesma ordem de schema_cache.COLUMN_CANDIDATES
+    SELECT c.candidata INTO coluna
+    FROM unnest(ARRAY['id_empresa', 'empresa_id', 'empresa', 'company_id']) WITH ORDINALITY AS c(candidata, posicao)
+    JOIN information_schema.columns ic
+      ON ic.table_name = 'usuario' AND ic.column_name = c.candidata
+    ORDER BY c.posicao
+    LIMIT 1;
+
+    IF coluna IS NOT NULL THEN
+        EXECUTE format(
+            'INSERT INTO empresas_existentes
+             SELECT DISTINCT %I::integer FROM usuario WHERE %I::text ~ ''^[0-9]+$''
+             ON CONFLICT DO NOTHING',
+            coluna, coluna);
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'usuario' AND column_name = 'tipo_acesso') THEN
+        SELECT array_agg(DISTINCT regexp_replace(cpf, '\D', '', 'g')) INTO chefes FROM usuario WHERE lower(tipo_acesso) = 'chefe';
+    END IF;
+
+    IF coalesce(array_length(chefes, 1), 0) = 1 THEN
+        INSERT INTO empresa_chefe (id_empresa, chefe_cpf, nome)
+        SELECT id_empresa, chefes[1], 'Empresa ' || id_empresa FROM empresas_existentes
+        ON CONFLICT (id_empresa) DO NOTHING;
+    ELSIF coalesce(array_length(chefes, 1), 0) > 1 THEN
+        SELECT string_agg(e.id_empresa::text, ', ' ORDER BY e.id_empresa) INTO sem_dono
+        FROM empresas_existentes e
+        WHERE NOT EXISTS (SELECT 1 FROM empresa_chefe c WHERE c.id_empresa = e.id_empresa);
+        IF sem_dono IS NOT NULL THEN
+            RAISE EXCEPTION 'Empresas sem chefe: %. Atribua cada uma em empresa_chefe antes de aplicar esta migração', sem_dono;
+        END IF;
+    END IF;
+
+    -- Novas empresas recebem ids ainda não usados por nenhum dado existente
+    SELECT GREATEST(
+        (SELECT COALESCE(MAX(id_empresa), 0) FROM empresas_existentes),
+        (SELECT COALESCE(MAX(id_empresa), 0) FROM empresa_chefe)
+    ) INTO maior_id;
+    PERFORM setval(pg_get_serial_sequence('empresa_chefe', 'id_empresa'), GREATEST(maior_id, 1), maior_id > 0);
+END;
+$$;
@@ -0,0 +1,5 @@
+-- Retenção dos eventos de estoque baixo (migração 009): a manutenção dos trabalhadores de
+-- tarefas (jobs.py) apaga os eventos mais antigos que ALERTS_RETENTION_HOURS. O índice
+-- deixa essa limpeza periódica restrita aos eventos expirados.
+
+CREATE INDEX IF NOT EXISTS idx_alerta_estoque_criado_em ON alerta_estoque (criado_em);
@@ -0,0 +1,12 @@
+-- Modo de compatibilidade para a transição dos CPFs (não é aplicado por migrate.py).
+-- Enquanto outros sistemas ainda gravarem CPFs formatados em usuario, esta coluna gerada
+-- guarda apenas os dígitos e tem índice único; quando ela existe, o login busca por ela
+-- (ver db_operations._build_user_lookup), sempre por igualdade.
+-- Requer PostgreSQL 12 ou superior. Aplicar manualmente:
+--     psql -d Estoque -f migrations/opcional/usuario_cpf_gerado.sql
+-- Ao fim da transição, remover com: ALTER TABLE usuario DROP COLUMN cpf_normalizado;
+
+ALTER TABLE usuario ADD COLUMN IF NOT EXISTS cpf_normalizado TEXT
+    GENERATED ALWAYS AS (regexp_replace(cpf, '\D', '', 'g')) STORED;
+
+CREATE UNIQUE INDEX IF NOT EXISTS usuario_cpf_normalizado_key ON usuario (cpf_normalizado);
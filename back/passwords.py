@@ -0,0 +1,169 @@
+"""
+Serviço de hash de senhas.
+
+As senhas são guardadas com scrypt (salt aleatório) no formato versionado
+    scrypt$1$<n>$<r>$<p>$<salt base64>$<hash base64>
+Hashes antigos (SHA-256 hexadecimal, sem salt) continuam aceitos no login e são
+regravados no formato atual assim que o usuário entra com a senha correta.
+
+O scrypt roda em um pool de processos limitado, fora do GIL e das threads que atendem
+requisições. Quando há pedidos demais na fila, `HashingBusyError` é lançado em vez de
+acumular espera (a API responde 503); um cálculo que passa de PASSWORD_HASH_TIMEOUT
+também vira `HashingBusyError`.
+"""
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+SCHEME = 'scrypt'
+FORMAT_VERSION = '1'
+
+# Custo do scrypt: memória usada = 128 * n * r bytes (32 MB com os padrões)
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', str(2 ** 15)))
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', '1'))
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# Processos do pool (0 = calcula na própria thread, sem pool)
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(os.cpu_count() or 1, 4))))
+# Pedidos em andamento + na fila acima dos quais novos pedidos são recusados
+HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE', str(max(HASH_WORKERS, 1) * 8)))
+# Tempo máximo (s) aguardando um resultado do pool
+HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+
+
+class HashingBusyError(Exception):
+    """Fila de hash cheia: o pedido foi recusado para não sobrecarregar o servidor"""
+
+
+class HashingTimeoutError(HashingBusyError):
+    """O resultado não ficou pronto dentro de PASSWORD_HASH_TIMEOUT (servidor sobrecarregado)"""
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+# Salt fixo do processo para verify_dummy (o resultado é descartado)
+_DUMMY_SALT = os.urandom(SALT_BYTES)
+
+
+def _scrypt(password, salt, n, r, p):
+    """Executado nos processos do pool"""
+    return hashlib.scrypt(
+        password.encode('utf-8'),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=256 * n * r,
+        dklen=HASH_BYTES,
+    )
+
+
+def _get_executor():
+    """Cria o pool na primeira chamada (ou de novo após um fork do processo)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # spawn: os processos não herdam threads nem conexões do servidor
+            _executor = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _derive(password, salt, n, r, p):
+    if HASH_WORKERS <= 0:
+        return _scrypt(password, salt, n, r, p)
+
+    if not _slots.acquire(blocking=False):
+        raise HashingBusyError("Muitas requisições de autenticação em andamento")
+    try:
+        future = _get_executor().submit(_scrypt, password, salt, n, r, p)
+    except Exception:
+        _slots.release()
+        raise
+    # O lugar na fila só é liberado quando o cálculo termina de fato
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeoutError:
+        raise HashingTimeoutError(f"Hash de senha não concluído em {HASH_TIMEOUT:.0f}s")
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def hash_password(password):
+    """Gera o hash da senha no formato atual"""
+    salt = os.urandom(SALT_BYTES)
+    derived = _derive(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return '$'.join([
+        SCHEME, FORMAT_VERSION, str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P),
+        _b64encode(salt), _b64encode(derived),
+    ])
+
+
+def _is_legacy(stored_hash):
+    return len(stored_hash) == 64 and all(c in '0123456789abcdef' for c in stored_hash.lower())
+
+
+def verify_password(password, stored_hash):
+    """
+    Confere a senha com o hash guardado (comparação em tempo constante).
+    Retorna (correta, precisa_regravar): `precisa_regravar` indica hash legado ou
+    parâmetros de custo diferentes dos atuais.
+    """
+    if not stored_hash:
+        return False, False
+
+    if _is_legacy(stored_hash):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored_hash.lower()), True
+
+    parts = stored_hash.split('$')
+    if len(parts) != 7 or parts[0] != SCHEME or parts[1] != FORMAT_VERSION:
+        return False, False
+    try:
+        n, r, p = int(parts[2]), int(parts[3]), int(parts[4])
+        salt, expected = _b64decode(parts[5]), _b64decode(parts[6])
+    except ValueError:
+        return False, False
+
+    derived = _derive(password, salt, n, r, p)
+    if not hmac.compare_digest(derived, expected):
+        return False, False
+    return True, (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def verify_dummy(password):
+    """
+    Calcula um scrypt com os parâmetros atuais e descarta o resultado. Usado no login de
+    CPFs inexistentes para que a resposta leve o mesmo tempo de uma senha errada e não
+    revele quais CPFs estão cadastrados.
+    """
+    _derive(password, _DUMMY_SALT, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return False
+
+
+def shutdown():
+    """Encerra o pool de processos (usado no encerramento do servidor)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,67 @@
+"""
+Formatos de saída da exportação de produtos.
+
+Cada encoder recebe um iterável de produtos (dicionários de `_product_from_row`) e gera
+o corpo da resposta aos pedaços, sem montar a lista inteira na memória.
+"""
+import csv
+import io
+import json
+
+# Tamanho aproximado (bytes) de cada pedaço enviado ao cliente
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+CSV_FIELDS = ('id', 'name', 'quantity', 'value')
+
+
+def encode_ndjson(products):
+    """Um objeto JSON por linha"""
+    for product in products:
+        yield json.dumps(product, ensure_ascii=False) + '\n'
+
+
+def encode_json_array(products):
+    """O mesmo formato da listagem: {"products": [...]}"""
+    yield '{"products": ['
+    separator = ''
+    for product in products:
+        yield separator + json.dumps(product, ensure_ascii=False)
+        separator = ','
+    yield ']}'
+
+
+def encode_csv(products):
+    """CSV com cabeçalho id,name,quantity,value"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(CSV_FIELDS)
+    for product in products:
+        writer.writerow([product[field] for field in CSV_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+# formato -> (encoder, Content-Type, extensão do arquivo)
+FORMATS = {
+    'ndjson': (encode_ndjson, 'application/x-ndjson', 'ndjson'),
+    'json': (encode_json_array, 'application/json', 'json'),
+    'csv': (encode_csv, 'text/csv', 'csv'),
+}
+
+
+def in_chunks(parts, chunk_size=EXPORT_CHUNK_SIZE):
+    """Agrupa os pedaços de texto em blocos UTF-8 de ~chunk_size bytes"""
+    pending = []
+    size = 0
+    for part in parts:
+        data = part.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield b''.join(pending)
@@ -0,0 +1,96 @@
+"""
+Leitura dos formatos aceitos pela importação em lote de produtos.
+
+Cada parser devolve um gerador de (linha, registro), onde `registro` é um dicionário
+com as chaves 'name', 'quantity' e 'value' (ou uma string de erro quando a linha não
+pôde ser interpretada). A leitura é feita em fluxo, sem carregar o corpo inteiro na memória.
+"""
+import codecs
+import csv
+import json
+
+# Cabeçalhos de CSV aceitos para cada campo
+CSV_HEADER_ALIASES = {
+    'name': ('name', 'nome'),
+    'quantity': ('quantity', 'quantidade'),
+    'value': ('value', 'valor', 'preco'),
+}
+
+
+def _text_lines(stream):
+    """Decodifica o fluxo binário da requisição em linhas de texto (UTF-8)"""
+    return codecs.getreader('utf-8-sig')(stream)
+
+
+def parse_json_array(stream):
+    """JSON com uma lista de produtos (ou {"products": [...]})"""
+    try:
+        data = json.load(_text_lines(stream))
+    except ValueError as e:
+        yield 1, f"JSON inválido: {e}"
+        return
+
+    if isinstance(data, dict):
+        data = data.get('products')
+    if not isinstance(data, list):
+        yield 1, "O corpo deve ser uma lista de produtos"
+        return
+
+    for index, item in enumerate(data, start=1):
+        yield index, item if isinstance(item, dict) else "Produto deve ser um objeto"
+
+
+def parse_ndjson(stream):
+    """Um objeto JSON por linha (linhas em branco são ignoradas)"""
+    for index, line in enumerate(_text_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            yield index, f"JSON inválido: {e}"
+            continue
+        yield index, item if isinstance(item, dict) else "Produto deve ser um objeto"
+
+
+def parse_csv(stream):
+    """CSV com cabeçalho (name,quantity,value ou nome,quantidade,preco)"""
+    reader = csv.reader(_text_lines(stream))
+    header = next(reader, None)
+    if header is None:
+        return
+
+    positions = {}
+    normalized = [col.strip().lower() for col in header]
+    for field, aliases in CSV_HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                positions[field] = normalized.index(alias)
+                break
+
+    if 'name' not in positions:
+        yield 1, "Cabeçalho CSV deve conter a coluna 'name' (ou 'nome')"
+        return
+
+    # A linha 1 é o cabeçalho
+    for index, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        yield index, {
+            field: row[pos] if pos < len(row) else None
+            for field, pos in positions.items()
+        }
+
+
+PARSERS = {
+    'application/json': parse_json_array,
+    'application/x-ndjson': parse_ndjson,
+    'application/ndjson': parse_ndjson,
+    'application/jsonl': parse_ndjson,
+    'text/csv': parse_csv,
+}
+
+
+def get_parser(mimetype):
+    """Retorna o parser para o Content-Type informado (None se não suportado)"""
+    return PARSERS.get((mimetype or '').lower())
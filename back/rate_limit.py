@@ -0,0 +1,153 @@
+"""
+Limitador de tentativas (janela deslizante) para proteger o login contra força bruta.
+
+Cada chave (ex.: 'cpf:12345678901' ou 'ip:10.0.0.1') guarda só dois contadores: o da
+janela atual e o da anterior. A estimativa de tentativas nos últimos `window` segundos é
+    anterior * (fração da janela anterior ainda dentro do intervalo) + atual
+Tentativas recusadas não são contadas.
+
+Backends (variável de ambiente RATE_LIMIT_BACKEND):
+- memory (padrão): dicionário no processo, com limpeza periódica das chaves inativas
+- redis: contadores compartilhados entre processos/workers (requer o pacote `redis`)
+"""
+import math
+import os
+import threading
+import time
+
+import logs
+
+log = logs.get_logger(__name__)
+
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_REDIS_URL = os.environ.get(
+    'RATE_LIMIT_REDIS_URL', os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+)
+# Tentativas de login permitidas por janela: (limite, janela em segundos)
+LOGIN_LIMITS = {
+    'cpf': (int(os.environ.get('LOGIN_LIMIT_CPF', '5')), int(os.environ.get('LOGIN_WINDOW_CPF', '300'))),
+    'ip': (int(os.environ.get('LOGIN_LIMIT_IP', '30')), int(os.environ.get('LOGIN_WINDOW_IP', '60'))),
+}
+# Intervalo (s) entre limpezas das chaves inativas no backend em memória
+CLEANUP_INTERVAL = 60
+
+
+def _estimate(previous, current, window, now, start):
+    weight = (window - (now - start)) / window
+    return previous * weight + current
+
+
+def _retry_after(previous, current, limit, window, now, start):
+    """Segundos até a estimativa ficar abaixo do limite"""
+    if current >= limit or previous == 0:
+        wait = start + window - now
+    else:
+        # Tempo para o peso da janela anterior cair até (limite - atual) / anterior
+        elapsed_needed = window * (1 - (limit - current) / previous)
+        wait = start + elapsed_needed - now
+    return max(1, math.ceil(wait))
+
+
+class MemoryBackend:
+    """Contadores em memória: chave -> (início da janela, contagem anterior, contagem atual, janela)"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+
+    def _cleanup(self, now):
+        # Chaves sem tentativas nas duas últimas janelas não afetam mais a estimativa
+        stale = [key for key, (start, _, _, window) in self._data.items() if start + 2 * window <= now]
+        for key in stale:
+            del self._data[key]
+
+    def hit(self, key, limit, window):
+        now = time.monotonic()
+        start = now - now % window
+        with self._lock:
+            if now >= self._next_cleanup:
+                self._cleanup(now)
+                self._next_cleanup = now + CLEANUP_INTERVAL
+
+            entry = self._data.get(key)
+            if entry is None or entry[0] < start - window:
+                previous, current = 0, 0
+            elif entry[0] < start:
+                previous, current = entry[2], 0
+            else:
+                previous, current = entry[1], entry[2]
+
+            if _estimate(previous, current, window, now, start) >= limit:
+                self._data[key] = (start, previous, current, window)
+                return _retry_after(previous, current, limit, window, now, start)
+
+            self._data[key] = (start, previous, current + 1, window)
+            return None
+
+    def reset(self, key, window):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisBackend:
+    """Contadores no Redis, uma chave por janela (expiram sozinhas após duas janelas)"""
+
+    def __init__(self, url):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        start = int(now - now % window)
+        current_key = f"rl:{key}:{start}"
+        previous_key = f"rl:{key}:{start - window}"
+
+        previous, current = self._client.mget(previous_key, current_key)
+        previous, current = int(previous or 0), int(current or 0)
+        if _estimate(previous, current, window, now, start) >= limit:
+            return _retry_after(previous, current, limit, window, now, start)
+
+        pipe = self._client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, 2 * window)
+        pipe.execute()
+        return None
+
+    def reset(self, key, window):
+        now = time.time()
+        start = int(now - now % window)
+        self._client.delete(f"rl:{key}:{start}", f"rl:{key}:{start - window}")
+
+
+def _create_backend():
+    if RATE_LIMIT_BACKEND == 'redis':
+        try:
+            return RedisBackend(RATE_LIMIT_REDIS_URL)
+        except ImportError:
+            log.warning("Pacote 'redis' não instalado; limitador de login em memória")
+    return MemoryBackend()
+
+
+backend = _create_backend()
+
+
+def check_login(cpf, ip):
+    """
+    Registra uma tentativa de login. Retorna None se permitida ou os segundos de espera
+    (Retry-After) se o CPF ou o IP excederam o limite.
+    """
+    for scope, key in (('ip', ip), ('cpf', cpf)):
+        limit, window = LOGIN_LIMITS[scope]
+        if limit <= 0 or not key:
+            continue
+        retry_after = backend.hit(f"{scope}:{key}", limit, window)
+        if retry_after is not None:
+            return retry_after
+    return None
+
+
+def reset_login(cpf):
+    """Zera as tentativas do CPF após um login bem-sucedido"""
+    backend.reset(f"cpf:{cpf}", LOGIN_LIMITS['cpf'][1])
@@ -0,0 +1,177 @@
+"""
+Cache de metadados do esquema do banco de dados.
+
+As colunas das tabelas usadas pela aplicação são descobertas uma única vez
+(na inicialização ou no primeiro uso) e reaproveitadas por todas as requisições,
+evitando consultas ao information_schema a cada login ou cadastro.
+As consultas SQL montadas a partir dessas colunas também ficam guardadas aqui.
+"""
+import os
+import threading
+import time
+
+import psycopg2
+
+import logs
+from db_config import db_connection
+
+log = logs.get_logger(__name__)
+
+# Tabelas carregadas de uma vez na inicialização
+TRACKED_TABLES = ('usuario', 'funcionarios', 'produto', 'empresa')
+
+# Nomes alternativos aceitos para cada coluna, em ordem de preferência
+COLUMN_CANDIDATES = {
+    'usuario': {
+        'empresa': ['id_empresa', 'empresa_id', 'empresa', 'company_id'],
+    },
+    'funcionarios': {
+        'id': ['id', 'id_funcionario', 'funcionario_id'],
+        'cpf': ['cpf', 'cpf_funcionario', 'cpf_colaborador', 'cpf_colab'],
+        'empresa': ['id_empresa', 'empresa_id', 'company_id', 'idempresa', 'empresa'],
+        'senha': ['senha', 'password_hash', 'hash_senha'],
+        'nome': ['nome', 'name'],
+    },
+}
+
+# Tempo de vida do cache em segundos (0 = não expira, apenas invalidação explícita)
+SCHEMA_CACHE_TTL = float(os.environ.get('SCHEMA_CACHE_TTL', '300'))
+
+# Protege apenas a troca dos dicionários; nenhuma consulta ao banco é feita com ele
+_lock = threading.RLock()
+# Uma única thread recarrega os metadados vencidos por vez
+_refresh_lock = threading.Lock()
+_columns = {}
+_statements = {}
+_loaded_at = None
+# Muda a cada recarga; consultas montadas com metadados de uma geração anterior são descartadas
+_generation = 0
+
+
+def _introspect(tables):
+    """Consulta o information_schema para as tabelas informadas em uma única ida ao banco"""
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT table_name, column_name
+                FROM information_schema.columns
+                WHERE table_name = ANY(%s)
+                ORDER BY table_name, ordinal_position;
+                """,
+                (list(tables),),
+            )
+            found = {table: [] for table in tables}
+            for table_name, column_name in cur.fetchall():
+                found[table_name].append(column_name)
+            cur.close()
+        return found
+    except psycopg2.Error as e:
+        log.error("Erro ao carregar metadados do esquema", error=str(e))
+        return None
+
+
+def _is_expired():
+    if _loaded_at is None:
+        return True
+    return SCHEMA_CACHE_TTL > 0 and time.monotonic() - _loaded_at > SCHEMA_CACHE_TTL
+
+
+def warm_up(tables=TRACKED_TABLES):
+    """Carrega (ou recarrega) os metadados das tabelas e descarta as consultas montadas"""
+    global _loaded_at, _generation
+    found = _introspect(tables)
+    if found is None:
+        return False
+    with _lock:
+        _columns.update(found)
+        _statements.clear()
+        _loaded_at = time.monotonic()
+        _generation += 1
+    return True
+
+
+def _refresh_if_expired():
+    """
+    Recarrega os metadados vencidos fora do lock. Enquanto uma thread consulta o banco,
+    as demais seguem com os metadados atuais; só esperam se ainda não houver nenhum.
+    """
+    with _lock:
+        if not _is_expired():
+            return
+        tables = tuple(set(TRACKED_TABLES) | set(_columns))
+        has_data = bool(_columns)
+    if not _refresh_lock.acquire(blocking=not has_data):
+        return
+    try:
+        with _lock:
+            expired = _is_expired()
+        if expired:
+            warm_up(tables)
+    finally:
+        _refresh_lock.release()
+
+
+def invalidate(table=None):
+    """Descarta o cache de uma tabela (ou de todas) para forçar nova introspecção"""
+    global _loaded_at, _generation
+    with _lock:
+        if table is None:
+            _columns.clear()
+            _loaded_at = None
+        else:
+            _columns.pop(table, None)
+        _statements.clear()
+        _generation += 1
+
+
+def get_table_columns(table_name):
+    """
+    Retorna a lista de colunas de uma tabela ou lista vazia se não existir.
+    """
+    _refresh_if_expired()
+    with _lock:
+        if table_name in _columns:
+            return list(_columns[table_name])
+    found = _introspect((table_name,))
+    if found is None:
+        return []
+    with _lock:
+        _columns.update(found)
+        return list(_columns[table_name])
+
+
+def detect_column(columns, candidates):
+    """
+    Retorna o primeiro nome de coluna encontrado em `columns` que esteja na lista `candidates`.
+    """
+    for candidate in candidates:
+        if candidate in columns:
+            return candidate
+    return None
+
+
+def resolve_column(table_name, role):
+    """Resolve qual coluna da tabela cumpre o papel informado (ex.: 'empresa' em 'usuario')"""
+    return detect_column(get_table_columns(table_name), COLUMN_CANDIDATES[table_name][role])
+
+
+def get_statement(key, builder):
+    """
+    Retorna a consulta guardada em `key`, montando-a com `builder()` na primeira vez.
+
+    O cache de consultas é descartado sempre que os metadados são recarregados,
+    então `builder` pode depender livremente das colunas detectadas.
+    """
+    _refresh_if_expired()
+    with _lock:
+        if key in _statements:
+            return _statements[key]
+        generation = _generation
+    # builder() pode consultar o banco (get_table_columns): montado fora do lock
+    statement = builder()
+    with _lock:
+        if generation == _generation:
+            return _statements.setdefault(key, statement)
+    return statement
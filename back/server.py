@@ -0,0 +1,133 @@
+"""
+Inicialização do backend para produção (gunicorn, modelo pré-fork).
+
+Diferente de `python app.py`, não usa modo debug nem recarregamento automático e não cria
+o usuário de teste. Cada worker abre o próprio pool de conexões após o fork e carrega o
+cache de esquema antes de atender requisições.
+
+Uso (Linux):
+    python server.py
+
+Configuração (variáveis de ambiente):
+    WEB_BIND                 endereço de escuta (padrão 0.0.0.0:5000)
+    WEB_WORKERS              processos (padrão 2 * núcleos + 1; 1 sem Redis, ver abaixo)
+    WEB_THREADS              threads por processo (padrão 4)
+    WEB_TIMEOUT              segundos sem resposta até o worker ser reiniciado (padrão 30)
+    WEB_GRACEFUL_TIMEOUT     segundos para concluir requisições ao reiniciar/parar (padrão 30)
+    WEB_MAX_REQUESTS         requisições até o worker ser reciclado (padrão 5000, 0 = nunca)
+    WEB_MAX_REQUESTS_JITTER  variação aleatória do limite acima (padrão 500)
+    JOBS_WORKERS             trabalhadores de tarefas iniciados pelo master (padrão 2, ver jobs.py)
+
+Cache, revogação de tokens e limite de login guardam estado em memória de cada processo,
+a menos que usem Redis (CACHE_BACKEND, SESSION_REVOCATION_BACKEND e RATE_LIMIT_BACKEND =
+redis). Sem isso o servidor roda com um único worker; um WEB_WORKERS maior que 1 definido
+explicitamente impede a inicialização.
+
+Reinício gradual: `kill -HUP <pid do master>` sobe novos workers e encerra os antigos só
+depois que terminarem as requisições em andamento. Para carregar código novo use
+`kill -USR2` (novo master) seguido de `kill -WINCH` e `kill -QUIT` no master antigo.
+"""
+import multiprocessing
+import os
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+WEB_CONFIG = {
+    'bind': os.environ.get('WEB_BIND', '0.0.0.0:5000'),
+    'workers': int(os.environ.get('WEB_WORKERS', str(multiprocessing.cpu_count() * 2 + 1))),
+    'threads': int(os.environ.get('WEB_THREADS', '4')),
+    'timeout': int(os.environ.get('WEB_TIMEOUT', '30')),
+    'graceful_timeout': int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30')),
+    'max_requests': int(os.environ.get('WEB_MAX_REQUESTS', '5000')),
+    'max_requests_jitter': int(os.environ.get('WEB_MAX_REQUESTS_JITTER', '500')),
+    # Carrega o app uma vez no master: os workers herdam o código já importado
+    # (e o mesmo segredo temporário de tokens, caso AUTH_TOKEN_SECRET não esteja definido)
+    'preload_app': True,
+    'accesslog': '-',
+}
+
+
+def process_local_state():
+    """Variáveis cujo backend atual guarda estado só no processo (não compartilhado entre workers)"""
+    import cache
+    import rate_limit
+    import session_tokens
+
+    local = []
+    if isinstance(cache.backend, cache.MemoryBackend) and cache.backend.max_items > 0:
+        local.append('CACHE_BACKEND')
+    if isinstance(session_tokens.revocations, session_tokens.MemoryRevocations):
+        local.append('SESSION_REVOCATION_BACKEND')
+    if isinstance(rate_limit.backend, rate_limit.MemoryBackend):
+        local.append('RATE_LIMIT_BACKEND')
+    return local
+
+
+def when_ready(server):
+    """Executado no master: inicia os trabalhadores de tarefas em segundo plano"""
+    import jobs
+
+    jobs.start_workers()
+
+
+def on_exit(server):
+    import jobs
+
+    jobs.stop_workers()
+
+
+def post_fork(server, worker):
+    """Executado em cada worker logo após o fork"""
+    import alerts
+    import db_config
+    import schema_cache
+
+    db_config.init_connection_pool()
+    if schema_cache.warm_up():
+        server.log.info("Worker %s: cache de esquema carregado", worker.pid)
+    alerts.retention.start()
+
+
+def worker_exit(server, worker):
+    """Libera as conexões e o pool de hash de senhas do worker ao encerrar"""
+    import alerts
+    import db_config
+    import passwords
+
+    alerts.retention.stop()
+    db_config.close_connection_pool()
+    passwords.shutdown()
+
+
+class TechTitansServer(BaseApplication):
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set('when_ready', when_ready)
+        self.cfg.set('on_exit', on_exit)
+        self.cfg.set('post_fork', post_fork)
+        self.cfg.set('worker_exit', worker_exit)
+
+    def load(self):
+        from app import app
+
+        return app
+
+
+if __name__ == '__main__':
+    print("🚀 Iniciando servidor Tech Titans (produção)...")
+    local_state = process_local_state()
+    if WEB_CONFIG['workers'] > 1 and local_state:
+        # Cada worker teria a sua cópia: logout e limite de tentativas valeriam só nele
+        if 'WEB_WORKERS' in os.environ:
+            sys.exit(f"❌ WEB_WORKERS={WEB_CONFIG['workers']} requer estado compartilhado: "
+                     f"defina {', '.join(local_state)}=redis ou use WEB_WORKERS=1")
+        print(f"⚠️  {', '.join(local_state)} em memória: usando 1 worker (defina =redis para mais)")
+        WEB_CONFIG['workers'] = 1
+    print(f"🔧 {WEB_CONFIG['workers']} workers x {WEB_CONFIG['threads']} threads em {WEB_CONFIG['bind']}")
+    TechTitansServer(WEB_CONFIG).run()
@@ -0,0 +1,197 @@
+"""
+Tokens de sessão assinados (HMAC-SHA256), verificados sem consultar o banco.
+
+Formato: v1.<dados>.<assinatura>, ambos em base64url. Os dados são um JSON compacto:
+    sub  - CPF do usuário
+    role - 'chefe' ou 'funcionario'
+    cid  - empresa do funcionário (None para chefes, que gerenciam várias empresas)
+    cids - empresas do chefe (empresa_chefe), apenas em tokens de chefe
+    exp  - expiração (timestamp Unix)
+    jti  - identificador único, usado na revogação (logout)
+
+Tokens revogados ficam registrados até expirarem (variável SESSION_REVOCATION_BACKEND):
+- memory (padrão): lista em memória do processo; um filtro de Bloom na frente dela responde
+  "não revogado" para quase todos os tokens sem tocar na lista. Só serve para um processo.
+- redis: uma chave por token revogado, com expiração igual à do token, vista por todos os
+  processos/workers (requer o pacote `redis`)
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+import logs
+
+log = logs.get_logger(__name__)
+
+SESSION_REVOCATION_BACKEND = os.environ.get('SESSION_REVOCATION_BACKEND', 'memory')
+SESSION_REVOCATION_REDIS_URL = os.environ.get(
+    'SESSION_REVOCATION_REDIS_URL', os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+)
+
+TOKEN_VERSION = 'v1'
+# Validade do token em segundos (padrão: 8 horas)
+TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL', str(8 * 3600)))
+
+_secret = os.environ.get('AUTH_TOKEN_SECRET', '').encode()
+if not _secret:
+    # Sem segredo configurado os tokens só valem para este processo (e até ele reiniciar)
+    log.warning("AUTH_TOKEN_SECRET não definido; usando segredo temporário")
+    _secret = secrets.token_bytes(32)
+
+
+class BloomFilter:
+    """Filtro de Bloom simples: pode dar falso positivo, nunca falso negativo"""
+
+    def __init__(self, size_bits=1 << 16, hashes=4):
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self._bits = bytearray(size_bits // 8)
+
+    def _positions(self, key):
+        digest = hashlib.sha256(key.encode()).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[i * 4:i * 4 + 4], 'big') % self.size_bits
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self._bits[pos // 8] |= 1 << (pos % 8)
+
+    def __contains__(self, key):
+        return all(self._bits[pos // 8] & (1 << (pos % 8)) for pos in self._positions(key))
+
+
+class MemoryRevocations:
+    """Revogações em memória do processo: jti -> expiração, com filtro de Bloom na frente"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._bloom = BloomFilter()
+
+    def is_revoked(self, jti):
+        # Caminho rápido: ausente no filtro significa com certeza não revogado
+        if jti not in self._bloom:
+            return False
+        with self._lock:
+            return jti in self._revoked
+
+    def _purge_expired(self):
+        """Remove revogações de tokens já expirados e reconstrói o filtro (com o lock adquirido)"""
+        now = time.time()
+        expired = [jti for jti, exp in self._revoked.items() if exp < now]
+        if not expired:
+            return
+        for jti in expired:
+            del self._revoked[jti]
+        bloom = BloomFilter()
+        for jti in self._revoked:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def revoke(self, jti, expires_at):
+        with self._lock:
+            self._purge_expired()
+            self._revoked[jti] = expires_at
+            self._bloom.add(jti)
+
+
+class RedisRevocations:
+    """Revogações no Redis, compartilhadas entre processos (cada chave expira com o token)"""
+
+    def __init__(self, url):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+
+    def is_revoked(self, jti):
+        return bool(self._client.exists(f"revogado:{jti}"))
+
+    def revoke(self, jti, expires_at):
+        ttl = int(expires_at - time.time()) + 1
+        if ttl > 0:
+            self._client.set(f"revogado:{jti}", 1, ex=ttl)
+
+
+def _create_revocations():
+    if SESSION_REVOCATION_BACKEND == 'redis':
+        try:
+            return RedisRevocations(SESSION_REVOCATION_REDIS_URL)
+        except ImportError:
+            log.warning("Pacote 'redis' não instalado; revogação de tokens em memória")
+    return MemoryRevocations()
+
+
+revocations = _create_revocations()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(_secret, f"{TOKEN_VERSION}.{payload}".encode(), hashlib.sha256).digest())
+
+
+def issue_token(cpf, role, company_id=None, companies=None):
+    """Gera um token para o usuário (companies: ids das empresas de um chefe). Retorna (token, expiração)"""
+    expires_at = int(time.time()) + TOKEN_TTL
+    claims = {
+        'sub': cpf,
+        'role': role,
+        'cid': str(company_id) if company_id is not None else None,
+        'exp': expires_at,
+        'jti': secrets.token_urlsafe(9),
+    }
+    if role == 'chefe':
+        claims['cids'] = sorted(int(cid) for cid in (companies or ()))
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f"{TOKEN_VERSION}.{payload}.{_sign(payload)}", expires_at
+
+
+def verify_token(token):
+    """Retorna os dados do token se a assinatura for válida e ele não tiver expirado nem sido revogado"""
+    if not token:
+        return None
+    parts = token.split('.')
+    if len(parts) != 3 or parts[0] != TOKEN_VERSION:
+        return None
+    if not hmac.compare_digest(_sign(parts[1]), parts[2]):
+        return None
+    try:
+        claims = json.loads(_b64decode(parts[1]))
+    except ValueError:
+        return None
+    if claims.get('exp', 0) < time.time() or is_revoked(claims.get('jti', '')):
+        return None
+    return claims
+
+
+def is_revoked(jti):
+    return revocations.is_revoked(jti)
+
+
+def revoke(claims):
+    """Revoga o token (logout) até a sua expiração"""
+    revocations.revoke(claims['jti'], claims['exp'])
+
+
+def can_access_company(claims, company_id):
+    """Chefes acessam apenas as empresas do token (cids); funcionários apenas a sua (cid)"""
+    if claims.get('role') == 'chefe':
+        try:
+            return int(company_id) in claims.get('cids', ())
+        except (ValueError, TypeError):
+            return False
+    try:
+        return int(claims.get('cid')) == int(company_id)
+    except (ValueError, TypeError):
+        return claims.get('cid') == str(company_id)
@@ -0,0 +1,28 @@
+"""
+Configuração comum dos testes (rodar a partir de back/: python -m pytest).
+
+Os módulos do backend ficam na pasta pai e são importados pelo nome, como em app.py.
+O hash de senhas roda no próprio processo e o cache usa o backend em memória, para que
+os testes não dependam de processos auxiliares nem de Redis.
+"""
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+os.environ.setdefault('CACHE_BACKEND', 'memory')
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'memory')
+os.environ.setdefault('SESSION_REVOCATION_BACKEND', 'memory')
+os.environ.setdefault('AUTH_TOKEN_SECRET', 'segredo-dos-testes')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+
+
+@pytest.fixture
+def count_queries():
+    """Consultas feitas durante o teste (SQL de cada uma), como em metrics.count_queries"""
+    with metrics.count_queries() as statements:
+        yield statements
@@ -0,0 +1,105 @@
+"""Cache de leituras: backend em memória, versão das entradas e versão guardada pelo processo"""
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = cache.MemoryBackend(max_items=10, ttl=60)
+    monkeypatch.setattr(cache, 'backend', backend)
+    return backend
+
+
+def test_lru_evicts_by_total_weight(backend):
+    backend.set('a', [1] * 4, 'g', weight=4)
+    backend.set('b', [2] * 4, 'g', weight=4)
+    backend.get('a')
+    backend.set('c', [3] * 4, 'g', weight=4)
+
+    assert backend.get('b') is cache.MISSING
+    assert backend.get('a') == [1] * 4
+    assert backend.evictions == 1
+    assert backend.info()['items'] == 8
+
+
+def test_entries_heavier_than_the_limit_are_not_stored(backend):
+    backend.set('grande', list(range(11)), 'g', weight=11)
+    assert backend.get('grande') is cache.MISSING
+
+
+def test_expired_entries_are_missing():
+    backend = cache.MemoryBackend(max_items=10, ttl=-1)
+    backend.set('a', 1, 'g')
+    assert backend.get('a') is cache.MISSING
+    assert backend.info()['entries'] == 0
+
+
+def test_invalidate_drops_only_the_group(backend):
+    backend.set('a', 1, 'produtos:1')
+    backend.set('b', 2, 'produtos:2')
+    backend.invalidate('produtos:1')
+    assert backend.get('a') is cache.MISSING
+    assert backend.get('b') == 2
+
+
+def test_get_or_load_checks_the_entry_version(backend):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return ['produto']
+
+    assert cache.get_or_load('produtos', '01', 'lista', loader, 3) == ['produto']
+    assert cache.get_or_load('produtos', 1, 'lista', loader, 3) == ['produto']
+    assert len(calls) == 1
+
+    # Versão guardada por um processo que ainda não viu a última escrita: a entrada serve
+    cache.get_or_load('produtos', 1, 'lista', loader, 2)
+    assert len(calls) == 1
+
+    # Escrita em outro processo: nova versão no banco, a entrada é recarregada no lugar
+    cache.get_or_load('produtos', 1, 'lista', loader, 4)
+    assert len(calls) == 2
+    assert backend.info()['entries'] == 1
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    monkeypatch.setattr(cache, '_versions', {})
+    monkeypatch.setattr(cache, 'CACHE_VERSION_TTL', 60)
+
+
+def test_current_version_is_reused_until_invalidate(backend, versions):
+    fetched = []
+
+    def fetch():
+        fetched.append(1)
+        return len(fetched)
+
+    assert cache.current_version('produtos', 1, fetch) == 1
+    assert cache.current_version('produtos', '01', fetch) == 1
+    assert len(fetched) == 1
+
+    cache.invalidate('produtos', 1)
+    assert cache.current_version('produtos', 1, fetch) == 2
+
+
+def test_current_version_ignores_errors_and_reads_racing_a_write(backend, versions):
+    assert cache.current_version('produtos', 1, lambda: None) is None
+
+    def fetch_during_write():
+        # Versão lida antes de uma escrita que invalida a empresa
+        cache.invalidate('produtos', 1)
+        return 5
+
+    assert cache.current_version('produtos', 1, fetch_during_write) == 5
+    assert cache.current_version('produtos', 1, lambda: 6) == 6
+
+
+def test_get_or_load_without_version_bypasses_cache(backend):
+    calls = []
+    for _ in range(2):
+        cache.get_or_load('produtos', 1, 'lista', lambda: calls.append(1) or [], None)
+    assert len(calls) == 2
+    assert backend.info()['entries'] == 0
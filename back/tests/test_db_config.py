@@ -0,0 +1,55 @@
+"""Criação do pool de conexões quando o banco está fora do ar (sem banco de verdade)"""
+import psycopg2
+import pytest
+
+import db_config
+
+
+class FakeConnection:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def failing_connect(monkeypatch):
+    """psycopg2.connect que abre `ok` conexões e depois falha; devolve as tentativas feitas"""
+    def connect(ok):
+        attempts = []
+
+        def fake_connect(**kwargs):
+            if len(attempts) >= ok:
+                attempts.append(None)
+                raise psycopg2.OperationalError("conexão recusada")
+            attempts.append(FakeConnection())
+            return attempts[-1]
+        monkeypatch.setattr(db_config.psycopg2, 'connect', fake_connect)
+        return attempts
+    return connect
+
+
+@pytest.fixture
+def no_pool(monkeypatch):
+    monkeypatch.setattr(db_config, 'POOL_ENABLED', True)
+    monkeypatch.setattr(db_config, 'connection_pool', None)
+    monkeypatch.setattr(db_config, '_next_init_attempt', 0.0)
+
+
+def test_pool_closes_opened_connections_when_minconn_fails(failing_connect):
+    attempts = failing_connect(ok=2)
+    with pytest.raises(psycopg2.OperationalError):
+        db_config.ConnectionPool(3, 5)
+    opened = attempts[:2]
+    assert all(conn.closed for conn in opened)
+
+
+def test_failed_init_waits_before_retrying(failing_connect, no_pool):
+    attempts = failing_connect(ok=0)
+    db_config.init_connection_pool()
+    for _ in range(5):
+        with pytest.raises(db_config.PoolUnavailableError):
+            db_config.get_connection()
+    # Só a primeira tentativa chega ao banco, e nenhuma conexão avulsa é aberta
+    assert len(attempts) == 1
+    assert db_config.connection_pool is None
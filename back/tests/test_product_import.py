@@ -0,0 +1,49 @@
+"""Parsers da importação em lote de produtos"""
+import io
+
+import product_import
+
+
+def parse(parser, text):
+    return list(parser(io.BytesIO(text.encode('utf-8'))))
+
+
+def test_csv_accepts_portuguese_headers_and_bom():
+    rows = parse(product_import.parse_csv, "\ufeffNome,quantidade,preco\nCaneta,3,1.50\n\nLápis,2\n")
+    assert rows == [
+        (2, {'name': 'Caneta', 'quantity': '3', 'value': '1.50'}),
+        (4, {'name': 'Lápis', 'quantity': '2', 'value': None}),
+    ]
+
+
+def test_csv_requires_name_column():
+    assert parse(product_import.parse_csv, "quantity,value\n1,2\n") == [
+        (1, "Cabeçalho CSV deve conter a coluna 'name' (ou 'nome')")
+    ]
+    assert parse(product_import.parse_csv, "") == []
+
+
+def test_ndjson_skips_blank_lines_and_reports_invalid_ones():
+    rows = parse(product_import.parse_ndjson, '{"name": "a"}\n\n[1]\n{quebrado\n')
+    assert rows[0] == (1, {'name': 'a'})
+    assert rows[1] == (3, "Produto deve ser um objeto")
+    assert rows[2][0] == 4 and rows[2][1].startswith("JSON inválido")
+
+
+def test_json_array_accepts_list_or_products_key():
+    assert parse(product_import.parse_json_array, '[{"name": "a"}, 5]') == [
+        (1, {'name': 'a'}),
+        (2, "Produto deve ser um objeto"),
+    ]
+    assert parse(product_import.parse_json_array, '{"products": [{"name": "b"}]}') == [(1, {'name': 'b'})]
+    assert parse(product_import.parse_json_array, '{"itens": []}') == [
+        (1, "O corpo deve ser uma lista de produtos")
+    ]
+    assert parse(product_import.parse_json_array, '[')[0][1].startswith("JSON inválido")
+
+
+def test_get_parser_by_content_type():
+    assert product_import.get_parser('text/CSV') is product_import.parse_csv
+    assert product_import.get_parser('application/x-ndjson') is product_import.parse_ndjson
+    assert product_import.get_parser('application/xml') is None
+    assert product_import.get_parser(None) is None
@@ -0,0 +1,235 @@
+"""
+Número de consultas das rotas mais usadas (metrics.assert_max_queries).
+
+Os testes de cima rodam sem banco: as rotas usam um banco falso cujo cursor registra cada
+consulta em metrics.record_query, como o TimedCursor de db_config. Os de baixo repetem as
+verificações no banco configurado em db_config com as migrações aplicadas e são ignorados
+quando ele não está acessível (veja "Testes" no README).
+"""
+import contextlib
+import random
+
+import psycopg2
+import pytest
+
+import app
+import cache
+import db_config
+import db_operations
+import metrics
+import passwords
+import rate_limit
+import schema_cache
+import session_tokens
+
+PASSWORD = 'Senha123!'
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self._rows = []
+
+    def execute(self, query, params=None):
+        text = str(query)
+        metrics.record_query(0.0, text)
+        self._rows = self.database.answer(text, params)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self):
+        return FakeCursor(self.database)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeDatabase:
+    """Responde apenas às consultas do login e da listagem de produtos"""
+
+    columns = {
+        'usuario': ['id', 'nome', 'cpf', 'senha', 'tipo_acesso', 'id_empresa'],
+        'produto': ['id', 'nome', 'quantidade', 'preco', 'id_empresa', 'versao', 'minimo'],
+        'empresa_chefe': ['id_empresa', 'chefe_cpf', 'nome', 'criado_em'],
+    }
+
+    def __init__(self):
+        self.users = {}
+        self.products = {}
+        self.versions = {}
+
+    def answer(self, text, params):
+        if 'information_schema.columns' in text:
+            return [(table, column) for table in params[0] for column in self.columns.get(table, [])]
+        if 'FROM usuario u' in text:
+            user = self.users.get(params['cpf'])
+            return [user] if user else []
+        if 'FROM versao_dados' in text:
+            namespace, company_key = params
+            return [(self.versions[(namespace, company_key)],)] if (namespace, company_key) in self.versions else []
+        if 'FROM produto' in text:
+            return list(self.products.get(params[0], []))
+        raise AssertionError(f"Consulta inesperada: {text}")
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+
+@pytest.fixture
+def fake_database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(db_operations, 'db_connection', database.connection)
+    monkeypatch.setattr(schema_cache, 'db_connection', database.connection)
+    monkeypatch.setattr(cache, 'backend', cache.MemoryBackend(1000, 60))
+    monkeypatch.setattr(cache, '_versions', {})
+    monkeypatch.setattr(rate_limit, 'backend', rate_limit.MemoryBackend())
+    # Como no servidor: o esquema é lido antes das requisições
+    schema_cache.invalidate()
+    schema_cache.warm_up(tuple(schema_cache.TRACKED_TABLES) + ('empresa_chefe',))
+    yield database
+    schema_cache.invalidate()
+
+
+def test_assert_max_queries_lists_statements():
+    with pytest.raises(AssertionError, match=r"2 consultas executadas \(máximo 1\)"):
+        with metrics.assert_max_queries(1):
+            metrics.record_query(0.0, 'SELECT 1')
+            metrics.record_query(0.0, 'SELECT 2')
+
+
+def test_count_queries_nested_blocks(count_queries):
+    with metrics.count_queries() as inner:
+        metrics.record_query(0.0, 'SELECT 1')
+    metrics.record_query(0.0, 'SELECT 2')
+    assert inner == ['SELECT 1']
+    assert count_queries == ['SELECT 1', 'SELECT 2']
+
+
+def test_login_uses_one_query_with_warm_schema(fake_database):
+    cpf = '12345678901'
+    fake_database.users[cpf] = (
+        1, 'Chefe', cpf, passwords.hash_password(PASSWORD), 'chefe', None, [{'id': 7, 'name': 'Empresa 7'}],
+    )
+    client = app.app.test_client()
+
+    with metrics.assert_max_queries(1):
+        response = client.post('/login', json={'cpf': cpf, 'password': PASSWORD})
+    assert response.status_code == 200
+    assert response.get_json()['user']['companies'] == [{'id': 7, 'name': 'Empresa 7'}]
+
+
+def test_product_listing_cache_hit_uses_one_query(fake_database):
+    fake_database.versions[(db_operations.PRODUCT_CACHE_NAMESPACE, '7')] = 3
+    fake_database.products[7] = [(1, 'Produto de teste', 5, 1.0, 7, 1, 0)]
+    token, _ = session_tokens.issue_token('12345678901', 'chefe', companies=[7])
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.app.test_client()
+
+    with metrics.count_queries() as first:
+        assert client.get('/products/7', headers=headers).status_code == 200
+    assert len(first) == 2
+
+    with metrics.assert_max_queries(1) as second:
+        response = client.get('/products/7', headers=headers)
+    assert response.status_code == 200
+    assert [p['name'] for p in response.get_json()['products']] == ['Produto de teste']
+    assert 'FROM produto' not in ''.join(second)
+
+
+def test_product_listing_cache_hit_skips_the_database_within_version_ttl(fake_database, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_VERSION_TTL', 60)
+    fake_database.versions[(db_operations.PRODUCT_CACHE_NAMESPACE, '7')] = 3
+    fake_database.products[7] = [(1, 'Produto de teste', 5, 1.0, 7, 1, 0)]
+    token, _ = session_tokens.issue_token('12345678901', 'chefe', companies=[7])
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.app.test_client()
+
+    assert client.get('/products/7', headers=headers).status_code == 200
+    with metrics.assert_max_queries(0):
+        assert client.get('/products/7', headers=headers).status_code == 200
+
+    # Escrita neste processo: a versão é relida e a lista recarregada
+    fake_database.versions[(db_operations.PRODUCT_CACHE_NAMESPACE, '7')] = 4
+    fake_database.products[7] = [(1, 'Produto alterado', 5, 1.0, 7, 2, 0)]
+    cache.invalidate(db_operations.PRODUCT_CACHE_NAMESPACE, 7)
+    with metrics.count_queries() as statements:
+        response = client.get('/products/7', headers=headers)
+    assert len(statements) == 2
+    assert [p['name'] for p in response.get_json()['products']] == ['Produto alterado']
+
+
+@pytest.fixture(scope='module')
+def database():
+    try:
+        psycopg2.connect(**db_config.DB_CONFIG, connect_timeout=2).close()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Banco de dados indisponível: {e}")
+    # Como no servidor: o esquema é lido antes das requisições
+    schema_cache.warm_up()
+    yield
+    db_config.close_connection_pool()
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    monkeypatch.setattr(rate_limit, 'backend', rate_limit.MemoryBackend())
+    return app.app.test_client()
+
+
+@pytest.fixture
+def chefe(database):
+    cpf = '9' + ''.join(random.choices('0123456789', k=10))
+    assert db_operations.create_user(cpf, passwords.hash_password(PASSWORD), 'Teste de consultas')
+    yield cpf
+    with db_config.db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM usuario WHERE cpf = %s", (cpf,))
+        conn.commit()
+        cur.close()
+
+
+@pytest.fixture
+def company(database):
+    company_id = random.randint(900000, 999999)
+    product = db_operations.create_product(company_id, 'Produto de teste', 5, 1.0)
+    assert product is not None
+    yield company_id
+    db_operations.delete_product(company_id, product['id'])
+
+
+def test_login_uses_at_most_two_queries_in_database(client, chefe):
+    with metrics.assert_max_queries(2):
+        response = client.post('/login', json={'cpf': chefe, 'password': PASSWORD})
+    assert response.status_code == 200
+
+
+def test_product_listing_cache_hit_uses_one_query_in_database(client, company):
+    token, _ = session_tokens.issue_token('00000000000', 'chefe', companies=[company])
+    headers = {'Authorization': f'Bearer {token}'}
+
+    # Primeira leitura guarda a lista no cache
+    assert client.get(f'/products/{company}', headers=headers).status_code == 200
+
+    # Segunda: no máximo a versão dos dados (ETag e cache), se o processo não a tiver guardada
+    with metrics.assert_max_queries(1):
+        response = client.get(f'/products/{company}', headers=headers)
+    assert response.status_code == 200
+    assert [p['name'] for p in response.get_json()['products']] == ['Produto de teste']
@@ -0,0 +1,46 @@
+"""Limitador de tentativas de login (backend em memória)"""
+import pytest
+
+import rate_limit
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = rate_limit.MemoryBackend()
+    monkeypatch.setattr(rate_limit, 'backend', backend)
+    return backend
+
+
+def test_blocks_after_limit_and_reports_retry_after(backend):
+    for _ in range(3):
+        assert backend.hit('cpf:1', 3, 60) is None
+
+    retry_after = backend.hit('cpf:1', 3, 60)
+    assert retry_after is not None and 1 <= retry_after <= 60
+    # Outras chaves não são afetadas
+    assert backend.hit('cpf:2', 3, 60) is None
+
+
+def test_reset_clears_attempts(backend):
+    for _ in range(3):
+        backend.hit('cpf:1', 3, 60)
+    backend.reset('cpf:1', 60)
+    assert backend.hit('cpf:1', 3, 60) is None
+
+
+def test_retry_after_is_at_least_one_second():
+    assert rate_limit._retry_after(0, 5, 5, 60, 119.9, 60) == 1
+
+
+def test_check_login_limits_cpf_and_ip(backend, monkeypatch):
+    monkeypatch.setattr(rate_limit, 'LOGIN_LIMITS', {'cpf': (2, 300), 'ip': (3, 60)})
+
+    assert rate_limit.check_login('111', '10.0.0.1') is None
+    assert rate_limit.check_login('111', '10.0.0.1') is None
+    # Terceira tentativa do mesmo CPF
+    assert rate_limit.check_login('111', '10.0.0.1') is not None
+    # Outro CPF do mesmo IP: o IP já registrou 3 tentativas
+    assert rate_limit.check_login('222', '10.0.0.1') is not None
+
+    rate_limit.reset_login('111')
+    assert rate_limit.check_login('111', '10.0.0.2') is None
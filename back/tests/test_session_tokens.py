@@ -0,0 +1,72 @@
+"""Tokens de sessão: assinatura, expiração, revogação e acesso por empresa"""
+import pytest
+
+import session_tokens
+
+
+@pytest.fixture(autouse=True)
+def fresh_revocations(monkeypatch):
+    monkeypatch.setattr(session_tokens, 'revocations', session_tokens.MemoryRevocations())
+
+
+def test_issue_and_verify_round_trip():
+    token, expires_at = session_tokens.issue_token('52998224725', 'funcionario', 3)
+    claims = session_tokens.verify_token(token)
+    assert claims['sub'] == '52998224725'
+    assert claims['role'] == 'funcionario'
+    assert claims['cid'] == '3'
+    assert claims['exp'] == expires_at
+    assert 'cids' not in claims
+
+
+def test_chefe_token_carries_owned_companies():
+    token, _ = session_tokens.issue_token('52998224725', 'chefe', companies=[5, '2'])
+    assert session_tokens.verify_token(token)['cids'] == [2, 5]
+
+
+def test_rejects_tampered_or_malformed_tokens():
+    token, _ = session_tokens.issue_token('1', 'chefe')
+    version, payload, signature = token.split('.')
+    other, _ = session_tokens.issue_token('2', 'chefe')
+
+    assert session_tokens.verify_token(f"{version}.{other.split('.')[1]}.{signature}") is None
+    assert session_tokens.verify_token(f"v0.{payload}.{signature}") is None
+    assert session_tokens.verify_token('abc') is None
+    assert session_tokens.verify_token(None) is None
+
+
+def test_rejects_expired_tokens(monkeypatch):
+    monkeypatch.setattr(session_tokens, 'TOKEN_TTL', -1)
+    token, _ = session_tokens.issue_token('1', 'chefe')
+    assert session_tokens.verify_token(token) is None
+
+
+def test_revoke_only_affects_that_token():
+    first, _ = session_tokens.issue_token('1', 'chefe')
+    second, _ = session_tokens.issue_token('1', 'chefe')
+
+    session_tokens.revoke(session_tokens.verify_token(first))
+
+    assert session_tokens.verify_token(first) is None
+    assert session_tokens.verify_token(second) is not None
+
+
+def test_memory_revocations_purge_expired_entries():
+    revocations = session_tokens.MemoryRevocations()
+    revocations.revoke('antigo', 0)
+    revocations.revoke('novo', 2 ** 40)
+    assert not revocations.is_revoked('antigo')
+    assert revocations.is_revoked('novo')
+
+
+def test_can_access_company():
+    chefe = {'role': 'chefe', 'cids': [1, 4]}
+    assert session_tokens.can_access_company(chefe, '4')
+    assert not session_tokens.can_access_company(chefe, '2')
+    assert not session_tokens.can_access_company(chefe, 'x')
+    # Tokens de chefe sem a lista de empresas não acessam nenhuma
+    assert not session_tokens.can_access_company({'role': 'chefe'}, 1)
+
+    funcionario = {'role': 'funcionario', 'cid': '3'}
+    assert session_tokens.can_access_company(funcionario, '03')
+    assert not session_tokens.can_access_company(funcionario, 4)
@@ -0,0 +1,122 @@
+"""Validação dos parâmetros e corpos das rotas (funções parse_* e validate_* de app.py)"""
+import datetime
+
+import app
+
+
+def test_validate_product_data():
+    assert app.validate_product_data({'name': ' Caneta ', 'quantity': '3', 'value': '1.5'}) == (('Caneta', 3, 1.5), None)
+    assert app.validate_product_data({'name': ''})[0] is None
+    assert app.validate_product_data({'name': 'x' * 101})[0] is None
+    assert app.validate_product_data({'name': 'a', 'quantity': -1})[0] is None
+    assert app.validate_product_data({'name': 'a', 'value': 'caro'})[0] is None
+
+
+def test_parse_page_args_defaults():
+    page, error = app.parse_page_args({})
+    assert error is None
+    assert page == {"limit": app.PRODUCTS_PAGE_DEFAULT, "sort": "id", "order": "asc", "after": None}
+
+
+def test_parse_page_args_limit_bounds():
+    assert app.parse_page_args({'limit': '0'})[0] is None
+    assert app.parse_page_args({'limit': str(app.PRODUCTS_PAGE_MAX + 1)})[0] is None
+    assert app.parse_page_args({'limit': 'dez'}) == (None, "limit deve ser um número inteiro")
+
+
+def test_parse_page_args_after_id_requires_id_sort():
+    page, error = app.parse_page_args({'after_id': '10'})
+    assert error is None and page['after'] == (None, 10)
+
+    page, error = app.parse_page_args({'after_id': '10', 'sort': 'name'})
+    assert page is None and 'after_id' in error
+
+
+def test_parse_page_args_cursor_keeps_its_ordering():
+    cursor = app.encode_cursor({"sort": "value", "order": "desc", "value": 9.5, "id": 3})
+    page, error = app.parse_page_args({'cursor': cursor, 'sort': 'id'})
+    assert error is None
+    assert (page['sort'], page['order'], page['after']) == ('value', 'desc', (9.5, 3))
+
+    assert app.parse_page_args({'cursor': 'lixo'}) == (None, "cursor inválido")
+
+
+def test_parse_page_args_rejects_unknown_sort_and_order():
+    assert app.parse_page_args({'sort': 'preco'})[0] is None
+    assert app.parse_page_args({'order': 'cima'}) == (None, "order deve ser asc ou desc")
+
+
+def test_parse_company_name():
+    assert app.parse_company_name({'name': '  Loja  '}) == ('Loja', None)
+    assert app.parse_company_name({'name': '   '})[0] is None
+    assert app.parse_company_name({'name': 'x' * (app.COMPANY_NAME_MAX_LENGTH + 1)})[0] is None
+
+
+def test_parse_history_args():
+    params, error = app.parse_history_args({'since': '2024-01-31T08:00:00', 'limit': '5'})
+    assert error is None
+    assert params['since'] == datetime.datetime(2024, 1, 31, 8, 0)
+    assert params['limit'] == 5 and params['before'] is None
+
+    assert app.parse_history_args({'since': 'ontem'})[0] is None
+    cursor = app.encode_cursor({"id": 4})
+    assert app.parse_history_args({'cursor': cursor}) == (None, "cursor inválido")
+
+
+def test_parse_expected_version_from_if_match_and_body():
+    with app.app.test_request_context(headers={'If-Match': '"v7"'}):
+        assert app.parse_expected_version({'version': 3}) == (7, None)
+    with app.app.test_request_context(headers={'If-Match': '*'}):
+        assert app.parse_expected_version({}) == (None, None)
+    with app.app.test_request_context(headers={'If-Match': '"abc"'}):
+        assert app.parse_expected_version({})[0] is None
+    with app.app.test_request_context():
+        assert app.parse_expected_version({'version': 3}) == (3, None)
+        assert app.parse_expected_version({}) == (None, None)
+        assert app.parse_expected_version({'version': '3'})[0] is None
+
+
+def test_parse_adjustments_valid_batch():
+    parsed, error = app.parse_adjustments({
+        'adjustments': [
+            {'product_id': '1', 'delta': -2},
+            {'product_id': 2, 'absolute': 0},
+        ],
+        'reason': '  inventário  ',
+    })
+    assert error is None
+    assert parsed == {
+        "items": [(1, -2, None), (2, None, 0)],
+        "mode": app.ADJUSTMENTS_DEFAULT_MODE,
+        "reason": 'inventário',
+    }
+
+
+def test_parse_adjustments_errors():
+    assert app.parse_adjustments({})[0] is None
+    assert app.parse_adjustments({'adjustments': [{'product_id': 1, 'delta': 1}], 'mode': 'x'})[0] is None
+
+    both = {'adjustments': [{'product_id': 1, 'delta': 1, 'absolute': 2}]}
+    assert 'apenas um' in app.parse_adjustments(both)[1]
+
+    repeated = {'adjustments': [{'product_id': 1, 'delta': 1}, {'product_id': 1, 'delta': 2}]}
+    assert 'repetido' in app.parse_adjustments(repeated)[1]
+
+    negative = {'adjustments': [{'product_id': 1, 'absolute': -1}]}
+    assert app.parse_adjustments(negative)[0] is None
+
+    not_int = {'adjustments': [{'product_id': 1, 'delta': True}]}
+    assert app.parse_adjustments(not_int)[0] is None
+
+
+def test_parse_minimum():
+    assert app.parse_minimum({}) == (None, None)
+    assert app.parse_minimum({'minimum': '4'}) == (4, None)
+    assert app.parse_minimum({'minimum': -1})[0] is None
+    assert app.parse_minimum({'minimum': 'muito'})[0] is None
+
+
+def test_parse_last_event_id():
+    assert app.parse_last_event_id('12') == 12
+    assert app.parse_last_event_id('-1') is None
+    assert app.parse_last_event_id(None) is None
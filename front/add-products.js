@@ -179,7 +179,7 @@ async function handleAddProduct(e) {
     addBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Adicionando...';
     
     try {
-        const response = await fetch(`http://localhost:5000/products/${currentCompanyId}`, {
+        const response = await authFetch(`http://localhost:5000/products/${currentCompanyId}`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -230,9 +230,35 @@ function goBack() {
     }
 }
 
+// Requisições autenticadas com o token de sessão emitido no login
+function authHeaders(headers = {}) {
+    const token = localStorage.getItem('token');
+    return token ? { ...headers, 'Authorization': `Bearer ${token}` } : headers;
+}
+
+async function authFetch(url, options = {}) {
+    const response = await fetch(url, { ...options, headers: authHeaders(options.headers) });
+    if (response.status === 401) {
+        // Sessão expirada ou encerrada: voltar para o login
+        localStorage.removeItem('user');
+        localStorage.removeItem('token');
+        window.location.href = 'index.html';
+    }
+    return response;
+}
+
 // Logout
 function logout() {
     if (confirm('Tem certeza que deseja sair?')) {
+        const token = localStorage.getItem('token');
+        if (token) {
+            fetch('http://localhost:5000/logout', {
+                method: 'POST',
+                headers: { 'Authorization': `Bearer ${token}` },
+                keepalive: true
+            }).catch(() => {});
+        }
+        localStorage.removeItem('token');
         localStorage.removeItem('user');
         localStorage.removeItem('selectedCompany');
         localStorage.removeItem('selectedCompanyIndex');
@@ -26,6 +26,15 @@ function goBack() {
 // Logout
 function logout() {
     if (confirm('Tem certeza que deseja sair?')) {
+        const token = localStorage.getItem('token');
+        if (token) {
+            fetch('http://localhost:5000/logout', {
+                method: 'POST',
+                headers: { 'Authorization': `Bearer ${token}` },
+                keepalive: true
+            }).catch(() => {});
+        }
+        localStorage.removeItem('token');
         localStorage.removeItem('user');
         localStorage.removeItem('selectedCompany');
         localStorage.removeItem('selectedCompanyIndex');
@@ -15,30 +15,26 @@ document.addEventListener('DOMContentLoaded', function() {
         return;
     }
 
-    // Carregar empresas do localStorage
+    // Carregar empresas do chefe (vêm do servidor no login)
     loadCompanies();
 });
 
 let companies = [];
 let editingCompanyIndex = -1;
 
-// Carregar empresas do localStorage
+// Carregar empresas do usuário logado
 function loadCompanies() {
-    const savedCompanies = localStorage.getItem('companies');
-    if (savedCompanies) {
-        companies = JSON.parse(savedCompanies);
-    } else {
-        // Empresa padrão
-        companies = [
-            { name: 'Empresa 1', id: 1 }
-        ];
-        saveCompanies();
-    }
+    const userData = JSON.parse(localStorage.getItem('user'));
+    companies = userData.companies || [];
+    saveCompanies();
     renderCompanies();
 }
 
-// Salvar empresas no localStorage
+// Salvar empresas no localStorage (junto com o usuário, para as demais telas)
 function saveCompanies() {
+    const userData = JSON.parse(localStorage.getItem('user'));
+    userData.companies = companies;
+    localStorage.setItem('user', JSON.stringify(userData));
     localStorage.setItem('companies', JSON.stringify(companies));
 }
 
@@ -69,21 +65,35 @@ function renderCompanies() {
     }
 }
 
-// Adicionar nova empresa
-function addCompany() {
+// Adicionar nova empresa (registrada no servidor, que devolve um token com acesso a ela)
+async function addCompany() {
     if (companies.length >= 3) {
         alert('Máximo de 3 empresas permitidas');
         return;
     }
     
-    const newCompany = {
-        name: `Empresa ${companies.length + 1}`,
-        id: companies.length + 1
-    };
-    
-    companies.push(newCompany);
-    saveCompanies();
-    renderCompanies();
+    try {
+        const response = await fetch('http://localhost:5000/companies', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${localStorage.getItem('token')}`
+            },
+            body: JSON.stringify({ name: `Empresa ${companies.length + 1}` })
+        });
+        const result = await response.json();
+        if (!response.ok) {
+            alert(result.message || 'Erro ao criar empresa');
+            return;
+        }
+        
+        localStorage.setItem('token', result.token);
+        companies.push(result.company);
+        saveCompanies();
+        renderCompanies();
+    } catch (error) {
+        alert('Erro de conexão com o servidor');
+    }
 }
 
 // Editar empresa
@@ -120,10 +130,33 @@ function saveCompanyName() {
     }
     
     if (editingCompanyIndex >= 0) {
-        companies[editingCompanyIndex].name = newName;
+        renameCompany(editingCompanyIndex, newName);
+    }
+}
+
+// Renomear empresa no servidor
+async function renameCompany(index, newName) {
+    try {
+        const response = await fetch(`http://localhost:5000/companies/${companies[index].id}`, {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${localStorage.getItem('token')}`
+            },
+            body: JSON.stringify({ name: newName })
+        });
+        const result = await response.json();
+        if (!response.ok) {
+            alert(result.message || 'Erro ao renomear empresa');
+            return;
+        }
+        
+        companies[index].name = result.name;
         saveCompanies();
         renderCompanies();
         closeModal();
+    } catch (error) {
+        alert('Erro de conexão com o servidor');
     }
 }
 
@@ -174,6 +207,15 @@ function openCompanyManagement(companyIndex) {
 // Logout
 function logout() {
     if (confirm('Tem certeza que deseja sair?')) {
+        const token = localStorage.getItem('token');
+        if (token) {
+            fetch('http://localhost:5000/logout', {
+                method: 'POST',
+                headers: { 'Authorization': `Bearer ${token}` },
+                keepalive: true
+            }).catch(() => {});
+        }
+        localStorage.removeItem('token');
         localStorage.removeItem('user');
         window.location.href = 'index.html';
     }
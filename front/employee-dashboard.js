@@ -71,6 +71,15 @@ function openAddProducts() {
 // Logout
 function logout() {
     if (confirm('Tem certeza que deseja sair?')) {
+        const token = localStorage.getItem('token');
+        if (token) {
+            fetch('http://localhost:5000/logout', {
+                method: 'POST',
+                headers: { 'Authorization': `Bearer ${token}` },
+                keepalive: true
+            }).catch(() => {});
+        }
+        localStorage.removeItem('token');
         localStorage.removeItem('user');
         window.location.href = 'index.html';
     }
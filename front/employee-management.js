@@ -151,7 +151,7 @@ async function handleCreateEmployee(e) {
     createBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Cadastrando...';
     
     try {
-        const response = await fetch(`http://localhost:5000/employees/${currentCompanyId}`, {
+        const response = await authFetch(`http://localhost:5000/employees/${currentCompanyId}`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -209,7 +209,7 @@ async function handleDeleteEmployee(e) {
     deleteBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Excluindo...';
     
     try {
-        const response = await fetch(`http://localhost:5000/employees/${currentCompanyId}/${cpfNumbers}`, {
+        const response = await authFetch(`http://localhost:5000/employees/${currentCompanyId}/${cpfNumbers}`, {
             method: 'DELETE'
         });
         
@@ -244,7 +244,7 @@ async function loadEmployees() {
     employeesList.innerHTML = '<div class="loading" id="loadingList"><i class="fas fa-spinner fa-spin"></i> Carregando funcionários...</div>';
     
     try {
-        const response = await fetch(`http://localhost:5000/employees/${currentCompanyId}`);
+        const response = await authFetch(`http://localhost:5000/employees/${currentCompanyId}`);
         const result = await response.json();
         
         if (response.ok) {
@@ -312,9 +312,35 @@ function goBack() {
     window.location.href = 'company-management.html';
 }
 
+// Requisições autenticadas com o token de sessão emitido no login
+function authHeaders(headers = {}) {
+    const token = localStorage.getItem('token');
+    return token ? { ...headers, 'Authorization': `Bearer ${token}` } : headers;
+}
+
+async function authFetch(url, options = {}) {
+    const response = await fetch(url, { ...options, headers: authHeaders(options.headers) });
+    if (response.status === 401) {
+        // Sessão expirada ou encerrada: voltar para o login
+        localStorage.removeItem('user');
+        localStorage.removeItem('token');
+        window.location.href = 'index.html';
+    }
+    return response;
+}
+
 // Logout
 function logout() {
     if (confirm('Tem certeza que deseja sair?')) {
+        const token = localStorage.getItem('token');
+        if (token) {
+            fetch('http://localhost:5000/logout', {
+                method: 'POST',
+                headers: { 'Authorization': `Bearer ${token}` },
+                keepalive: true
+            }).catch(() => {});
+        }
+        localStorage.removeItem('token');
         localStorage.removeItem('user');
         localStorage.removeItem('selectedCompany');
         localStorage.removeItem('selectedCompanyIndex');
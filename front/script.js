@@ -123,6 +123,7 @@ document.addEventListener('DOMContentLoaded', function() {
             if (response.ok) {
                 // Salvar dados do usuário no localStorage
                 localStorage.setItem('user', JSON.stringify(result.user));
+                localStorage.setItem('token', result.token);
                 
                 // Verificar tipo de usuário e redirecionar
                 if (result.user.user_type === 'chefe') {
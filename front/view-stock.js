@@ -3,6 +3,19 @@ let currentCompanyId = null;
 let allProducts = [];
 let filteredProducts = [];
 
+// Paginação (os produtos são carregados do servidor em páginas, sob demanda)
+const PAGE_SIZE = 50;
+let nextCursor = null;
+let loadingPage = false;
+let currentSort = 'id:asc';
+let pageObserver = null;
+
+// Busca no servidor (com atraso para não disparar uma requisição por tecla)
+const SEARCH_DELAY = 300;
+let searchTimer = null;
+let searchOffset = null;
+let searchRequestId = 0;
+
 // Verificar se o usuário está logado e se há empresa selecionada
 document.addEventListener('DOMContentLoaded', async function() {
     const user = localStorage.getItem('user');
@@ -70,6 +83,9 @@ document.addEventListener('DOMContentLoaded', async function() {
     // Configurar formulários
     setupForms();
     
+    // Carregar próxima página quando o fim da lista ficar visível
+    setupInfiniteScroll();
+    
     // Carregar produtos automaticamente
     console.log('Carregando produtos para empresa ID:', currentCompanyId);
     loadProducts();
@@ -87,7 +103,20 @@ function setupForms() {
     }
 }
 
-// Carregar lista de produtos
+// Montar URL de uma página de produtos
+function buildPageUrl(cursor) {
+    const [sort, order] = currentSort.split(':');
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    if (cursor) {
+        params.set('cursor', cursor);
+    } else {
+        params.set('sort', sort);
+        params.set('order', order);
+    }
+    return `http://localhost:5000/products/${currentCompanyId}?${params.toString()}`;
+}
+
+// Carregar lista de produtos (primeira página)
 async function loadProducts() {
     const productsList = document.getElementById('productsList');
     
@@ -97,31 +126,146 @@ async function loadProducts() {
     // Mostrar loading
     productsList.innerHTML = '<div class="loading" id="loadingList"><i class="fas fa-spinner fa-spin"></i> Carregando produtos...</div>';
     
+    allProducts = [];
+    filteredProducts = [];
+    nextCursor = null;
+    
+    // Totais vêm de um endpoint próprio, carregado em paralelo com a primeira página
+    updateStats();
+    
+    const loaded = await fetchProductsPage(null);
+    if (loaded) {
+        filteredProducts = [...allProducts];
+        if (isSearching()) {
+            // Mantém a busca ativa após recarregar (ex.: depois de editar um produto)
+            runSearch(document.getElementById('searchInput').value.trim(), 0);
+        } else {
+            displayProducts(filteredProducts);
+        }
+    }
+}
+
+// Carregar a próxima página e acrescentá-la à lista
+async function loadMoreProducts() {
+    if (isSearching()) {
+        if (searchOffset !== null && !loadingPage) {
+            runSearch(document.getElementById('searchInput').value.trim(), searchOffset);
+        }
+        return;
+    }
+    if (!nextCursor || loadingPage) {
+        return;
+    }
+    
+    const previousCount = allProducts.length;
+    const loaded = await fetchProductsPage(nextCursor);
+    if (loaded) {
+        const newProducts = allProducts.slice(previousCount);
+        filteredProducts = [...allProducts];
+        appendProducts(newProducts);
+    }
+}
+
+// Buscar uma página no servidor; retorna true se carregou
+async function fetchProductsPage(cursor) {
+    const productsList = document.getElementById('productsList');
+    loadingPage = true;
+    updateLoadMore();
+    
     try {
-        const url = `http://localhost:5000/products/${currentCompanyId}`;
+        const url = buildPageUrl(cursor);
         console.log('🌐 Fazendo requisição para:', url);
         
-        const response = await fetch(url);
+        const response = await authFetch(url);
         const result = await response.json();
         
         console.log('📡 Resposta do servidor:', response.status, result);
         
         if (response.ok) {
-            allProducts = result.products;
-            filteredProducts = [...allProducts];
+            allProducts = allProducts.concat(result.products);
+            nextCursor = result.next_cursor;
             console.log('✅ Produtos carregados:', allProducts.length);
-            displayProducts(filteredProducts);
-            updateStats();
+            return true;
         } else {
             console.log('❌ Erro ao carregar produtos:', result.message);
             productsList.innerHTML = '<div class="empty-list"><i class="fas fa-exclamation-triangle"></i><h3>Erro ao carregar produtos</h3><p>' + result.message + '</p></div>';
+            return false;
         }
     } catch (error) {
         console.error('Erro:', error);
         productsList.innerHTML = '<div class="empty-list"><i class="fas fa-exclamation-triangle"></i><h3>Erro de conexão</h3><p>Verifique se o servidor Python está rodando.</p></div>';
+        return false;
+    } finally {
+        loadingPage = false;
+        updateLoadMore();
     }
 }
 
+// Observar o fim da lista para carregar a próxima página automaticamente
+function setupInfiniteScroll() {
+    const sentinel = document.getElementById('loadMoreSentinel');
+    if (!sentinel || !('IntersectionObserver' in window)) {
+        return;
+    }
+    pageObserver = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMoreProducts();
+        }
+    }, { rootMargin: '200px' });
+    pageObserver.observe(sentinel);
+}
+
+// Mostrar/ocultar o botão "Carregar mais"
+function updateLoadMore() {
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
+    if (!loadMoreBtn) return;
+    
+    const hasMore = isSearching() ? searchOffset !== null : nextCursor !== null;
+    loadMoreBtn.style.display = hasMore ? 'flex' : 'none';
+    loadMoreBtn.disabled = loadingPage;
+    loadMoreBtn.innerHTML = loadingPage
+        ? '<i class="fas fa-spinner fa-spin"></i> Carregando...'
+        : '<i class="fas fa-chevron-down"></i> Carregar mais';
+}
+
+// Alterar ordenação (recarrega a partir da primeira página)
+function changeSort() {
+    currentSort = document.getElementById('sortSelect').value;
+    loadProducts();
+}
+
+// Indica se há uma busca ativa
+function isSearching() {
+    const searchInput = document.getElementById('searchInput');
+    return searchInput && searchInput.value.trim() !== '';
+}
+
+// HTML de um produto da lista
+function renderProductItem(product) {
+    const formattedValue = new Intl.NumberFormat('pt-BR', {
+        style: 'currency',
+        currency: 'BRL'
+    }).format(product.value);
+    
+    return `
+        <div class="product-item${product.low_stock ? ' low-stock' : ''}">
+            <div class="product-info">
+                <div class="product-name">${product.name}</div>
+                <div class="product-quantity">Qtd: ${product.quantity} (mín. ${product.minimum})</div>
+                <div class="product-value">${formattedValue}</div>
+                <div class="product-actions">
+                    <button class="edit-btn" onclick="editProduct('${product.id}')">
+                        <i class="fas fa-edit"></i> Editar
+                    </button>
+                    <button class="delete-btn" onclick="confirmDeleteProduct('${product.id}', '${product.name}')">
+                        <i class="fas fa-trash"></i> Excluir
+                    </button>
+                </div>
+            </div>
+        </div>
+    `;
+}
+
 // Exibir produtos
 function displayProducts(products) {
     console.log('🎨 Exibindo produtos:', products.length);
@@ -141,93 +285,134 @@ function displayProducts(products) {
         return;
     }
     
-    let html = '';
-    products.forEach(product => {
-        const formattedValue = new Intl.NumberFormat('pt-BR', {
-            style: 'currency',
-            currency: 'BRL'
-        }).format(product.value);
-        
-        html += `
-            <div class="product-item">
-                <div class="product-info">
-                    <div class="product-name">${product.name}</div>
-                    <div class="product-quantity">Qtd: ${product.quantity}</div>
-                    <div class="product-value">${formattedValue}</div>
-                    <div class="product-actions">
-                        <button class="edit-btn" onclick="editProduct('${product.id}')">
-                            <i class="fas fa-edit"></i> Editar
-                        </button>
-                        <button class="delete-btn" onclick="confirmDeleteProduct('${product.id}', '${product.name}')">
-                            <i class="fas fa-trash"></i> Excluir
-                        </button>
-                    </div>
-                </div>
-            </div>
-        `;
-    });
-    
-    productsList.innerHTML = html;
+    productsList.innerHTML = products.map(renderProductItem).join('');
     console.log('✅ Produtos exibidos na tela');
 }
 
-// Atualizar estatísticas
-function updateStats() {
+// Acrescentar produtos ao fim da lista já exibida
+function appendProducts(products) {
+    const productsList = document.getElementById('productsList');
+    productsList.insertAdjacentHTML('beforeend', products.map(renderProductItem).join(''));
+}
+
+// Atualizar estatísticas (calculadas no servidor a partir do resumo da empresa)
+async function updateStats() {
     console.log('📊 Atualizando estatísticas...');
-    const totalProducts = allProducts.length;
-    const totalQuantity = allProducts.reduce((sum, product) => sum + product.quantity, 0);
-    const totalValue = allProducts.reduce((sum, product) => sum + (product.value * product.quantity), 0);
     
-    console.log(`📈 Estatísticas: ${totalProducts} produtos, ${totalQuantity} quantidade, R$ ${totalValue.toFixed(2)}`);
-    
-    document.getElementById('totalProducts').textContent = totalProducts;
-    document.getElementById('totalQuantity').textContent = totalQuantity;
-    
-    console.log('✅ Estatísticas atualizadas na tela');
-    
-    const formattedTotalValue = new Intl.NumberFormat('pt-BR', {
-        style: 'currency',
-        currency: 'BRL'
-    }).format(totalValue);
-    
-    document.getElementById('totalValue').textContent = formattedTotalValue;
+    try {
+        const response = await authFetch(`http://localhost:5000/products/${currentCompanyId}/stats`);
+        const result = await response.json();
+        
+        if (!response.ok) {
+            console.log('❌ Erro ao carregar estatísticas:', result.message);
+            return;
+        }
+        
+        const stats = result.stats;
+        console.log(`📈 Estatísticas: ${stats.total_products} produtos, ${stats.total_quantity} quantidade, R$ ${stats.total_value.toFixed(2)}`);
+        
+        document.getElementById('totalProducts').textContent = stats.total_products;
+        document.getElementById('totalQuantity').textContent = stats.total_quantity;
+        document.getElementById('lowStock').textContent = stats.low_stock;
+        
+        const formattedTotalValue = new Intl.NumberFormat('pt-BR', {
+            style: 'currency',
+            currency: 'BRL'
+        }).format(stats.total_value);
+        
+        document.getElementById('totalValue').textContent = formattedTotalValue;
+        console.log('✅ Estatísticas atualizadas na tela');
+    } catch (error) {
+        console.error('Erro ao carregar estatísticas:', error);
+    }
 }
 
-// Buscar produtos
+// Buscar produtos (no servidor, após uma pausa na digitação)
 function searchProducts() {
-    const searchTerm = document.getElementById('searchInput').value.toLowerCase().trim();
+    const searchTerm = document.getElementById('searchInput').value.trim();
     const clearBtn = document.getElementById('clearSearchBtn');
     
+    clearTimeout(searchTimer);
+    
     if (searchTerm === '') {
-        filteredProducts = [...allProducts];
-        clearBtn.style.display = 'none';
-    } else {
-        filteredProducts = allProducts.filter(product => 
-            product.name.toLowerCase().includes(searchTerm)
-        );
-        clearBtn.style.display = 'flex';
+        clearSearch();
+        return;
     }
     
-    displayProducts(filteredProducts);
+    clearBtn.style.display = 'flex';
+    searchTimer = setTimeout(() => runSearch(searchTerm, 0), SEARCH_DELAY);
+}
+
+// Executar a busca a partir de `offset` (0 = nova busca)
+async function runSearch(searchTerm, offset) {
+    const productsList = document.getElementById('productsList');
+    const requestId = ++searchRequestId;
+    
+    const params = new URLSearchParams({ q: searchTerm, mode: 'substring', limit: PAGE_SIZE, offset: offset });
+    loadingPage = true;
+    updateLoadMore();
+    
+    try {
+        const response = await authFetch(`http://localhost:5000/products/${currentCompanyId}/search?${params.toString()}`);
+        const result = await response.json();
+        
+        // Ignorar respostas de buscas que já foram substituídas por outra
+        if (requestId !== searchRequestId) {
+            return;
+        }
+        
+        if (response.ok) {
+            searchOffset = result.next_offset;
+            if (offset === 0) {
+                filteredProducts = result.products;
+                displayProducts(filteredProducts);
+            } else {
+                filteredProducts = filteredProducts.concat(result.products);
+                appendProducts(result.products);
+            }
+        } else {
+            searchOffset = null;
+            productsList.innerHTML = '<div class="empty-list"><i class="fas fa-exclamation-triangle"></i><h3>Erro na busca</h3><p>' + result.message + '</p></div>';
+        }
+    } catch (error) {
+        console.error('Erro:', error);
+        searchOffset = null;
+        productsList.innerHTML = '<div class="empty-list"><i class="fas fa-exclamation-triangle"></i><h3>Erro de conexão</h3><p>Verifique se o servidor Python está rodando.</p></div>';
+    } finally {
+        if (requestId === searchRequestId) {
+            loadingPage = false;
+            updateLoadMore();
+        }
+    }
 }
 
 // Limpar busca
 function clearSearch() {
+    clearTimeout(searchTimer);
+    searchRequestId++;
+    searchOffset = null;
+    loadingPage = false;
     document.getElementById('searchInput').value = '';
     document.getElementById('clearSearchBtn').style.display = 'none';
     filteredProducts = [...allProducts];
     displayProducts(filteredProducts);
+    updateLoadMore();
 }
 
+// Versão do produto aberto no modal de edição (enviada no PUT para detectar edições simultâneas)
+let editingProductVersion = null;
+
 // Editar produto
 function editProduct(productId) {
-    const product = allProducts.find(p => p.id === productId);
+    const product = allProducts.find(p => p.id === productId) || filteredProducts.find(p => p.id === productId);
     if (!product) return;
     
+    editingProductVersion = product.version || null;
     document.getElementById('editProductId').value = productId;
     document.getElementById('editProductName').value = product.name;
     document.getElementById('editProductQuantity').value = product.quantity;
     document.getElementById('editProductValue').value = product.value;
+    document.getElementById('editProductMinimum').value = product.minimum;
     
     // Limpar erros
     clearEditErrors();
@@ -242,6 +427,7 @@ async function saveProduct() {
     const name = document.getElementById('editProductName').value.trim();
     const quantity = document.getElementById('editProductQuantity').value;
     const value = document.getElementById('editProductValue').value;
+    const minimum = document.getElementById('editProductMinimum').value;
     
     // Limpar erros
     clearEditErrors();
@@ -271,12 +457,19 @@ async function saveProduct() {
         hasErrors = true;
     }
     
+    // Validar estoque mínimo
+    const min = parseInt(minimum);
+    if (isNaN(min) || min < 0) {
+        showEditError('minimum', 'Estoque mínimo deve ser um número maior ou igual a zero');
+        hasErrors = true;
+    }
+    
     if (hasErrors) {
         return;
     }
     
     try {
-        const response = await fetch(`http://localhost:5000/products/${currentCompanyId}/${productId}`, {
+        const response = await authFetch(`http://localhost:5000/products/${currentCompanyId}/${productId}`, {
             method: 'PUT',
             headers: {
                 'Content-Type': 'application/json',
@@ -284,7 +477,9 @@ async function saveProduct() {
             body: JSON.stringify({
                 name: name,
                 quantity: qty,
-                value: val
+                value: val,
+                minimum: min,
+                version: editingProductVersion
             })
         });
         
@@ -294,6 +489,15 @@ async function saveProduct() {
             alert('Produto atualizado com sucesso!');
             closeEditModal();
             loadProducts();
+        } else if (response.status === 409 && result.product) {
+            // Outro usuário alterou o produto: mostrar os dados atuais para revisão
+            alert(result.message);
+            editingProductVersion = result.product.version;
+            document.getElementById('editProductName').value = result.product.name;
+            document.getElementById('editProductQuantity').value = result.product.quantity;
+            document.getElementById('editProductValue').value = result.product.value;
+            document.getElementById('editProductMinimum').value = result.product.minimum;
+            loadProducts();
         } else {
             alert('Erro: ' + result.message);
         }
@@ -312,7 +516,7 @@ async function deleteProduct() {
     }
     
     try {
-        const response = await fetch(`http://localhost:5000/products/${currentCompanyId}/${productId}`, {
+        const response = await authFetch(`http://localhost:5000/products/${currentCompanyId}/${productId}`, {
             method: 'DELETE'
         });
         
@@ -341,7 +545,7 @@ function confirmDeleteProduct(productId, productName) {
 // Excluir produto diretamente
 async function deleteProductDirect(productId) {
     try {
-        const response = await fetch(`http://localhost:5000/products/${currentCompanyId}/${productId}`, {
+        const response = await authFetch(`http://localhost:5000/products/${currentCompanyId}/${productId}`, {
             method: 'DELETE'
         });
         
@@ -367,7 +571,7 @@ function closeEditModal() {
 
 // Limpar erros de edição
 function clearEditErrors() {
-    const fields = ['name', 'quantity', 'value'];
+    const fields = ['name', 'quantity', 'value', 'minimum'];
     fields.forEach(field => {
         const errorElement = document.getElementById('edit' + field.charAt(0).toUpperCase() + field.slice(1) + 'Error');
         const inputElement = document.getElementById('editProduct' + field.charAt(0).toUpperCase() + field.slice(1));
@@ -401,9 +605,35 @@ function goBack() {
     }
 }
 
+// Requisições autenticadas com o token de sessão emitido no login
+function authHeaders(headers = {}) {
+    const token = localStorage.getItem('token');
+    return token ? { ...headers, 'Authorization': `Bearer ${token}` } : headers;
+}
+
+async function authFetch(url, options = {}) {
+    const response = await fetch(url, { ...options, headers: authHeaders(options.headers) });
+    if (response.status === 401) {
+        // Sessão expirada ou encerrada: voltar para o login
+        localStorage.removeItem('user');
+        localStorage.removeItem('token');
+        window.location.href = 'index.html';
+    }
+    return response;
+}
+
 // Logout
 function logout() {
     if (confirm('Tem certeza que deseja sair?')) {
+        const token = localStorage.getItem('token');
+        if (token) {
+            fetch('http://localhost:5000/logout', {
+                method: 'POST',
+                headers: { 'Authorization': `Bearer ${token}` },
+                keepalive: true
+            }).catch(() => {});
+        }
+        localStorage.removeItem('token');
         localStorage.removeItem('user');
         localStorage.removeItem('selectedCompany');
         localStorage.removeItem('selectedCompanyIndex');